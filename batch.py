@@ -0,0 +1,179 @@
+"""
+Batch mode for the analyze CLI.
+
+Analyzes a directory or glob of diagrams with a bounded number of graphs in flight,
+appending one JSON line per diagram to a manifest as soon as it finishes. Diagrams
+already recorded as completed (same path and image hash) are skipped, so a crashed
+overnight job can simply be restarted. arun_batch does the same with async graphs
+on one event loop instead of a thread per diagram.
+"""
+
+import asyncio
+import glob
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+
+from cache import CACHED_STATE_FIELDS
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+
+def discover_images(pattern: str) -> list[str]:
+    """Images in a directory, or matching a glob, in a stable order."""
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "*")
+    return sorted(path for path in glob.glob(pattern, recursive=True)
+                  if path.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(path))
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_completed(manifest_path: str) -> set[tuple[str, str]]:
+    """(image path, image hash) pairs the manifest records as completed."""
+    completed = set()
+    if not os.path.exists(manifest_path):
+        return completed
+    with open(manifest_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A crash can leave a truncated last line behind.
+                continue
+            if entry.get("status") == "completed":
+                completed.add((entry["image_path"], entry["image_sha256"]))
+    return completed
+
+
+def input_root(images: list[str]) -> str:
+    """Deepest directory holding every image of the batch."""
+    return os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in images]) if images else ""
+
+
+def summary_filename(output_dir: str, image_path: str, root: str = "") -> str:
+    """
+    Summary file of an image, named after its path below the batch root, extension included, so
+    a/diagram.png, b/diagram.png and a/diagram.jpg of a recursive batch do not overwrite each other.
+    """
+    relative = os.path.relpath(os.path.abspath(image_path), root) if root else os.path.basename(image_path)
+    return os.path.join(output_dir, f"{relative.replace(os.sep, '__')}.md")
+
+
+class BatchRecorder:
+    """Appends the outcome of each diagram to the manifest and writes its summary."""
+
+    def __init__(self, manifest_path: str, output_dir: str, is_complete, incomplete_reason, root: str = ""):
+        os.makedirs(output_dir, exist_ok=True)
+        if os.path.dirname(manifest_path):
+            os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        self.manifest_path = manifest_path
+        self.output_dir = output_dir
+        self.is_complete = is_complete
+        self.incomplete_reason = incomplete_reason
+        self.root = root
+        self.completed = load_completed(manifest_path)
+        self.counts = {"completed": 0, "skipped": 0, "failed": 0}
+        self._lock = threading.Lock()
+
+    def pending(self, images: list[str]) -> list[tuple[str, str]]:
+        """(image path, image hash) of the images not yet completed; the rest count as skipped."""
+        pending = []
+        for image_path in images:
+            image_sha256 = file_sha256(image_path)
+            if (image_path, image_sha256) in self.completed:
+                self.counts["skipped"] += 1
+                continue
+            pending.append((image_path, image_sha256))
+        return pending
+
+    def record(self, entry: dict):
+        with self._lock:
+            with open(self.manifest_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.counts[entry["status"]] += 1
+
+    def completed_entry(self, entry: dict, image_path: str, values: dict):
+        # Runs with failed reviews or a failed summary are recorded as failed, so a restart retries them.
+        if not self.is_complete(values):
+            raise ValueError(f"Incomplete analysis ({self.incomplete_reason(values)})")
+        summary = (values.get("summary") or "").strip(
+            '```markdown').strip('```')
+        filename = summary_filename(self.output_dir, image_path, self.root)
+        with open(filename, "w") as f:
+            f.write(summary)
+        entry.update({"status": "completed", "summary_path": filename})
+        entry.update({field: values.get(field)
+                     for field in CACHED_STATE_FIELDS})
+        click.secho(f"✅ {image_path}", fg="green")
+
+    @staticmethod
+    def failed_entry(entry: dict, image_path: str, e: Exception):
+        logger.error(f"Error analyzing {image_path}: {e}")
+        entry.update({"status": "failed", "error": str(e)})
+        click.secho(f"❌ {image_path}: {e}", fg="red")
+
+
+def run_batch(workflow, images: list[str], manifest_path: str, output_dir: str, jobs: int = 4,
+              use_cache: bool = True, refresh_cache: bool = False) -> dict[str, int]:
+    """Analyze images with at most `jobs` graphs in flight, streaming results to the manifest."""
+    recorder = BatchRecorder(manifest_path, output_dir, workflow.is_complete, workflow.incomplete_reason,
+                             input_root(images))
+
+    def analyze_one(image_path: str, image_sha256: str):
+        started = time.perf_counter()
+        entry = {"image_path": image_path, "image_sha256": image_sha256}
+        try:
+            values = workflow.run(workflow.encode_image(image_path),
+                                  use_cache=use_cache, refresh_cache=refresh_cache)
+            recorder.completed_entry(entry, image_path, values)
+        except Exception as e:
+            recorder.failed_entry(entry, image_path, e)
+        entry["duration_seconds"] = round(time.perf_counter() - started, 3)
+        recorder.record(entry)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for image_path, image_sha256 in recorder.pending(images):
+            executor.submit(analyze_one, image_path, image_sha256)
+    return recorder.counts
+
+
+async def arun_batch(workflow, images: list[str], manifest_path: str, output_dir: str, jobs: int = 4,
+                     use_cache: bool = True, refresh_cache: bool = False) -> dict[str, int]:
+    """run_batch() on the event loop: `jobs` async graphs in flight instead of `jobs` threads."""
+    recorder = BatchRecorder(manifest_path, output_dir, workflow.is_complete, workflow.incomplete_reason,
+                             input_root(images))
+    semaphore = asyncio.Semaphore(jobs)
+
+    async def analyze_one(image_path: str, image_sha256: str):
+        async with semaphore:
+            started = time.perf_counter()
+            entry = {"image_path": image_path, "image_sha256": image_sha256}
+            try:
+                values = await workflow.arun(workflow.encode_image(image_path),
+                                             use_cache=use_cache, refresh_cache=refresh_cache)
+                recorder.completed_entry(entry, image_path, values)
+            except Exception as e:
+                recorder.failed_entry(entry, image_path, e)
+            entry["duration_seconds"] = round(time.perf_counter() - started, 3)
+            recorder.record(entry)
+
+    await asyncio.gather(*(analyze_one(image_path, image_sha256)
+                           for image_path, image_sha256 in recorder.pending(images)))
+    return recorder.counts
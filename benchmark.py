@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Benchmark harness for the workflow and the data pipeline.
+
+Runs everything offline against FakeChatModel and a synthetic Well-Architected
+document, so results only reflect this code and can be compared across commits:
+
+- full graph runs at several diagram sizes (fake model latency included),
+- building the WAF recommendation index from CSV and looking services up in it,
+- datapipeline.extract_architecture_best_practices on a large synthetic document.
+
+Results are written as JSON tagged with the git commit; pass --compare with an
+earlier result file to print the median change of every benchmark.
+"""
+
+import base64
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from types import SimpleNamespace
+
+import click
+import pandas as pd
+
+from fake_llm import DEFAULT_SERVICES, FakeChatModel
+from recommendations import RecommendationIndex
+
+PILLARS = ("Reliability", "Security", "Cost Optimization", "Operational Excellence", "Performance Efficiency")
+
+
+def git_revision() -> dict:
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def timing_stats(samples: list[float]) -> dict:
+    ordered = sorted(samples)
+    return {
+        "runs": len(samples),
+        "min": ordered[0],
+        "median": statistics.median(ordered),
+        "mean": statistics.fmean(ordered),
+        "p95": ordered[min(len(ordered) - 1, round(0.95 * (len(ordered) - 1)))],
+        "max": ordered[-1],
+    }
+
+
+def time_call(func, repeats: int) -> tuple[dict, object]:
+    samples, result = [], None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = func()
+        samples.append(time.perf_counter() - started)
+    return timing_stats(samples), result
+
+
+def synthetic_paragraphs(paragraph_count: int, services: tuple[str, ...] = DEFAULT_SERVICES) -> list[dict]:
+    """Document Intelligence style paragraphs: one titled WAF section per service, then body text."""
+    per_section = max(1, paragraph_count // len(services) - 1)
+    paragraphs = []
+    for service in services:
+        paragraphs.append({"role": "title", "content": f"Architecture best practices for {service}"})
+        for i in range(per_section):
+            pillar = PILLARS[i % len(PILLARS)]
+            role = "sectionHeading" if i % 10 == 0 else "paragraph"
+            paragraphs.append({"role": role, "content": (
+                f"{pillar}: configure {service} with redundancy, monitoring and least-privilege access. "
+                f"Checklist item {i} explains the trade-offs of this {pillar.lower()} recommendation.")})
+    return paragraphs
+
+
+def write_recommendations_csv(pages: list[dict], path: str):
+    pd.DataFrame(pages).to_csv(path, index=False)
+
+
+def benchmark_pipeline(paragraph_count: int, repeats: int) -> tuple[dict, list[dict]]:
+    from datapipeline import extract_architecture_best_practices
+    result = SimpleNamespace(paragraphs=synthetic_paragraphs(paragraph_count))
+    # The pipeline echoes every section it finds; keep that out of the timing.
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        stats, pages = time_call(lambda: extract_architecture_best_practices(result), repeats)
+    stats["paragraphs"] = len(result.paragraphs)
+    return stats, pages
+
+
+def benchmark_lookup(csv_path: str, lookups: int, repeats: int) -> dict:
+    build, index = time_call(lambda: RecommendationIndex.from_csv(csv_path), repeats)
+    labels = [*DEFAULT_SERVICES, "Web App", "Key Vault", "SQL DB", "Hub VNet", "Internet", "On-premises Firewall"]
+    queries = [labels[i % len(labels)] for i in range(lookups)]
+    lookup, _ = time_call(lambda: [index.best_match(label) for label in queries], repeats)
+    lookup["lookups"] = lookups
+    return {"build": build, "lookup": lookup}
+
+
+def benchmark_graph(image: str, size: int, repeats: int, latency: float, latency_jitter: float,
+                    error_rate: float, seed: int, max_concurrency: int | None, rpm_limit: int = 0,
+                    tpm_limit: int = 0) -> dict:
+    from workflow import AzureArchitectureWorkflow
+    model = FakeChatModel(diagram_size=size, latency=latency, latency_jitter=latency_jitter,
+                          error_rate=error_rate, seed=seed, rpm_limit=rpm_limit, tpm_limit=tpm_limit)
+    workflow = AzureArchitectureWorkflow(max_concurrency=max_concurrency, llm_client=model)
+    samples, failures = [], 0
+    for _ in range(repeats):
+        started = time.perf_counter()
+        try:
+            workflow.run(image, use_cache=False)
+        except Exception:
+            failures += 1
+            continue
+        samples.append(time.perf_counter() - started)
+    stats = timing_stats(samples) if samples else {"runs": 0}
+    stats.update({
+        "diagram_size": size,
+        "failures": failures,
+        "llm_calls_per_run": model.calls / repeats,
+        "throttled_per_run": model.throttled / repeats,
+        "nodes": {node: round(totals["seconds"] / max(totals["runs"], 1), 6)
+                  for node, totals in workflow.profiler.summary().items()},
+    })
+    return stats
+
+
+def compare(results: dict, baseline: dict) -> list[str]:
+    """Median of each benchmark against a baseline result file."""
+    def medians(benchmarks, prefix=""):
+        for name, value in benchmarks.items():
+            if isinstance(value, dict) and "median" in value:
+                yield prefix + name, value["median"]
+            elif isinstance(value, dict):
+                yield from medians(value, f"{prefix}{name}.")
+
+    before = dict(medians(baseline["benchmarks"]))
+    lines = [f"Compared with {(baseline.get('commit') or 'unknown')[:10]}:"]
+    if baseline.get("parameters") != results["parameters"]:
+        lines.append("  (parameters differ from the baseline, changes are not comparable)")
+    for name, median in medians(results["benchmarks"]):
+        if before.get(name):
+            change = (median - before[name]) / before[name] * 100
+            lines.append(f"  {name}: {before[name]:.4f}s -> {median:.4f}s ({change:+.1f}%)")
+    return lines
+
+
+@click.command()
+@click.option("--sizes", default="5,20,50", show_default=True,
+              help="Comma separated diagram sizes (Azure nodes) for full graph runs.")
+@click.option("--repeats", "-r", default=3, show_default=True, type=int, help="Runs per benchmark.")
+@click.option("--latency", default=0.05, show_default=True, type=float, help="Fake model latency per call, in seconds.")
+@click.option("--latency_jitter", default=0.0, show_default=True, type=float,
+              help="Extra random latency per call, up to this many seconds.")
+@click.option("--error_rate", default=0.0, show_default=True, type=float, help="Share of fake model calls that fail.")
+@click.option("--seed", default=0, show_default=True, type=int, help="Seed of the fake model's latency and errors.")
+@click.option("--max_concurrency", "-c", default=None, type=int, help="Maximum concurrent review calls.")
+@click.option("--rpm_limit", default=0, show_default=True, type=int,
+              help="Requests per minute the fake model accepts before answering 429, 0 for no limit.")
+@click.option("--tpm_limit", default=0, show_default=True, type=int,
+              help="Tokens per minute the fake model accepts before answering 429, 0 for no limit.")
+@click.option("--paragraphs", default=20000, show_default=True, type=int,
+              help="Paragraphs in the synthetic WAF document for the pipeline benchmark.")
+@click.option("--lookups", default=1000, show_default=True, type=int, help="Service lookups per index benchmark run.")
+@click.option("--image_path", "-i", default="sample_images/azure_architecture_basic.png", show_default=True,
+              help="Diagram sent through image preparation; the fake model ignores its content.")
+@click.option("--output", "-o", default=None, help="Result file. Defaults to benchmarks/<commit>.json.")
+@click.option("--compare", "baseline_path", default=None, help="Earlier result file to compare against.")
+def cli(sizes, repeats, latency, latency_jitter, error_rate, seed, max_concurrency, rpm_limit, tpm_limit,
+        paragraphs, lookups, image_path, output, baseline_path):
+    """Benchmark the workflow and data pipeline offline against a fake model."""
+    revision = git_revision()
+    results = {
+        **revision,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "parameters": {"repeats": repeats, "latency": latency, "latency_jitter": latency_jitter,
+                       "error_rate": error_rate, "seed": seed, "max_concurrency": max_concurrency,
+                       "rpm_limit": rpm_limit, "tpm_limit": tpm_limit,
+                       "paragraphs": paragraphs, "lookups": lookups, "image_path": image_path},
+        "benchmarks": {},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        # Everything the workflow reads or writes stays in the temporary directory.
+        csv_path = os.path.join(directory, "azure-service-recommendations.csv")
+        os.environ.update({
+            "AZGENTICA_RECOMMENDATIONS_CSV": csv_path,
+            "AZGENTICA_VECTOR_STORE": os.path.join(directory, "chroma"),
+            "AZGENTICA_LLM_CACHE": "off",
+            "AZGENTICA_CHECKPOINTS": "off",
+            "AZGENTICA_RESULT_CACHE_DIR": os.path.join(directory, "results"),
+        })
+        os.environ.pop("AZGENTICA_METRICS_FILE", None)
+
+        click.secho(f"Extracting best practices from {paragraphs} paragraphs...", fg="yellow")
+        results["benchmarks"]["extract_architecture_best_practices"], pages = benchmark_pipeline(
+            paragraphs, repeats)
+        write_recommendations_csv(pages, csv_path)
+
+        click.secho(f"Building the recommendation index and running {lookups} lookups...", fg="yellow")
+        results["benchmarks"]["recommendation_index"] = benchmark_lookup(csv_path, lookups, repeats)
+
+        with open(image_path, "rb") as f:
+            image = base64.b64encode(f.read()).decode("utf-8")
+        graph_results = results["benchmarks"]["graph"] = {}
+        for size in [int(size) for size in sizes.split(",") if size.strip()]:
+            click.secho(f"Running the graph on a {size}-service diagram...", fg="yellow")
+            graph_results[f"size_{size}"] = benchmark_graph(
+                image, size, repeats, latency, latency_jitter, error_rate, seed, max_concurrency,
+                rpm_limit, tpm_limit)
+
+    output = output or os.path.join("benchmarks", f"{(revision['commit'] or 'unknown')[:12]}.json")
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    click.secho(f"Results written to {output}", fg="green", bold=True)
+    if baseline_path:
+        with open(baseline_path) as f:
+            click.echo("\n".join(compare(results, json.load(f))))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,299 @@
+"""
+Disk-backed caches for workflow results.
+
+ResultCache stores the final GraphState of a run, keyed by a hash of the image bytes
+plus the prompt and deployment versions, the pricing region and catalog and the image
+preparation settings, so a repeat upload of the same diagram does not re-run any LLM
+call. Entries are plain JSON files; the least recently used ones are evicted once the
+cache grows past its size limit.
+
+AnalysisCache keeps the raw Document Intelligence paragraphs of each analyzed PDF,
+keyed by a hash of the file bytes and the analysis model, so changes to the section
+extraction can be re-run from disk without re-analyzing the document.
+
+LLMResponseCache sits in front of the chat model and stores individual responses in
+SQLite, keyed by a hash of the normalized prompt, so node-level calls that repeat
+across diagrams (e.g. reviews of Key Vault or App Service) reuse earlier answers.
+"""
+
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from langchain_core.messages import AIMessage
+
+logger = logging.getLogger(__name__)
+
+# GraphState fields worth keeping; the image and message history are not.
+CACHED_STATE_FIELDS = (
+    "nodes",
+    "edges",
+    "image_description",
+    "azure_services_cost",
+    "service_skus",
+    "service_recommendations",
+    "errors",
+    "summary",
+)
+
+
+def image_cache_key(encoded_image: str, prompt_version: str, deployment: str, *versions: str) -> str:
+    """Content address of a run: image bytes, prompt version, model deployment and any other inputs."""
+    digest = hashlib.sha256()
+    digest.update(base64.b64decode(encoded_image))
+    for version in (prompt_version, deployment, *versions):
+        digest.update(b"\0" + version.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, directory: str = "data/cache/results", max_bytes: int = 256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> dict | None:
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable cache entry {path}: {e}")
+            return None
+        # The file mtime doubles as the LRU timestamp.
+        os.utime(path)
+        return state
+
+    def set(self, key: str, state: dict):
+        entry = {field: state.get(field) for field in CACHED_STATE_FIELDS}
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self._path(key))
+        self.evict()
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes."""
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+
+class AnalysisCache:
+    def __init__(self, directory: str = "data/cache/analysis"):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json.gz")
+
+    def get(self, key: str) -> list[dict] | None:
+        """Paragraphs of an earlier analysis, or None."""
+        path = self._path(key)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                return json.load(f)["paragraphs"]
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable analysis cache entry {path}: {e}")
+            return None
+
+    def set(self, key: str, paragraphs: list[dict], source: str | None = None):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with gzip.open(os.fdopen(fd, "wb"), "wt", encoding="utf-8") as f:
+            json.dump({"source": source, "paragraphs": paragraphs}, f)
+        os.replace(tmp_path, self._path(key))
+
+
+def normalize_messages(messages) -> list:
+    """Whitespace-insensitive view of a prompt; inline images are reduced to a hash."""
+    normalized = []
+    for message in messages:
+        content = message.content
+        parts = [content] if isinstance(content, str) else content
+        normalized_parts = []
+        for part in parts:
+            if isinstance(part, str):
+                normalized_parts.append(" ".join(part.split()))
+            elif part.get("type") == "text":
+                normalized_parts.append(" ".join(part["text"].split()))
+            elif part.get("type") == "image_url":
+                url = part["image_url"]["url"].encode("utf-8")
+                normalized_parts.append(
+                    {"image": hashlib.sha256(url).hexdigest()})
+            else:
+                normalized_parts.append(part)
+        normalized.append([message.type, normalized_parts])
+    return normalized
+
+
+class LLMResponseCache:
+    def __init__(self, path: str = "data/cache/llm.sqlite", ttl_seconds: float = 7 * 24 * 3600,
+                 max_entries: int = 10000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, content TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)")
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self._connection.commit()
+
+    @staticmethod
+    def key(messages, namespace: str = "") -> str:
+        payload = json.dumps([namespace, normalize_messages(messages)],
+                             sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT content, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    self._connection.execute(
+                        "DELETE FROM responses WHERE key = ?", (key,))
+                    self._connection.commit()
+                self.misses += 1
+                return None
+            self._connection.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._connection.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, content: str):
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, content, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)", (key, content, now, now))
+            self._evict(now)
+            self._connection.commit()
+
+    def discard(self, key: str):
+        """Drop an entry that get() just returned but the caller could not use."""
+        with self._lock:
+            self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._connection.commit()
+            self.hits -= 1
+            self.misses += 1
+
+    def _evict(self, now: float):
+        """Drop expired entries, then the least recently used ones past max_entries."""
+        self._connection.execute(
+            "DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+        self._connection.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,))
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._connection.execute(
+                "SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+class CachedChatModel:
+    """
+    Wraps a chat model so invoke() and ainvoke() are served from an LLMResponseCache when possible.
+    Only responses `validate` accepts are stored or served, so a truncated or malformed reply is
+    not replayed to every retry.
+    """
+
+    def __init__(self, llm, cache: LLMResponseCache, namespace: str = "", validate=None):
+        self.llm = llm
+        self.cache = cache
+        self.namespace = namespace
+        self.validate = validate
+
+    def _valid(self, content: str) -> bool:
+        if self.validate is None:
+            return True
+        try:
+            self.validate(content)
+        except Exception as e:
+            logger.warning(f"Not caching a response that does not parse: {e}")
+            return False
+        return True
+
+    def _get(self, key: str) -> AIMessage | None:
+        content = self.cache.get(key)
+        if content is None:
+            return None
+        if not self._valid(content):
+            self.cache.discard(key)
+            return None
+        return AIMessage(content=content, response_metadata={"cache_hit": True})
+
+    def _set(self, key: str, result):
+        if isinstance(result.content, str) and self._valid(result.content):
+            self.cache.set(key, result.content)
+
+    def invoke(self, messages, **kwargs):
+        key = self.cache.key(messages, self.namespace)
+        cached = self._get(key)
+        if cached is not None:
+            return cached
+        result = self.llm.invoke(messages, **kwargs)
+        self._set(key, result)
+        return result
+
+    async def ainvoke(self, messages, **kwargs):
+        key = self.cache.key(messages, self.namespace)
+        cached = self._get(key)
+        if cached is not None:
+            return cached
+        result = await self.llm.ainvoke(messages, **kwargs)
+        self._set(key, result)
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
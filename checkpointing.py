@@ -0,0 +1,174 @@
+"""
+Local persistence that lets failed runs resume instead of starting over.
+
+The compiled graph checkpoints its state after every node to SQLite through
+LangGraph's SqliteSaver, so a run that fails in, say, cost analysis resumes after
+data extraction. Inside the recommendations node, ReviewProgressStore records each
+service review as it completes, so a retry only re-reviews the services that
+failed or never ran. The images of a thread (the upload, the prepared image and its
+tiles) are stored once in ThreadImageStore and only referenced from graph state, so
+they are not copied into every checkpoint. All three live in the same database file.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+
+_checkpointers: dict[str, object] = {}
+_checkpointers_lock = threading.Lock()
+
+
+def get_checkpointer(path: str = "data/checkpoints.sqlite"):
+    """Process-wide SqliteSaver for a database file, usable from sync and async graphs."""
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
+    class ThreadedSqliteSaver(SqliteSaver):
+        async def aget_tuple(self, config):
+            return await asyncio.to_thread(self.get_tuple, config)
+
+        async def alist(self, config, *, filter=None, before=None, limit=None):
+            checkpoints = await asyncio.to_thread(
+                lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+            for checkpoint in checkpoints:
+                yield checkpoint
+
+        async def aput(self, config, checkpoint, metadata, new_versions):
+            return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+        async def aput_writes(self, config, writes, task_id, task_path=""):
+            return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+        async def adelete_thread(self, thread_id):
+            return await asyncio.to_thread(self.delete_thread, thread_id)
+
+        def thread_ids(self) -> set[str]:
+            """Every thread with checkpoints."""
+            with self.cursor(transaction=False) as cursor:
+                return {row[0] for row in cursor.execute("SELECT DISTINCT thread_id FROM checkpoints")}
+
+    path = os.path.abspath(path)
+    with _checkpointers_lock:
+        if path not in _checkpointers:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _checkpointers[path] = ThreadedSqliteSaver(
+                sqlite3.connect(path, check_same_thread=False))
+        return _checkpointers[path]
+
+
+class ReviewProgressStore:
+    def __init__(self, path: str = "data/checkpoints.sqlite"):
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS review_progress ("
+            "thread_id TEXT NOT NULL, service_name TEXT NOT NULL, "
+            "recommendations TEXT NOT NULL, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (thread_id, service_name))")
+        self._connection.commit()
+
+    def completed(self, thread_id: str) -> dict[str, list[dict]]:
+        """Reviews already stored for a thread, by service name."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT service_name, recommendations FROM review_progress WHERE thread_id = ?",
+                (thread_id,)).fetchall()
+        return {service_name: json.loads(recommendations) for service_name, recommendations in rows}
+
+    def save(self, thread_id: str, service_name: str, recommendations: list[dict]):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO review_progress "
+                "(thread_id, service_name, recommendations, updated_at) VALUES (?, ?, ?, ?)",
+                (thread_id, service_name, json.dumps(recommendations), time.time()))
+            self._connection.commit()
+
+    def clear(self, thread_id: str):
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM review_progress WHERE thread_id = ?", (thread_id,))
+            self._connection.commit()
+
+
+_progress_stores: dict[str, ReviewProgressStore] = {}
+_progress_stores_lock = threading.Lock()
+
+
+def get_review_progress_store(path: str = "data/checkpoints.sqlite") -> ReviewProgressStore:
+    path = os.path.abspath(path)
+    with _progress_stores_lock:
+        if path not in _progress_stores:
+            _progress_stores[path] = ReviewProgressStore(path)
+        return _progress_stores[path]
+
+
+class ThreadImageStore:
+    """Images of each thread by name; also records when each thread last ran, for pruning."""
+
+    def __init__(self, path: str = "data/checkpoints.sqlite"):
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS thread_images ("
+            "thread_id TEXT NOT NULL, name TEXT NOT NULL, "
+            "data TEXT NOT NULL, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (thread_id, name))")
+        self._connection.commit()
+
+    def save(self, thread_id: str, name: str, data: str):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO thread_images (thread_id, name, data, updated_at) VALUES (?, ?, ?, ?)",
+                (thread_id, name, data, time.time()))
+            self._connection.commit()
+
+    def load(self, thread_id: str, name: str) -> str:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT data FROM thread_images WHERE thread_id = ? AND name = ?", (thread_id, name)).fetchone()
+        if row is None:
+            raise KeyError(f"No image '{name}' stored for thread {thread_id}")
+        return row[0]
+
+    def last_used(self) -> dict[str, float]:
+        """When an image of each thread was last stored, by thread id."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT thread_id, MAX(updated_at) FROM thread_images GROUP BY thread_id").fetchall()
+        return dict(rows)
+
+    def clear(self, thread_id: str):
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM thread_images WHERE thread_id = ?", (thread_id,))
+            self._connection.commit()
+
+
+_image_stores: dict[str, ThreadImageStore] = {}
+_image_stores_lock = threading.Lock()
+
+
+def get_thread_image_store(path: str = "data/checkpoints.sqlite") -> ThreadImageStore:
+    path = os.path.abspath(path)
+    with _image_stores_lock:
+        if path not in _image_stores:
+            _image_stores[path] = ThreadImageStore(path)
+        return _image_stores[path]
+
+
+def stale_threads(last_used: dict[str, float], thread_ids: set[str], max_age_seconds: float, keep: int) -> list[str]:
+    """
+    Threads to prune: those not run for max_age_seconds, then all but the `keep` most recently run.
+    Threads with checkpoints but no record of when they ran (abandoned, or older than the
+    record) count as the oldest. A limit of 0 disables it.
+    """
+    cutoff = time.time() - max_age_seconds
+    threads = sorted(thread_ids | set(last_used), key=lambda thread_id: last_used.get(thread_id, 0.0), reverse=True)
+    return [thread_id for position, thread_id in enumerate(threads)
+            if (max_age_seconds and last_used.get(thread_id, 0.0) < cutoff) or (keep and position >= keep)]
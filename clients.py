@@ -0,0 +1,74 @@
+"""
+Process-wide Azure OpenAI client and event loop.
+
+Every workflow in a process shares one AzureChatOpenAI client per deployment, with
+pooled sync and async HTTP clients, so concurrent runs reuse connections instead of
+each opening their own. Async runs are executed on one background event loop
+(run_coroutine), which keeps the pooled async connections bound to a single loop no
+matter which thread (CLI, Streamlit script run, HTTP worker) starts the run.
+"""
+
+import asyncio
+import concurrent.futures
+import os
+import threading
+
+_clients: dict[tuple, object] = {}
+_clients_lock = threading.Lock()
+
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_lock = threading.Lock()
+
+
+def http_limits():
+    import httpx
+    return httpx.Limits(
+        max_connections=int(os.getenv("AZGENTICA_HTTP_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("AZGENTICA_HTTP_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.getenv("AZGENTICA_HTTP_KEEPALIVE_SECONDS", "30")))
+
+
+def get_llm_client(deployment: str, endpoint: str | None, api_key: str | None,
+                   api_version: str = "2024-08-01-preview", temperature: float = 0.3):
+    """Shared AzureChatOpenAI for a deployment, with a tunable connection pool."""
+    import httpx
+    from langchain_openai import AzureChatOpenAI
+    key = (deployment, endpoint, api_key, api_version, temperature)
+    with _clients_lock:
+        if key not in _clients:
+            timeout = float(os.getenv("AZGENTICA_HTTP_TIMEOUT", "120"))
+            _clients[key] = AzureChatOpenAI(
+                azure_deployment=deployment,
+                api_version=api_version,
+                temperature=temperature,
+                model_name=deployment,
+                azure_endpoint=endpoint,
+                api_key=api_key,
+                # Token usage is still reported when responses are streamed.
+                stream_usage=True,
+                # Retries, throttling included, are left to the RateLimitScheduler.
+                max_retries=0,
+                http_client=httpx.Client(limits=http_limits(), timeout=timeout),
+                http_async_client=httpx.AsyncClient(limits=http_limits(), timeout=timeout),
+            )
+        return _clients[key]
+
+
+def event_loop() -> asyncio.AbstractEventLoop:
+    """The process-wide event loop async runs are scheduled on, started on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="azgentica-event-loop", daemon=True).start()
+        return _loop
+
+
+def submit_coroutine(coroutine) -> concurrent.futures.Future:
+    """Schedule a coroutine on the process-wide loop without waiting for it."""
+    return asyncio.run_coroutine_threadsafe(coroutine, event_loop())
+
+
+def run_coroutine(coroutine):
+    """Run a coroutine on the process-wide loop and wait for its result from any thread."""
+    return submit_coroutine(coroutine).result()
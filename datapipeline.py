@@ -3,22 +3,40 @@
 WAF Recommendations Data Pipeline CLI
 
 This script processes Azure Well-Architected Framework documents using Azure Document Intelligence
-to extract architecture best practices and recommendations, then structures them into a CSV format.
+to extract architecture best practices and recommendations, then structures them into a CSV format
+and embeds them, chunk by chunk, into a local Chroma vector store used for retrieval by the workflow.
 
 Requirements:
 - Azure Document Intelligence service endpoint and key
 - Environment variables: AZURE_DOCUMENT_INTELLIGENCE_ENDPOINT, AZURE_DOCUMENT_INTELLIGENCE_KEY
-- Input PDF: data/azure-well-architected.pdf
+- Input PDFs: data/azure-well-architected.pdf by default, analyzed concurrently in page ranges
+- Embeddings: AZURE_OPENAI_EMBEDDING_MODEL, or --embeddings hashing to embed offline
 """
 
+import hashlib
+import io
 import os
-import uuid
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
 import click
 import pandas as pd
 from azure.core.credentials import AzureKeyCredential
 from azure.ai.documentintelligence import DocumentIntelligenceClient
 from dotenv import load_dotenv
 
+from cache import AnalysisCache
+from section_store import DEFAULT_STORE_PATH, SectionStore, section_id
+from retrieval import DEFAULT_PERSIST_DIRECTORY, EMBEDDING_PROVIDERS, build_vector_store
+
+ANALYSIS_MODEL = "prebuilt-layout"
+SECTION_MARKERS = ("Architecture best practices for", "Azure Well-Architected Framework perspective")
+DEFAULT_ANALYSIS_CACHE_DIRECTORY = "data/cache/analysis"
+DEFAULT_PAGES_PER_RANGE = 100
+DEFAULT_PARALLELISM = 4
+_PDF_PAGE_RE = re.compile(rb"/Type\s*/Page(?![a-zA-Z])")
+
 
 def setup_document_intelligence_client():
     """Initialize Azure Document Intelligence client with credentials from environment variables."""
@@ -34,17 +52,156 @@ def setup_document_intelligence_client():
     return DocumentIntelligenceClient(di_endpoint, di_credential)
 
 
-def analyze_document(client, file_path):
-    """Analyze PDF document using Azure Document Intelligence prebuilt-layout model."""
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"Sample document not found at {file_path}")
-    click.echo(f"Analyzing document: {file_path}")
-    with open(file_path, "rb") as f:
-        poller = client.begin_analyze_document("prebuilt-layout", body=f)
-    result = poller.result()
+class AnalyzedDocument(NamedTuple):
+    """Paragraphs of one or more documents, stitched back together in page order."""
+    paragraphs: list
+    page_count: int
+
+
+def count_pdf_pages(data: bytes) -> int:
+    """Number of pages of a PDF, with pypdf when installed or by counting page objects."""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        return len(_PDF_PAGE_RE.findall(data)) or 1
+    return len(PdfReader(io.BytesIO(data)).pages)
+
+
+def page_ranges(page_count, pages_per_range):
+    """Document Intelligence page ranges ("1-50", "51-100", ...) covering every page."""
+    if not pages_per_range or pages_per_range >= page_count:
+        return [None]
+    return [f"{start}-{min(start + pages_per_range - 1, page_count)}"
+            for start in range(1, page_count + 1, pages_per_range)]
+
+
+def extract_pages(data, pages):
+    """PDF bytes holding only the pages of a "first-last" range, so a range uploads just its pages."""
+    from pypdf import PdfReader, PdfWriter
+    first, last = (int(page) for page in pages.split("-"))
+    reader = PdfReader(io.BytesIO(data))
+    writer = PdfWriter()
+    for index in range(first - 1, last):
+        writer.add_page(reader.pages[index])
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+def analyze_page_range(client, data, pages):
+    """Analyze one page range (or the whole document when pages is None) with prebuilt-layout."""
+    body, kwargs, offset = data, {}, 0
+    if pages:
+        try:
+            body, offset = extract_pages(data, pages), int(pages.split("-")[0]) - 1
+        except ImportError:
+            # Without pypdf the whole document is uploaded and the service picks the range.
+            kwargs = {"pages": pages}
+    poller = client.begin_analyze_document(ANALYSIS_MODEL, body=io.BytesIO(body), **kwargs)
+    paragraphs = [paragraph_to_dict(paragraph) for paragraph in poller.result().paragraphs or []]
+    # Page numbers of a split range start at 1; shift them back to the page in the document.
+    for paragraph in paragraphs if offset else []:
+        for region in paragraph.get("boundingRegions") or []:
+            region["pageNumber"] += offset
+    return paragraphs
+
+
+def paragraph_to_dict(paragraph):
+    """Plain JSON-serializable dict of a Document Intelligence paragraph."""
+    return paragraph.as_dict() if hasattr(paragraph, "as_dict") else dict(paragraph)
+
+
+def analysis_cache_key(data):
+    """Content address of an analysis: file bytes and the layout model."""
+    return hashlib.sha256(data + b"\0" + ANALYSIS_MODEL.encode("utf-8")).hexdigest()
+
+
+def read_documents(file_paths):
+    """(path, bytes) of each input PDF, in order."""
+    documents = []
+    for file_path in file_paths:
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"Sample document not found at {file_path}")
+        with open(file_path, "rb") as f:
+            documents.append((file_path, f.read()))
+    return documents
+
+
+def analyze_document(client, file_paths, pages_per_range=DEFAULT_PAGES_PER_RANGE, parallelism=DEFAULT_PARALLELISM,
+                     cache=None, refresh=False):
+    """
+    Analyze PDF documents using Azure Document Intelligence prebuilt-layout model.
+    Each document is split into page ranges that are analyzed concurrently, and the
+    paragraphs are stitched back together in document and page order. With a cache,
+    documents analyzed before are read from disk instead; `client` may then be None
+    or a function creating it, called only when some document is not cached.
+    """
+    if isinstance(file_paths, str):
+        file_paths = [file_paths]
+    documents = read_documents(file_paths)
+    cached, jobs = {}, []
+    page_count = 0
+    for index, (file_path, data) in enumerate(documents):
+        pages = count_pdf_pages(data)
+        page_count += pages
+        if cache is not None and not refresh:
+            cached[index] = cache.get(analysis_cache_key(data))
+            if cached[index] is not None:
+                click.echo(f"Using cached analysis of {file_path} ({len(cached[index])} paragraphs)")
+                continue
+        ranges = page_ranges(pages, pages_per_range)
+        click.echo(f"Analyzing document: {file_path} ({pages} pages, {len(ranges)} range(s))")
+        jobs.extend((index, page_range) for page_range in ranges)
+    results = []
+    if jobs:
+        if not hasattr(client, "begin_analyze_document"):
+            client = client()
+        with ThreadPoolExecutor(max_workers=max(1, parallelism)) as executor:
+            # map keeps submission order, so ranges come back in document and page order.
+            results = list(executor.map(
+                lambda job: (job[0], analyze_page_range(client, documents[job[0]][1], job[1])), jobs))
+    analyzed = {}
+    for index, paragraphs in results:
+        analyzed.setdefault(index, []).extend(paragraphs)
+    if cache is not None:
+        for index, paragraphs in analyzed.items():
+            file_path, data = documents[index]
+            cache.set(analysis_cache_key(data), paragraphs, source=os.path.basename(file_path))
+    paragraphs = [paragraph for index in range(len(documents))
+                  for paragraph in (cached.get(index) or analyzed.get(index, []))]
     click.echo(
-        f"Document analysis completed. Found {len(result.paragraphs)} paragraphs.")
-    return result
+        f"Document analysis completed. Found {len(paragraphs)} paragraphs.")
+    return AnalyzedDocument(paragraphs, page_count)
+
+
+def is_section_heading(paragraph):
+    """WAF service guides start with a title such as "Architecture best practices for ..."."""
+    content = paragraph.get("content", "")
+    return paragraph.get("role", "paragraph") == "title" and any(
+        marker in content for marker in SECTION_MARKERS)
+
+
+def make_section(heading, parts):
+    content = "\n".join(parts)
+    return {"id": section_id(heading, content), "heading": heading, "content": content}
+
+
+def iter_sections(paragraphs):
+    """
+    Stream sections out of paragraphs, yielding each one as soon as the next heading
+    (or the end of the document) closes it. Text before the first heading is skipped.
+    """
+    heading, parts = None, []
+    for paragraph in paragraphs:
+        if is_section_heading(paragraph):
+            if heading is not None:
+                yield make_section(heading, parts)
+            heading = paragraph.get("content", "")
+            parts = [heading]
+        elif heading is not None:
+            parts.append(paragraph.get("content", ""))
+    if heading is not None:
+        yield make_section(heading, parts)
 
 
 def extract_architecture_best_practices(result):
@@ -54,20 +211,9 @@ def extract_architecture_best_practices(result):
     that contain "Architecture best practices for".
     """
     pages = []
-    current_page = None
-    for paragraph in result.paragraphs:
-        role = paragraph.get("role", "paragraph")
-        content = paragraph.get("content", "")
-        if (("Architecture best practices for" in content) or ("Azure Well-Architected Framework perspective" in content)) and role == "title":
-            current_page = {
-                "id": str(uuid.uuid4()),
-                "heading": content,
-                "content": content
-            }
-            pages.append(current_page)
-            click.echo(f"Found new section: {content}")
-        elif current_page is not None:
-            current_page["content"] += f"\n{content}"
+    for page in iter_sections(result.paragraphs):
+        pages.append(page)
+        click.echo(f"Found new section: {page['heading']}")
     click.echo(
         f"Extracted {len(pages)} architecture best practices documents.")
     return pages
@@ -92,12 +238,37 @@ def save_to_csv(pages, output_path):
         f"- Shortest section: {df['content'].str.len().min()} characters")
 
 
+def save_to_vector_store(pages, persist_directory, provider, rebuild=False):
+    """Chunk and embed new sections into the persisted vector store, dropping removed ones."""
+    if not pages:
+        click.echo("No pages to embed.")
+        return
+    _, update = build_vector_store(
+        pages, persist_directory=persist_directory, provider=provider, rebuild=rebuild)
+    if update.rebuilt:
+        click.echo(f"Rebuilt the vector store in {persist_directory}")
+    click.echo(
+        f"Embedded {update.added_chunks} chunks from {update.added_sections} new sections, "
+        f"removed {update.removed_sections} sections, into {persist_directory}")
+
+
+def save_to_store(pages, store_path):
+    """Upsert sections into the section store, by content hash."""
+    store = SectionStore(store_path)
+    result = store.sync(pages)
+    click.echo(
+        f"Section store {store_path}: {len(result.added)} added, {len(result.unchanged)} unchanged, "
+        f"{len(result.removed)} removed")
+    return result
+
+
 @click.command()
 @click.option(
-    "--input-file", "-i",
-    default="data/azure-well-architected.pdf",
+    "--input-file", "-i", "input_files",
+    multiple=True,
+    default=["data/azure-well-architected.pdf"],
     show_default=True,
-    help="Path to the input PDF file."
+    help="Path to an input PDF file, can be repeated."
 )
 @click.option(
     "--output-file", "-o",
@@ -105,7 +276,59 @@ def save_to_csv(pages, output_path):
     show_default=True,
     help="Path to the output CSV file."
 )
-def cli(input_file, output_file):
+@click.option(
+    "--store", "-s", "store_path",
+    default=DEFAULT_STORE_PATH,
+    show_default=True,
+    help="SQLite store of the extracted sections, updated incrementally."
+)
+@click.option(
+    "--vector-store", "-v",
+    default=DEFAULT_PERSIST_DIRECTORY,
+    show_default=True,
+    help="Directory of the persisted vector store."
+)
+@click.option(
+    "--embeddings", "-e",
+    type=click.Choice(EMBEDDING_PROVIDERS),
+    default=lambda: os.getenv("AZGENTICA_EMBEDDINGS", "azure"),
+    show_default="AZGENTICA_EMBEDDINGS or azure",
+    help="Embedding provider used to build the vector store."
+)
+@click.option(
+    "--skip-embeddings", is_flag=True,
+    help="Only write the CSV, do not update the vector store."
+)
+@click.option(
+    "--rebuild", is_flag=True,
+    help="Rewrite the CSV and re-embed every section, even if nothing changed."
+)
+@click.option(
+    "--pages-per-range",
+    default=DEFAULT_PAGES_PER_RANGE,
+    show_default=True,
+    type=int,
+    help="Pages analyzed per Document Intelligence request, 0 to send each document whole."
+)
+@click.option(
+    "--parallelism", "-p",
+    default=DEFAULT_PARALLELISM,
+    show_default=True,
+    type=int,
+    help="Page ranges analyzed concurrently."
+)
+@click.option(
+    "--analysis-cache",
+    default=DEFAULT_ANALYSIS_CACHE_DIRECTORY,
+    show_default=True,
+    help="Directory of cached Document Intelligence results, keyed by file hash."
+)
+@click.option(
+    "--refresh-analysis", is_flag=True,
+    help="Re-analyze every document even if a cached result exists."
+)
+def cli(input_files, output_file, store_path, vector_store, embeddings, skip_embeddings, rebuild, pages_per_range,
+        parallelism, analysis_cache, refresh_analysis):
     """WAF Recommendations Data Pipeline CLI."""
     click.secho("="*60, fg="cyan")
     click.secho("WAF Recommendations Data Pipeline", fg="green", bold=True)
@@ -113,13 +336,23 @@ def cli(input_file, output_file):
     try:
         click.secho(
             "1. Setting up Azure Document Intelligence client...", fg="yellow")
-        client = setup_document_intelligence_client()
-        click.secho("2. Analyzing PDF document...", fg="yellow")
-        result = analyze_document(client, input_file)
+        # Only created if some document has no cached analysis.
+        client = setup_document_intelligence_client
+        click.secho("2. Analyzing PDF documents...", fg="yellow")
+        result = analyze_document(client, list(input_files), pages_per_range, parallelism,
+                                  cache=AnalysisCache(analysis_cache), refresh=refresh_analysis)
         click.secho("3. Extracting architecture best practices...", fg="yellow")
         pages = extract_architecture_best_practices(result)
-        click.secho("4. Saving results to CSV...", fg="yellow")
-        save_to_csv(pages, output_file)
+        click.secho("4. Updating the section store...", fg="yellow")
+        changes = save_to_store(pages, store_path)
+        click.secho("5. Saving results to CSV...", fg="yellow")
+        if changes.changed or rebuild or not os.path.exists(output_file):
+            save_to_csv(pages, output_file)
+        else:
+            click.echo(f"No section changed, {output_file} is up to date.")
+        if not skip_embeddings:
+            click.secho("6. Embedding sections into vector store...", fg="yellow")
+            save_to_vector_store(pages, vector_store, embeddings, rebuild=rebuild)
         click.secho("\n" + "="*60, fg="cyan")
         click.secho("Pipeline completed successfully!", fg="green", bold=True)
         click.secho("="*60, fg="cyan")
@@ -0,0 +1,89 @@
+"""
+Node and edge diff between two extractions of the same architecture.
+
+Node ids are chosen by the model and change between uploads, so nodes are matched
+by normalized label, preferring candidates in the same subnet and of the same type.
+A matched node is unchanged when its type, subnet and connections (by the labels at
+the other end) are the same; unchanged nodes keep their earlier reviews and prices.
+"""
+
+from collections import Counter
+
+from tiling import normalize_label
+
+
+def _connections(nodes: list[dict], edges: list[dict]) -> dict[str, Counter]:
+    """Connections of every node id, as (direction, other label, edge label) keys."""
+    labels = {node.get("id"): normalize_label(node.get("label")) for node in nodes}
+    connections = {node.get("id"): Counter() for node in nodes}
+    for edge in edges:
+        source, target = edge.get("source"), edge.get("target")
+        label = normalize_label(edge.get("label"))
+        if source in connections:
+            connections[source][("out", labels.get(target, normalize_label(target)), label)] += 1
+        if target in connections:
+            connections[target][("in", labels.get(source, normalize_label(source)), label)] += 1
+    return connections
+
+
+def _edge_keys(nodes: list[dict], edges: list[dict]) -> Counter:
+    labels = {node.get("id"): node.get("label") for node in nodes}
+    return Counter((labels.get(edge.get("source"), edge.get("source")),
+                    labels.get(edge.get("target"), edge.get("target")),
+                    edge.get("label") or "") for edge in edges)
+
+
+def match_nodes(previous_nodes: list[dict], nodes: list[dict]) -> dict[str, dict]:
+    """Previous node of each current node id that has one."""
+    available = list(previous_nodes)
+    matches = {}
+
+    def same(node, candidate, strict):
+        if normalize_label(node.get("label")) != normalize_label(candidate.get("label")):
+            return False
+        return not strict or (normalize_label(node.get("subnet")) == normalize_label(candidate.get("subnet"))
+                              and node.get("type") == candidate.get("type"))
+
+    for strict in (True, False):
+        for node in nodes:
+            if node.get("id") in matches:
+                continue
+            candidate = next((candidate for candidate in available if same(node, candidate, strict)), None)
+            if candidate is not None:
+                matches[node.get("id")] = candidate
+                available.remove(candidate)
+    return matches
+
+
+def diff_graphs(previous_nodes, previous_edges, nodes, edges) -> dict:
+    """
+    Added, removed, changed and unchanged nodes between a previous and a current
+    extraction, plus the edges (by label) that appeared or disappeared.
+    """
+    previous_nodes, previous_edges = previous_nodes or [], previous_edges or []
+    nodes, edges = nodes or [], edges or []
+    matches = match_nodes(previous_nodes, nodes)
+    previous_connections = _connections(previous_nodes, previous_edges)
+    connections = _connections(nodes, edges)
+    matched_previous = {id(previous) for previous in matches.values()}
+    diff = {"added": [], "removed": [], "changed": [], "unchanged": []}
+    for node in nodes:
+        previous = matches.get(node.get("id"))
+        if previous is None:
+            diff["added"].append(node)
+        elif (node.get("type") != previous.get("type")
+              or normalize_label(node.get("subnet")) != normalize_label(previous.get("subnet"))
+              or connections[node.get("id")] != previous_connections[previous.get("id")]):
+            diff["changed"].append({"node": node, "previous": previous})
+        else:
+            diff["unchanged"].append({"id": node.get("id"), "previous_id": previous.get("id")})
+    diff["removed"] = [node for node in previous_nodes if id(node) not in matched_previous]
+    previous_edge_keys, edge_keys = _edge_keys(previous_nodes, previous_edges), _edge_keys(nodes, edges)
+    diff["added_edges"] = [list(key) for key in (edge_keys - previous_edge_keys).elements()]
+    diff["removed_edges"] = [list(key) for key in (previous_edge_keys - edge_keys).elements()]
+    return diff
+
+
+def changed_node_ids(diff: dict) -> set[str]:
+    """Current node ids that need a fresh review or price."""
+    return {node.get("id") for node in diff["added"]} | {change["node"].get("id") for change in diff["changed"]}
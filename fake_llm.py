@@ -0,0 +1,187 @@
+"""
+Deterministic local stand-in for the Azure OpenAI chat model.
+
+FakeChatModel answers the workflow's prompts (diagram extraction, SKU mapping,
+service reviews and the summary narrative) with canned responses shaped like the
+real ones, after a configurable latency and with a configurable error rate, so the
+graph can be run and timed without calling the live deployment. The size of the
+extracted diagram is configurable, and token usage is reported as usage metadata
+using the same chars/4 estimate as the rest of the code. When streamed, responses
+arrive in small chunks, like tokens from the live deployment.
+
+With rpm_limit or tpm_limit set, it also stands in for a throttled deployment:
+calls beyond the budget of the last rate_window seconds fail with a 429-style
+FakeRateLimitError carrying a retry-after header, like Azure OpenAI does.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from utils import estimate_tokens
+
+# Labels the fake extraction cycles through; all resolvable in the pricing catalog.
+DEFAULT_SERVICES = (
+    "Azure App Service", "Azure Key Vault", "Azure SQL Database", "Azure Storage Account",
+    "Azure Application Gateway", "Azure Functions", "Azure Cosmos DB", "Azure Kubernetes Service",
+    "Azure Virtual Network", "Azure Monitor", "Azure Front Door", "Azure Cache for Redis",
+    "Azure Service Bus", "Azure Firewall", "Azure Container Registry", "Azure Virtual Machines",
+)
+
+_REVIEWED_SERVICE_RE = re.compile(r"## Service: (.*?) \(labelled")
+_CHUNK_RE = re.compile(r"\S+\s*|\s+")
+
+
+class FakeModelError(RuntimeError):
+    """Injected failure, raised for the configured share of calls."""
+
+
+class FakeRateLimitError(FakeModelError):
+    """Call over the fake deployment's rate limit, shaped like an HTTP 429 from the API."""
+    status_code = 429
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limit exceeded, retry after {retry_after:.3f} seconds.")
+        self.headers = {"retry-after-ms": str(round(retry_after * 1000))}
+
+
+def _prompt_text(messages: list[BaseMessage]) -> str:
+    parts = []
+    for message in messages:
+        content = message.content
+        for part in [content] if isinstance(content, str) else content:
+            if isinstance(part, str):
+                parts.append(part)
+            elif part.get("type") == "text":
+                parts.append(part["text"])
+    return "\n".join(parts)
+
+
+def fake_diagram(size: int, services: tuple[str, ...] = DEFAULT_SERVICES) -> dict:
+    """Extraction result with `size` nodes chained by edges, behind an internet entry point."""
+    nodes = [{"id": "internet", "type": "custom", "label": "Internet", "subnet": None}]
+    for i in range(size):
+        nodes.append({"id": f"n{i}", "type": "azure",
+                      "label": services[i % len(services)], "subnet": f"subnet-{i % 4}"})
+    edges = [{"source": nodes[i]["id"], "target": nodes[i + 1]["id"],
+              "label": "HTTPS", "metadata": {}} for i in range(len(nodes) - 1)]
+    return {
+        "description": f"A {size}-service Azure workload behind a public entry point.",
+        "nodes": nodes,
+        "edges": edges,
+    }
+
+
+def fake_review(service_name: str) -> list[dict]:
+    return [{
+        "service_name": service_name,
+        "review": f"{service_name} is deployed in a single region without redundancy.",
+        "recommedation": f"Enable zone redundancy and private endpoints for {service_name}.",
+        "pillar_in_review": pillar,
+    } for pillar in ("Reliability", "Security")]
+
+
+FAKE_NARRATIVE = {
+    "summary": "A multi-tier Azure workload with a public entry point.",
+    "cost_summary": "Compute dominates the monthly cost.",
+    "compute_cost": "Compute services are the main cost driver.",
+    "storage_cost": "Storage is a small share of the cost.",
+    "networking_cost": "Networking costs are modest.",
+}
+
+
+class FakeChatModel(BaseChatModel):
+    diagram_size: int = 8
+    latency: float = 0.0
+    latency_jitter: float = 0.0
+    error_rate: float = 0.0
+    seed: int = 0
+    temperature: float = 0.0
+    rpm_limit: int = 0
+    tpm_limit: int = 0
+    rate_window: float = 60.0
+
+    _random: random.Random = PrivateAttr()
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _calls: int = PrivateAttr(default=0)
+    _throttled: int = PrivateAttr(default=0)
+    _window: deque = PrivateAttr(default_factory=deque)
+
+    def model_post_init(self, context):
+        self._random = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-azure-openai"
+
+    @property
+    def calls(self) -> int:
+        return self._calls
+
+    @property
+    def throttled(self) -> int:
+        return self._throttled
+
+    def _check_rate_limit(self, tokens: int):
+        """Record a call in the sliding window, or raise if it would exceed the limits."""
+        now = time.monotonic()
+        while self._window and self._window[0][0] <= now - self.rate_window:
+            self._window.popleft()
+        over_requests = self.rpm_limit and len(self._window) >= self.rpm_limit
+        over_tokens = self.tpm_limit and sum(used for _, used in self._window) + tokens > self.tpm_limit
+        if over_requests or over_tokens:
+            self._throttled += 1
+            oldest = self._window[0][0] if self._window else now
+            raise FakeRateLimitError(max(0.0, oldest + self.rate_window - now))
+        self._window.append((now, tokens))
+
+    def respond(self, prompt: str) -> str:
+        """Canned response for a workflow prompt."""
+        if "downscaled overview" in prompt:
+            return json.dumps({"description": fake_diagram(self.diagram_size)["description"]})
+        if "vision-language model" in prompt:
+            return json.dumps(fake_diagram(self.diagram_size))
+        if "could not be matched to the pricing catalog" in prompt:
+            return "{}"
+        if "review the Azure services" in prompt:
+            reviews = [review for name in _REVIEWED_SERVICE_RE.findall(prompt)
+                       for review in fake_review(name)]
+            return json.dumps(reviews)
+        return "```json\n" + json.dumps(FAKE_NARRATIVE) + "\n```"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        prompt = _prompt_text(messages)
+        content = self.respond(prompt)
+        input_tokens, output_tokens = estimate_tokens(prompt), estimate_tokens(content)
+        with self._lock:
+            self._calls += 1
+            if self.rpm_limit or self.tpm_limit:
+                self._check_rate_limit(input_tokens + output_tokens)
+            delay = self.latency + self._random.uniform(0, self.latency_jitter)
+            fail = self._random.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise FakeModelError("Injected fake model failure.")
+        message = AIMessage(content=content, usage_metadata={
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        })
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        message = self._generate(messages, stop, run_manager, **kwargs).generations[0].message
+        pieces = _CHUNK_RE.findall(message.content)
+        for i, piece in enumerate(pieces):
+            # Usage is reported once, on the last chunk, as the OpenAI API does.
+            usage = message.usage_metadata if i == len(pieces) - 1 else None
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece, usage_metadata=usage))
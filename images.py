@@ -0,0 +1,112 @@
+"""
+Image preparation for the vision calls.
+
+Uploaded diagrams are normalized once, before extraction: the real MIME type is
+detected, and the image is downscaled to what the model would actually look at
+(Azure OpenAI rescales to fit 2048x2048 and then to a 768px shortest side for
+`high` detail) or further to fit a pixel / vision-token budget. Pillow is optional;
+without it the image is sent as uploaded.
+"""
+
+import base64
+import io
+import logging
+import math
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+IMAGE_DETAILS = ("low", "high", "auto")
+
+_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+
+class PreparedImage(NamedTuple):
+    data: str
+    mime_type: str
+    width: int | None
+    height: int | None
+    tokens: int | None
+
+
+def detect_mime_type(data: bytes) -> str:
+    for signature, mime_type in _SIGNATURES:
+        if data.startswith(signature):
+            return mime_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/jpeg"
+
+
+def model_resolution(width: int, height: int) -> tuple[int, int]:
+    """Resolution the service downsamples a `high` detail image to before tiling."""
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def estimate_image_tokens(width: int, height: int, detail: str = "high") -> int:
+    """Vision tokens billed for an image: 85 base plus 170 per 512px tile at high detail."""
+    if detail == "low":
+        return 85
+    width, height = model_resolution(width, height)
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
+
+
+def image_data_url(image: str, mime_type: str | None = None) -> str:
+    return f"data:{mime_type or 'image/jpeg'};base64,{image}"
+
+
+def prepare_image(encoded_image: str, detail: str = "high", max_pixels: int | None = None,
+                  max_tokens: int | None = None, image_format: str = "PNG") -> PreparedImage:
+    """Downscale and re-encode a base64 image to fit the model resolution and the given budgets."""
+    data = base64.b64decode(encoded_image)
+    mime_type = detect_mime_type(data)
+    try:
+        from PIL import Image
+    except ImportError:
+        logger.warning("Pillow is not installed, sending the image as uploaded.")
+        return PreparedImage(encoded_image, mime_type, None, None, None)
+    try:
+        image = Image.open(io.BytesIO(data))
+    except OSError as e:
+        raise ValueError(f"Uploaded file is not a readable image: {e}") from e
+    with image:
+        width, height = image.size
+        if detail == "low":
+            # Low detail is always a single 512px view.
+            scale = min(1.0, 512 / max(width, height))
+            target = (max(1, round(width * scale)), max(1, round(height * scale)))
+        else:
+            target = model_resolution(width, height)
+        if max_pixels and target[0] * target[1] > max_pixels:
+            scale = math.sqrt(max_pixels / (target[0] * target[1]))
+            target = (max(1, int(target[0] * scale)), max(1, int(target[1] * scale)))
+        while max_tokens and estimate_image_tokens(*target, detail) > max_tokens and min(target) > 64:
+            target = (max(1, int(target[0] * 0.9)), max(1, int(target[1] * 0.9)))
+        tokens = estimate_image_tokens(*target, detail)
+        target_mime_type = f"image/{image_format.lower()}"
+        if target == (width, height) and mime_type == target_mime_type:
+            return PreparedImage(encoded_image, mime_type, width, height, tokens)
+        if image_format.upper() == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA", "L", "LA"):
+            image = image.convert("RGBA")
+        resized = image.resize(target, Image.LANCZOS) if target != (width, height) else image
+        buffer = io.BytesIO()
+        resized.save(buffer, format=image_format, optimize=True)
+    if buffer.tell() >= len(data) and estimate_image_tokens(width, height, detail) == tokens \
+            and mime_type in ("image/png", "image/jpeg"):
+        # The service would downscale the original the same way, and it is smaller.
+        return PreparedImage(encoded_image, mime_type, width, height, tokens)
+    logger.info(
+        f"Prepared image {width}x{height} {mime_type} ({len(data)} bytes) -> "
+        f"{target[0]}x{target[1]} {target_mime_type} ({buffer.tell()} bytes, ~{tokens} vision tokens)")
+    return PreparedImage(base64.b64encode(buffer.getvalue()).decode("utf-8"),
+                         target_mime_type, target[0], target[1], tokens)
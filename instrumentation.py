@@ -0,0 +1,199 @@
+"""
+Per-node and per-call instrumentation for the workflow.
+
+A Profiler collects how long each graph node takes and, for every model call, its
+wall time, token usage (from the response's usage metadata), estimated prompt size,
+payload bytes and whether it was served from the response cache. Each workflow has
+its own profiler for `analyze --profile` reports, and everything is also recorded
+in a process-wide profiler that long-running deployments can dump in the
+Prometheus text exposition format.
+"""
+
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import NamedTuple
+
+
+class NodeRecord(NamedTuple):
+    node: str
+    seconds: float
+    error: str | None = None
+
+
+class CallRecord(NamedTuple):
+    node: str
+    seconds: float
+    estimated_prompt_tokens: int
+    prompt_tokens: int | None
+    completion_tokens: int | None
+    payload_bytes: int
+    image_parts: int
+    cache_hit: bool
+    error: str | None = None
+
+
+def _empty_totals() -> dict:
+    return {
+        "runs": 0, "seconds": 0.0, "errors": 0, "calls": 0, "call_seconds": 0.0,
+        "prompt_tokens": 0, "completion_tokens": 0, "estimated_prompt_tokens": 0,
+        "payload_bytes": 0, "cache_hits": 0, "call_errors": 0,
+    }
+
+
+class Profiler:
+    """
+    Running totals per node, plus the most recent `max_records` node runs and calls for
+    detailed reports; memory stays bounded however long the process runs.
+    """
+
+    def __init__(self, max_records: int = 10000):
+        self._lock = threading.Lock()
+        self.max_records = max_records
+        self.totals: dict[str, dict] = defaultdict(_empty_totals)
+        self.nodes: deque[NodeRecord] = deque(maxlen=max_records)
+        self.calls: deque[CallRecord] = deque(maxlen=max_records)
+
+    def record_node(self, record: NodeRecord):
+        with self._lock:
+            totals = self.totals[record.node]
+            totals["runs"] += 1
+            totals["seconds"] += record.seconds
+            totals["errors"] += record.error is not None
+            self.nodes.append(record)
+
+    def record_call(self, record: CallRecord):
+        with self._lock:
+            totals = self.totals[record.node]
+            totals["calls"] += 1
+            totals["call_seconds"] += record.seconds
+            totals["prompt_tokens"] += record.prompt_tokens or 0
+            totals["completion_tokens"] += record.completion_tokens or 0
+            totals["estimated_prompt_tokens"] += record.estimated_prompt_tokens
+            totals["payload_bytes"] += record.payload_bytes
+            totals["cache_hits"] += record.cache_hit
+            totals["call_errors"] += record.error is not None
+            self.calls.append(record)
+
+    def reset(self):
+        with self._lock:
+            self.totals.clear()
+            self.nodes.clear()
+            self.calls.clear()
+
+    def summary(self) -> dict:
+        """Totals per node: node wall time plus the calls made from it."""
+        with self._lock:
+            return {node: dict(totals) for node, totals in self.totals.items()}
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            nodes, calls = list(self.nodes), list(self.calls)
+        return {
+            "nodes": self.summary(),
+            "node_runs": [record._asdict() for record in nodes],
+            "calls": [record._asdict() for record in calls],
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_markdown(self) -> str:
+        lines = [
+            "## Profile",
+            "",
+            "| Node | Runs | Wall Time (s) | LLM Calls | LLM Time (s) | Prompt Tokens | Completion Tokens "
+            "| Est. Prompt Tokens | Payload Bytes | Cache Hits | Errors |",
+            "| --- | --- | --- | --- | --- | --- | --- | --- | --- | --- | --- |",
+        ]
+        for node, totals in self.summary().items():
+            lines.append(
+                f"| {node} | {totals['runs']} | {totals['seconds']:.3f} | {totals['calls']} "
+                f"| {totals['call_seconds']:.3f} | {totals['prompt_tokens']} | {totals['completion_tokens']} "
+                f"| {totals['estimated_prompt_tokens']} | {totals['payload_bytes']} | {totals['cache_hits']} "
+                f"| {totals['errors'] + totals['call_errors']} |")
+        return "\n".join(lines) + "\n"
+
+    def to_prometheus(self, prefix: str = "azgentica") -> str:
+        """Cumulative metrics in the Prometheus text exposition format."""
+        summary = self.summary()
+        metrics = (
+            ("node_duration_seconds_sum", "counter", "Total wall time spent in each graph node.", "seconds"),
+            ("node_runs_total", "counter", "Number of graph node executions.", "runs"),
+            ("node_errors_total", "counter", "Number of graph node executions that raised.", "errors"),
+            ("llm_calls_total", "counter", "Number of model calls.", "calls"),
+            ("llm_call_duration_seconds_sum", "counter", "Total wall time of model calls.", "call_seconds"),
+            ("llm_prompt_tokens_total", "counter", "Prompt tokens reported by the model.", "prompt_tokens"),
+            ("llm_completion_tokens_total", "counter", "Completion tokens reported by the model.",
+             "completion_tokens"),
+            ("llm_estimated_prompt_tokens_total", "counter", "Prompt tokens estimated before sending.",
+             "estimated_prompt_tokens"),
+            ("llm_payload_bytes_total", "counter", "Bytes of prompt payload sent, images included.",
+             "payload_bytes"),
+            ("llm_cache_hits_total", "counter", "Model calls served from the response cache.", "cache_hits"),
+            ("llm_errors_total", "counter", "Model calls that raised.", "call_errors"),
+        )
+        lines = []
+        for name, metric_type, description, field in metrics:
+            lines.append(f"# HELP {prefix}_{name} {description}")
+            lines.append(f"# TYPE {prefix}_{name} {metric_type}")
+            for node, totals in summary.items():
+                lines.append(f'{prefix}_{name}{{node="{node}"}} {totals[field]}')
+        return "\n".join(lines) + "\n"
+
+
+# Everything recorded by any workflow in this process; only the totals are exported.
+process_profiler = Profiler(max_records=0)
+
+
+def profile_node(name: str, func, profilers: list[Profiler]):
+    """Wrap a graph node (sync or async) so its wall time is recorded, keeping LangGraph's config injection."""
+    accepts_config = "config" in inspect.signature(func).parameters
+
+    def record(started, error):
+        node_record = NodeRecord(name, time.perf_counter() - started, error)
+        for profiler in profilers:
+            profiler.record_node(node_record)
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(state, config=None):
+            started = time.perf_counter()
+            error = None
+            try:
+                return await (func(state, config) if accepts_config else func(state))
+            except Exception as e:
+                error = str(e)
+                raise
+            finally:
+                record(started, error)
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(state, config=None):
+        started = time.perf_counter()
+        error = None
+        try:
+            return func(state, config) if accepts_config else func(state)
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            record(started, error)
+
+    return wrapper
+
+
+def write_metrics_file(path: str, profiler: Profiler = process_profiler):
+    """Atomically replace `path` with the profiler's Prometheus metrics (textfile collector style)."""
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(profiler.to_prometheus())
+    os.replace(temp_path, path)
@@ -0,0 +1,120 @@
+"""
+Offline Azure pricing catalog and cost calculator.
+
+The catalog (data/azure-pricing-catalog.json) lists services with their aliases, a
+production default SKU and, per SKU, the meter, unit price, assumed monthly usage and
+instance count. Extracted nodes are mapped to catalog services through the same
+alias normalization as the WAF recommendation index, and priced in-process into
+the `json_output_format` line items. Prices are for the catalog's default region
+unless a SKU lists a regional price; other regions apply the catalog multiplier.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+from recommendations import RecommendationIndex
+
+DEFAULT_CATALOG_PATH = "data/azure-pricing-catalog.json"
+
+
+class PricingCatalog:
+    def __init__(self, catalog: dict, fingerprint: str = ""):
+        # Hash of the catalog file, so cached results priced from an older catalog are not reused.
+        self.fingerprint = fingerprint
+        self.currency = catalog.get("currency", "USD")
+        self.default_region = catalog.get("default_region", "eastus")
+        self.regions = catalog.get("regions", {self.default_region: 1.0})
+        self.services = {service["service"]: service for service in catalog["services"]}
+        rows = []
+        for service in catalog["services"]:
+            for alias in [service["service"], *service.get("aliases", [])]:
+                rows.append({"heading": alias, "content": service["service"]})
+        # Stricter than the WAF lookup: a wrong price is worse than asking the model.
+        self.index = RecommendationIndex(rows, min_coverage=0.6)
+
+    @classmethod
+    def from_json(cls, file_path: str) -> "PricingCatalog":
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"Pricing catalog not found at {file_path}")
+        with open(file_path, "rb") as f:
+            data = f.read()
+        return cls(json.loads(data), fingerprint=hashlib.sha256(data).hexdigest())
+
+    def match(self, service_label: str) -> str | None:
+        """Catalog service name for a node label, or None when it cannot be mapped."""
+        return self.index.lookup(service_label)
+
+    def sku_names(self) -> dict[str, list[str]]:
+        return {name: list(service["skus"]) for name, service in self.services.items()}
+
+    def unit_price(self, service_name: str, sku_name: str, region: str) -> float:
+        sku = self.services[service_name]["skus"][sku_name]
+        regional_prices = sku.get("prices", {})
+        if region in regional_prices:
+            return regional_prices[region]
+        return sku["unit_price"] * self.regions.get(region, 1.0)
+
+    def price(self, service_name: str, sku_name: str | None = None, count: int = 1,
+              region: str | None = None) -> dict:
+        """Cost line item for `count` resources of a catalog service."""
+        region = region or self.default_region
+        service = self.services[service_name]
+        if sku_name not in service["skus"]:
+            sku_name = service["default_sku"]
+        sku = service["skus"][sku_name]
+        unit_price = self.unit_price(service_name, sku_name, region)
+        quantity = sku.get("quantity", 1) * count
+        assumptions = f"{sku.get('assumptions', '')} ({sku['monthly_units']} x {sku['meter']} per month, {region})"
+        if region not in self.regions:
+            assumptions += f"; no regional pricing for {region}, {self.default_region} prices used"
+        return {
+            "service": service_name,
+            "sku": sku_name,
+            "quantity": quantity,
+            "unit_price": round(unit_price, 4),
+            "monthly_cost": round(unit_price * sku["monthly_units"] * quantity, 2),
+            "currency": self.currency,
+            "assumptions": assumptions.strip(),
+            "meter": sku["meter"],
+            "region": region,
+        }
+
+    def estimate(self, mappings: list[tuple[str, str | None]], region: str | None = None) -> list[dict]:
+        """Line items for (catalog service, sku) pairs, one per distinct pair, in first-seen order."""
+        counts: dict[tuple[str, str | None], int] = {}
+        for service_name, sku_name in mappings:
+            counts[(service_name, sku_name)] = counts.get(
+                (service_name, sku_name), 0) + 1
+        return [self.price(service_name, sku_name, count, region)
+                for (service_name, sku_name), count in counts.items()]
+
+
+def unpriced_item(service_label: str, currency: str = "USD") -> dict:
+    return {
+        "service": service_label,
+        "sku": None,
+        "quantity": 1,
+        "unit_price": None,
+        "monthly_cost": 0,
+        "currency": currency,
+        "assumptions": "Not found in the pricing catalog, not included in the total.",
+    }
+
+
+_catalog_cache: dict[str, tuple[float, PricingCatalog]] = {}
+_catalog_lock = threading.Lock()
+
+
+def load_pricing_catalog(file_path: str = DEFAULT_CATALOG_PATH) -> PricingCatalog:
+    """Process-wide catalog for a JSON file, reloaded only when the file changes on disk."""
+    path = os.path.abspath(file_path)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Pricing catalog not found at {file_path}")
+    mtime = os.path.getmtime(path)
+    with _catalog_lock:
+        cached = _catalog_cache.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = _catalog_cache[path] = (mtime, PricingCatalog.from_json(path))
+        return cached[1]
@@ -1,3 +1,4 @@
+import hashlib
 
 data_extraction_prompt = """
 You are a vision-language model specialized in reading architecture diagrams and extracting their components.
@@ -101,21 +102,118 @@ json_output_format = """[
     }]
 """
 
-cost_calculation_prompt = """
-    You are an expert in Azure architecture and cost estimation. Given the services in JSON format as input, \
-    Calculate the estimated monthly cost for running the services in Azure. Use existing knowledge to find the latest pricing information for each service. \
-    Provide the cost breakdown for each service and the total estimated monthly cost. Input : {state}
+service_recommendations_output_format = """
+        [
+            {
+                "service_name": "Service Name",
+                "review": "Review of the service",
+                "recommedation": "Recommendation for the service",
+                "pillar_in_review": "Pillar in review (Cost, Operational Excellence, Performance Efficiency, Reliability, Security)"
+            },
+            ...
+        ]
+        """
 
-    Output Format: {json_output_format}
+sku_inference_prompt = """
+    You are an expert in Azure architecture and pricing. The following Azure services were extracted from an architecture diagram \
+    but could not be matched to the pricing catalog by name. Map each of them to the closest service in the catalog and a SKU \
+    suitable for production workloads with high availability, or to null when the component has no cost of its own.
+
+    Services: {services}
+
+    Architecture Summary: {description}
+
+    Catalog (service -> SKUs): {catalog}
+
+    Output Format: {{"<service as given>": {{"service": "<catalog service>", "sku": "<catalog SKU>"}}, "<other service>": null}}
 
     Instructions:
-    1. Analyze the provided JSON input to identify the services and their configurations.
-    2. For each service, determine the SKU, quantity, and unit price based on Azure's pricing model.
-    3. Calculate the monthly cost for each service based on the quantity and unit price.
-    4. Assume the application will be deployed in Production mode with high availability and redundancy and suggest appropriate SKUs for production workloads.
-    5. Provide the final output in the specified JSON format
-    6. Do not include any additional text or explanations in the output, only the JSON response.
-    7. Stick to the provided JSON output format strictly.
-    
-    
+    1. Only use service and SKU names exactly as they appear in the catalog.
+    2. Include every service from the input as a key, exactly as given.
+    3. Do not include any additional text or explanations in the output, only the JSON response.
+"""
+
+
+# Appended to data_extraction_prompt for each tile of a large diagram.
+tile_extraction_prompt = """
+6. **Tiled diagram**
+- This image is tile {tile} of {tiles} of a larger diagram, covering pixels x {x0}-{x1}, y {y0}-{y1} of the full image. \
+Tiles overlap, so components near the border also appear in the neighbouring tiles.
+- Only extract the components visible in this tile, and set "description" to a short description of this tile only.
+- Add a `"position": [x, y]` field to every node with the center of the component relative to this tile, \
+as fractions between 0 and 1 (0, 0 is the top-left corner).
+- For connections that leave the tile, still add the edge, and use the label of the component at the other end \
+as its "source" or "target" if you can read it; otherwise leave the edge out.
+"""
+
+diagram_overview_prompt = """
+You are a vision-language model specialized in reading architecture diagrams. The following image is a downscaled \
+overview of a large Azure architecture diagram; its components and connections are extracted separately from \
+full-resolution tiles.
+
+Analyze the architecture as an Architect and describe it in detail so that it can be used to re-create the architecture: \
+its purpose, the main components and how they interact, and how components are grouped into subnets or zones. \
+List the information in a pointed format for clarity.
+
+Output Format: {"description": "A detailed description of the architecture diagram."}
+Do not include any additional text or explanations outside the JSON structure.
 """
+
+service_review_prompt = """
+You are an Azure Architect, given the architecture diagram and it summary, your task is to review the Azure services: {names} \
+and provide recommendations based on service recommendations shared by Microsoft as context. The recommendations should be in all 5 pillars \
+of the Azure Well-Architected Framework (WAF): Cost, Operational Excellence, Performance Efficiency, Reliability, and Security. \
+The recommendations should help improve the Well Architected Score of the architecture. \
+Review every service separately, using only its own context, and set "service_name" to the service name exactly as given.
+### Architecture Summary: {description}
+{services}
+### Output Format: {output_format}
+"""
+
+# One per service of a review call, joined into {services} above.
+service_review_context = """
+## Service: {service_name} (labelled in the diagram as: {labels})
+### Context: {context},
+### Connections of {service_name}: {connections}"""
+
+summary_prompt = """
+Summarize the results of the data extraction and cost analysis. \
+Present the results in a clear and detailed manner as an Architect. \
+Use the following data to summarize:
+
+## State Description and Data:
+- **Image Description**: Description of the architecture diagram. **Data** - {description}
+- **Nodes**: Azure services and their details. **Data** - {nodes}
+- **Edges**: Connections between the services. **Data** - {edges}
+- **Azure Services Cost**: Cost of each Azure service used in the architecture. **Data** - {costs}
+- **Total Cost**: {total_cost} per month
+- **Service Recommendations**: Recommendations for each service based on the Azure Well-Architected Framework. **Data** - {recommendations}
+- **Changes Since the Previous Revision**: Services and connections added, removed or changed, if this is a revision of an earlier diagram. **Data** - {changes}
+
+## Instructions:
+- Remember the data could be empty in few areas in the state, so handle it gracefully.
+- Only use the data provided in the state to summarize. Do not make assumptions or add any additional information from your knowledge.
+- The tables of services, costs, recommendations, nodes and edges are generated separately, do not reproduce them.
+- Keep every field short: a few sentences or bullet points in markdown.
+- If there are changes since the previous revision, start the summary with what changed and its impact on cost and risks.
+
+## Output Format:
+Return only a JSON object with the following fields:
+{{
+    "summary": "As an Azure Architect, summarize the architecture diagram. List its objectives, purpose, limitations and key risks.",
+    "cost_summary": "Summary of Azure services cost, total cost per month and the main cost drivers.",
+    "compute_cost": "Cost of the Azure compute services, in text format.",
+    "storage_cost": "Cost of the Azure storage services, in text format.",
+    "networking_cost": "Cost of the Azure networking services, in text format."
+}}
+"""
+
+
+def prompt_version() -> str:
+    """Fingerprint of every prompt the workflow sends, used in cache keys."""
+    digest = hashlib.sha256()
+    for prompt in (data_extraction_prompt, json_output_format, service_recommendations_output_format,
+                   sku_inference_prompt, tile_extraction_prompt, diagram_overview_prompt,
+                   service_review_prompt, service_review_context, summary_prompt):
+        digest.update(prompt.encode("utf-8"))
+    return digest.hexdigest()[:16]
@@ -0,0 +1,176 @@
+"""
+In-memory index over the WAF service recommendations generated by datapipeline.py.
+
+The CSV is parsed once per process and turned into an inverted index from normalized
+tokens and service aliases to section rows, so per-service lookups in the workflow
+do not rescan the file.
+"""
+
+import csv
+import math
+import os
+import re
+import threading
+from collections import defaultdict
+
+HEADING_PREFIXES = (
+    "architecture best practices for",
+    "azure well-architected framework perspective on",
+)
+
+STOPWORDS = {
+    "a", "an", "and", "for", "in", "of", "on", "the", "to", "with",
+    "azure", "microsoft", "service", "services",
+}
+
+# Abbreviations that diagrams and WAF headings use interchangeably.
+SYNONYMS = {
+    "db": "database",
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_PARENTHESIS_RE = re.compile(r"\(([^)]*)\)")
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercase, drop stopwords and fold simple plurals so 'Web Apps' matches 'Web App'."""
+    tokens = []
+    for token in _TOKEN_RE.findall(str(text).lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(SYNONYMS.get(token, token))
+    return tokens
+
+
+def service_name_from_heading(heading: str) -> str:
+    """Strip the WAF boilerplate from a section heading, leaving the service name."""
+    name = str(heading).strip()
+    lowered = name.lower()
+    for prefix in HEADING_PREFIXES:
+        if lowered.startswith(prefix):
+            name = name[len(prefix):]
+            break
+    return name.strip(" :-")
+
+
+def service_aliases(heading: str) -> set[frozenset[str]]:
+    """Normalized aliases for a section, e.g. 'App Service (Web Apps)' -> {app}, {web, app}."""
+    name = service_name_from_heading(heading)
+    aliases = {frozenset(tokenize(name)),
+               frozenset(tokenize(_PARENTHESIS_RE.sub(" ", name)))}
+    for inner in _PARENTHESIS_RE.findall(name):
+        aliases.add(frozenset(tokenize(inner)))
+    aliases.discard(frozenset())
+    return aliases
+
+
+class RecommendationIndex:
+    def __init__(self, rows: list[dict], min_coverage: float = 0.5):
+        self.rows = rows
+        self.min_coverage = min_coverage
+        self.postings: dict[str, set[int]] = defaultdict(set)
+        self.aliases: dict[frozenset[str], list[int]] = defaultdict(list)
+        self.row_tokens: list[set[str]] = []
+        for row_id, row in enumerate(rows):
+            tokens = set(tokenize(service_name_from_heading(row.get("heading", ""))))
+            self.row_tokens.append(tokens)
+            for token in tokens:
+                self.postings[token].add(row_id)
+            for alias in service_aliases(row.get("heading", "")):
+                self.aliases[alias].append(row_id)
+        total = max(len(rows), 1)
+        self.idf = {token: math.log(1 + total / len(row_ids))
+                    for token, row_ids in self.postings.items()}
+        # Tokens no section mentions are as specific as it gets, so they weigh the most.
+        self.unknown_idf = math.log(1 + total)
+
+    @classmethod
+    def from_csv(cls, file_path: str, **kwargs) -> "RecommendationIndex":
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"CSV file not found at {file_path}")
+        with open(file_path, newline="", encoding="utf-8") as f:
+            return cls(list(csv.DictReader(f)), **kwargs)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _weight(self, tokens) -> float:
+        return sum(self.idf.get(token, self.unknown_idf) for token in tokens)
+
+    def search(self, service_label: str, limit: int = 5) -> list[tuple[float, dict]]:
+        """Rank sections for a service label, best first, as (score, row) pairs."""
+        label_tokens = set(tokenize(service_label))
+        if not label_tokens:
+            return []
+        scores: dict[int, float] = defaultdict(float)
+        counts: dict[int, int] = defaultdict(int)
+        for token in label_tokens:
+            for row_id in self.postings.get(token, ()):
+                scores[row_id] += self.idf[token]
+                counts[row_id] += 1
+        # An exact alias hit always outranks partial token overlap.
+        exact = set(self.aliases.get(frozenset(label_tokens), ()))
+        label_weight = self._weight(label_tokens)
+        ranked = []
+        for row_id, matched in scores.items():
+            coverage = matched / label_weight if label_weight else 0.0
+            if row_id not in exact and not self._covers(coverage, counts[row_id], len(label_tokens)):
+                continue
+            precision = matched / (self._weight(self.row_tokens[row_id]) or 1.0)
+            score = 2 * coverage * precision / (coverage + precision)
+            if row_id in exact:
+                score += 1.0
+            ranked.append((score, row_id))
+        ranked.sort(key=lambda item: (-item[0], item[1]))
+        return [(score, self.rows[row_id]) for score, row_id in ranked[:limit]]
+
+    def _covers(self, coverage: float, matched_tokens: int, label_tokens: int) -> bool:
+        if label_tokens == 1:
+            return coverage >= self.min_coverage
+        # A multi-token label needs more than half of its tokens, by weight and by count, so
+        # one shared token ('App' in 'App Gateway') cannot pick a section on its own.
+        return coverage > self.min_coverage and matched_tokens > label_tokens / 2
+
+    def best_match(self, service_label: str) -> dict | None:
+        """Best matching section, or None when sections of two different services tie for it."""
+        matches = self.search(service_label, limit=2)
+        if not matches:
+            return None
+        if len(matches) > 1 and matches[0][0] == matches[1][0] and not self._same_service(
+                matches[0][1], matches[1][1]):
+            return None
+        return matches[0][1]
+
+    @staticmethod
+    def _same_service(row: dict, other: dict) -> bool:
+        # Several WAF sections can cover one service, and the pricing catalog indexes every
+        # alias of a service as its own row with the service name as content.
+        return row.get("content") == other.get("content") or (
+            set(tokenize(service_name_from_heading(row.get("heading", ""))))
+            == set(tokenize(service_name_from_heading(other.get("heading", "")))))
+
+    def lookup(self, service_label: str) -> str | None:
+        """Content of the best matching section, or None when nothing matches well enough."""
+        row = self.best_match(service_label)
+        return row["content"] if row else None
+
+
+_index_cache: dict[str, tuple[float, RecommendationIndex]] = {}
+_index_lock = threading.Lock()
+
+
+def load_recommendation_index(file_path: str) -> RecommendationIndex:
+    """Process-wide index for a CSV, rebuilt only when the file changes on disk."""
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(
+            f"CSV file not found at {file_path}, Run the datapipeline.py to generate the CSV file.")
+    path = os.path.abspath(file_path)
+    mtime = os.path.getmtime(path)
+    with _index_lock:
+        cached = _index_cache.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = _index_cache[path] = (
+                mtime, RecommendationIndex.from_csv(path))
+        return cached[1]
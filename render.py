@@ -0,0 +1,259 @@
+"""
+Deterministic markdown rendering of the workflow results.
+
+Tables and lists (services, costs, recommendations, nodes, edges) are rendered
+locally from GraphState, so they are exact and cost no output tokens; the model only
+writes the short narrative sections, which are merged into the same layout. While
+the narrative is being generated, NarrativeStream turns its JSON tokens into the
+same labelled markdown so it can be shown as it arrives.
+"""
+
+import json
+import re
+
+_NUMBER_RE = re.compile(r"-?\d[\d,]*(?:\.\d+)?")
+
+NARRATIVE_FIELDS = ("summary", "cost_summary", "compute_cost",
+                    "storage_cost", "networking_cost")
+
+NARRATIVE_LABELS = {
+    "summary": "Summary",
+    "cost_summary": "Summary of Azure Services Cost",
+    "compute_cost": "Azure Compute Services Cost",
+    "storage_cost": "Azure Storage Services Cost",
+    "networking_cost": "Azure Networking Services Cost",
+}
+
+_ESCAPES = {"n": "\n", "t": "\t", "r": "", "b": "", "f": "", '"': '"', "\\": "\\", "/": "/"}
+
+
+def _cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value, ensure_ascii=False)
+    return str(value).replace("|", "\\|").replace("\n", "<br>").strip()
+
+
+def markdown_table(headers: list[str], rows: list[list]) -> str:
+    if not rows:
+        return "_No data available._"
+    lines = ["| " + " | ".join(headers) + " |",
+             "| " + " | ".join("---" for _ in headers) + " |"]
+    lines += ["| " + " | ".join(_cell(value) for value in row) + " |" for row in rows]
+    return "\n".join(lines)
+
+
+def parse_amount(value) -> float | None:
+    """Numeric value of a price such as 146, '146.00' or '$1,234.50 per month'."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _NUMBER_RE.search(str(value or ""))
+    return float(match.group().replace(",", "")) if match else None
+
+
+def cost_items(costs) -> list[dict]:
+    """Cost analysis output as a list of line items, whatever shape the model returned."""
+    if not costs:
+        return []
+    if isinstance(costs, dict):
+        return [{"service": service, "monthly_cost": cost} for service, cost in costs.items()]
+    return [item for item in costs if isinstance(item, dict)]
+
+
+def total_cost(costs) -> tuple[float, str]:
+    items = cost_items(costs)
+    total = sum(parse_amount(item.get("monthly_cost")) or 0.0 for item in items)
+    currency = next((item["currency"] for item in items if item.get("currency")), "USD")
+    return round(total, 2), currency
+
+
+def render_services_table(nodes) -> str:
+    return markdown_table(
+        ["Service", "Type", "Subnet"],
+        [[node.get("label"), node.get("type"), node.get("subnet")] for node in nodes or []])
+
+
+def render_cost_table(costs) -> str:
+    return markdown_table(
+        ["Service", "SKU", "Quantity", "Unit Price", "Monthly Cost", "Currency", "Assumptions"],
+        [[item.get("service"), item.get("sku"), item.get("quantity"), item.get("unit_price"),
+          item.get("monthly_cost"), item.get("currency"), item.get("assumptions")]
+         for item in cost_items(costs)])
+
+
+def render_recommendations_table(recommendations) -> str:
+    return markdown_table(
+        ["Service Name", "Applies To", "Pillar in Review", "Review", "Recommendation"],
+        [[item.get("service_name"), ", ".join(item.get("nodes") or []), item.get("pillar_in_review"),
+          item.get("review"), item.get("recommedation", item.get("recommendation"))]
+         for item in recommendations or [] if isinstance(item, dict)])
+
+
+def render_service_review(service_name: str, recommendations) -> str:
+    """Recommendations of one service, shown as soon as its review finishes."""
+    return "\n".join([f"#### {service_name}", "", render_recommendations_table(recommendations), ""])
+
+
+class NarrativeStream:
+    """
+    Incremental decoder of the summary narrative. feed() takes the raw JSON tokens
+    of the model's response and returns the markdown to append: a "- **Label**: "
+    line start when a narrative field begins, then its decoded text. Anything
+    outside the field values (braces, keys, code fences) is not shown.
+    """
+
+    def __init__(self):
+        self._in_string = False
+        self._in_value = False
+        self._expect_value = False
+        self._escape = None  # None, "" right after a backslash, or "u" and the hex digits so far
+        self._key = []
+        self._field = None
+        self._started = False
+
+    def feed(self, text: str) -> str:
+        output = []
+        for char in text:
+            if not self._in_string:
+                if char == '"':
+                    self._in_string, self._in_value = True, self._expect_value
+                    self._key = []
+                    if self._in_value and self._field in NARRATIVE_LABELS:
+                        output.append(("\n" if self._started else "") + f"- **{NARRATIVE_LABELS[self._field]}**: ")
+                        self._started = True
+                    self._expect_value = False
+                elif char == ":" and self._field is not None:
+                    self._expect_value = True
+                elif not char.isspace():
+                    self._field, self._expect_value = None, False
+                continue
+            if self._escape is not None:
+                char = self._unescape(char)
+                if char is None:
+                    continue
+            elif char == "\\":
+                self._escape = ""
+                continue
+            elif char == '"':
+                self._in_string = False
+                self._field = None if self._in_value else "".join(self._key)
+                continue
+            if not self._in_value:
+                self._key.append(char)
+            elif self._field in NARRATIVE_LABELS:
+                output.append(char)
+        return "".join(output)
+
+    def _unescape(self, char: str) -> str | None:
+        if self._escape == "":
+            if char == "u":
+                self._escape = "u"
+                return None
+            self._escape = None
+            return _ESCAPES.get(char, char)
+        self._escape += char
+        if len(self._escape) < 5:
+            return None
+        code, self._escape = self._escape[1:], None
+        try:
+            return chr(int(code, 16))
+        except ValueError:
+            return ""
+
+
+def render_dict_list(items) -> str:
+    if not items:
+        return "_No data available._"
+    return "\n".join(f"  - `{json.dumps(item, ensure_ascii=False)}`" for item in items)
+
+
+def summarize_changes(state) -> dict | None:
+    """Labels of what changed since the previous revision, with the cost before and after."""
+    changes = state.get("changes")
+    if not changes:
+        return None
+    previous_total, currency = total_cost((state.get("previous") or {}).get("azure_services_cost"))
+    total, _ = total_cost(state.get("azure_services_cost"))
+    return {
+        "added": [node.get("label") for node in changes["added"]],
+        "removed": [node.get("label") for node in changes["removed"]],
+        "changed": [change["node"].get("label") for change in changes["changed"]],
+        "unchanged": len(changes["unchanged"]),
+        "added_edges": [" -> ".join(str(part) for part in edge[:2]) for edge in changes["added_edges"]],
+        "removed_edges": [" -> ".join(str(part) for part in edge[:2]) for edge in changes["removed_edges"]],
+        "previous_total_cost": previous_total,
+        "total_cost": total,
+        "currency": currency,
+    }
+
+
+def render_changes(state) -> list[str]:
+    summary = summarize_changes(state)
+    if summary is None:
+        return []
+    delta = summary["total_cost"] - summary["previous_total_cost"]
+
+    def listing(items):
+        return ", ".join(str(item) for item in items) if items else "None"
+
+    return [
+        "",
+        "### **Changes Since the Previous Revision**",
+        f"- **Added Services**: {listing(summary['added'])}",
+        f"- **Removed Services**: {listing(summary['removed'])}",
+        f"- **Changed Services**: {listing(summary['changed'])}",
+        f"- **Unchanged Services**: {summary['unchanged']}, reviews carried over",
+        f"- **Added Connections**: {listing(summary['added_edges'])}",
+        f"- **Removed Connections**: {listing(summary['removed_edges'])}",
+        f"- **Total Cost**: {summary['previous_total_cost']:,.2f} -> {summary['total_cost']:,.2f} "
+        f"{summary['currency']} per month ({delta:+,.2f})",
+        "",
+    ]
+
+
+def _narrative_text(value) -> str:
+    """A narrative field as text; models sometimes return lists of bullets or numbers instead."""
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value, ensure_ascii=False)
+    return str(value).strip() if value not in (None, "") else "Not available."
+
+
+def render_summary(state, narrative: dict) -> str:
+    """Full summary markdown from the state plus the model's narrative sections."""
+    total, currency = total_cost(state.get("azure_services_cost"))
+    if not isinstance(narrative, dict):
+        narrative = {"summary": narrative}
+    narrative = {field: _narrative_text(narrative.get(field)) for field in NARRATIVE_FIELDS}
+    return "\n".join([
+        "## **Architecture Summary**",
+        f"- **Summary**: {narrative['summary']}",
+        *render_changes(state),
+        "- **Services Used**:",
+        "",
+        render_services_table(state.get("nodes")),
+        "",
+        "### **Cost Analysis**",
+        f"- **Summary of Azure Services Cost**: {narrative['cost_summary']}",
+        f"- **Total Cost**: {total:,.2f} {currency} per month",
+        f"- **Azure Compute Services Cost**: {narrative['compute_cost']}",
+        f"- **Azure Storage Services Cost**: {narrative['storage_cost']}",
+        f"- **Azure Networking Services Cost**: {narrative['networking_cost']}",
+        "",
+        "## **Azure Services Cost**:",
+        "",
+        render_cost_table(state.get("azure_services_cost")),
+        "",
+        "### **Service Recommendations**",
+        "- **Recommendations**:",
+        "",
+        render_recommendations_table(state.get("service_recommendations")),
+        "",
+        "### **Nodes**",
+        "- **Nodes**:",
+        render_dict_list(state.get("nodes")),
+        "### **Edges**",
+        "- **Edges**:",
+        render_dict_list(state.get("edges")),
+        "",
+    ])
@@ -0,0 +1,189 @@
+"""
+Chunk-level semantic retrieval over the WAF service recommendations.
+
+datapipeline.py splits every extracted section into chunks and embeds them into a
+persisted Chroma collection. At review time the workflow retrieves only the chunks
+of the matched section that are most relevant to the service and the architecture,
+capped by a token budget, instead of inlining the whole section.
+
+Embeddings come from Azure OpenAI (AZURE_OPENAI_EMBEDDING_MODEL) or, with
+AZGENTICA_EMBEDDINGS=hashing, from a deterministic local stand-in that needs no
+network access.
+"""
+
+import hashlib
+import math
+import os
+import threading
+from typing import NamedTuple
+
+from langchain_core.embeddings import Embeddings
+
+from recommendations import tokenize
+from utils import estimate_tokens
+
+DEFAULT_PERSIST_DIRECTORY = "data/chroma"
+COLLECTION_NAME = "waf-recommendations"
+EMBEDDING_PROVIDERS = ("azure", "hashing")
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic bag-of-words embeddings using the hashing trick, for offline use and tests."""
+
+    def __init__(self, size: int = 512):
+        self.size = size
+
+    def _embed(self, text: str) -> list[float]:
+        vector = [0.0] * self.size
+        for token in tokenize(text):
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.size
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+
+def get_embeddings(provider: str | None = None) -> Embeddings:
+    """Embedding model for the configured provider (AZGENTICA_EMBEDDINGS, default 'azure')."""
+    provider = provider or os.getenv("AZGENTICA_EMBEDDINGS", "azure")
+    if provider == "hashing":
+        return HashingEmbeddings()
+    if provider == "azure":
+        from langchain_openai import AzureOpenAIEmbeddings
+        return AzureOpenAIEmbeddings(
+            azure_deployment=os.getenv(
+                "AZURE_OPENAI_EMBEDDING_MODEL", "text-embedding-3-small"),
+            api_version="2024-08-01-preview",
+            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+            api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        )
+    raise ValueError(
+        f"Unknown embeddings provider '{provider}', expected one of {EMBEDDING_PROVIDERS}")
+
+
+def chunk_section(content: str, chunk_size: int = 1200, chunk_overlap: int = 150) -> list[str]:
+    """Split a section on paragraph boundaries into chunks of roughly chunk_size characters."""
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    return splitter.split_text(str(content))
+
+
+def fit_to_budget(chunks: list[str], token_budget: int) -> list[str]:
+    """Keep chunks in order until the token budget is spent; always keeps at least one."""
+    selected, used = [], 0
+    for chunk in chunks:
+        tokens = estimate_tokens(chunk)
+        if selected and used + tokens > token_budget:
+            break
+        selected.append(chunk)
+        used += tokens
+    return selected
+
+
+class VectorStoreUpdate(NamedTuple):
+    added_sections: int
+    removed_sections: int
+    added_chunks: int
+    rebuilt: bool
+
+
+def build_vector_store(pages: list[dict], persist_directory: str = DEFAULT_PERSIST_DIRECTORY,
+                       provider: str | None = None, chunk_size: int = 1200, chunk_overlap: int = 150,
+                       rebuild: bool = False):
+    """
+    Chunk and embed sections into the persisted Chroma collection. Section ids are
+    content hashes, so only sections not embedded yet are added and chunks of sections
+    no longer in `pages` are deleted; the collection is rebuilt from scratch when asked
+    to, or when the embedding provider or chunking changed.
+    """
+    from langchain_chroma import Chroma
+    provider = provider or os.getenv("AZGENTICA_EMBEDDINGS", "azure")
+    settings = {"embeddings": provider, "chunk_size": chunk_size, "chunk_overlap": chunk_overlap}
+    vector_store = Chroma(
+        collection_name=COLLECTION_NAME,
+        embedding_function=get_embeddings(provider),
+        persist_directory=persist_directory,
+        collection_metadata={**settings, "hnsw:space": "cosine"},
+    )
+    metadata = vector_store._collection.metadata or {}
+    rebuild = rebuild or any(metadata.get(key) != value for key, value in settings.items())
+    if rebuild:
+        vector_store.reset_collection()
+    existing = vector_store.get(include=["metadatas"])
+    embedded: dict[str, list[str]] = {}
+    for chunk_id, chunk_metadata in zip(existing["ids"], existing["metadatas"]):
+        embedded.setdefault(chunk_metadata["section_id"], []).append(chunk_id)
+    current = {page["id"] for page in pages}
+    removed = [section_id for section_id in embedded if section_id not in current]
+    stale_chunks = [chunk_id for section_id in removed for chunk_id in embedded[section_id]]
+    if stale_chunks:
+        vector_store.delete(ids=stale_chunks)
+    texts, metadatas, ids = [], [], []
+    added = 0
+    for page in pages:
+        if page["id"] in embedded:
+            continue
+        embedded[page["id"]] = []
+        added += 1
+        for position, chunk in enumerate(chunk_section(page["content"], chunk_size, chunk_overlap)):
+            texts.append(chunk)
+            metadatas.append({"section_id": page["id"], "heading": page["heading"],
+                              "position": position})
+            ids.append(f"{page['id']}-{position}")
+    if texts:
+        vector_store.add_texts(texts=texts, metadatas=metadatas, ids=ids)
+    return vector_store, VectorStoreUpdate(added, len(removed), len(texts), rebuild)
+
+
+class RecommendationRetriever:
+    def __init__(self, persist_directory: str = DEFAULT_PERSIST_DIRECTORY):
+        import chromadb
+        from langchain_chroma import Chroma
+        client = chromadb.PersistentClient(path=persist_directory)
+        # Query with the same embeddings the collection was built with.
+        metadata = client.get_collection(COLLECTION_NAME).metadata or {}
+        self.vector_store = Chroma(
+            collection_name=COLLECTION_NAME,
+            embedding_function=get_embeddings(
+                metadata.get("embeddings")),
+            client=client,
+        )
+
+    def retrieve(self, heading: str, query: str, k: int = 6, token_budget: int = 1500) -> list[str]:
+        """Top-k chunks of one section for a query, trimmed to the token budget."""
+        documents = self.vector_store.similarity_search(
+            query, k=k, filter={"heading": heading})
+        documents = documents[:len(fit_to_budget(
+            [document.page_content for document in documents], token_budget))]
+        # Selected chunks go back into document order, which reads better and keeps
+        # prompts stable for the response cache.
+        documents.sort(key=lambda document: document.metadata["position"])
+        return [document.page_content for document in documents]
+
+
+_retriever_cache: dict[str, RecommendationRetriever] = {}
+_retriever_lock = threading.Lock()
+
+
+def load_retriever(persist_directory: str = DEFAULT_PERSIST_DIRECTORY) -> RecommendationRetriever | None:
+    """Process-wide retriever for a persisted store, or None when the store has not been built."""
+    if not os.path.isdir(persist_directory):
+        return None
+    from chromadb.errors import NotFoundError
+    path = os.path.abspath(persist_directory)
+    with _retriever_lock:
+        if path not in _retriever_cache:
+            try:
+                _retriever_cache[path] = RecommendationRetriever(path)
+            except (NotFoundError, ValueError):
+                # The directory exists but the pipeline has not written the collection yet;
+                # not cached, so a store built later is picked up.
+                return None
+        return _retriever_cache[path]
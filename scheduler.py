@@ -0,0 +1,298 @@
+"""
+Rate-limit-aware scheduling of model calls.
+
+Every workflow in a process that calls the same deployment shares one
+RateLimitScheduler. Before a call is sent it takes a request from a
+requests-per-minute bucket and its estimated tokens (prompt text, images and an
+allowance for the completion) from a tokens-per-minute bucket; once the model
+reports its actual usage the difference is settled, so the buckets track what the
+deployment really counts. Waiting calls are served by priority, interactive runs
+before batch jobs, and in arrival order within a priority.
+
+Throttled calls (HTTP 429) are retried after the server's retry-after plus a
+jittered backoff, and every other call to the deployment is held back for the
+retry-after too, instead of piling onto a deployment that is already over its
+quota. Transient server and connection errors are retried with backoff alone.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+
+from images import estimate_image_tokens
+from serialization import measure_prompt
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE, BATCH = 0, 1
+PRIORITIES = {"interactive": INTERACTIVE, "batch": BATCH}
+
+# Vision tokens of the largest high detail image, counted for every image part.
+IMAGE_TOKEN_ESTIMATE = estimate_image_tokens(3072, 2048)
+
+# Longest a waiting call sleeps before checking the queue again, should a wake-up be missed.
+MAX_SLEEP_SECONDS = 0.25
+
+_TRANSIENT_STATUS_CODES = (408, 500, 502, 503, 504)
+
+
+def status_code(error: Exception) -> int | None:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def retry_after_seconds(error: Exception) -> float | None:
+    """Delay the server asked for, from the retry-after-ms or retry-after header."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or getattr(error, "headers", None) or {}
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(header)
+        if value is None:
+            continue
+        try:
+            return max(0.0, float(value) * scale)
+        except (TypeError, ValueError):
+            # retry-after can also be an HTTP date; fall back to backoff.
+            continue
+    return None
+
+
+def is_transient(error: Exception) -> bool:
+    if status_code(error) in _TRANSIENT_STATUS_CODES:
+        return True
+    try:
+        import openai
+    except ImportError:
+        return isinstance(error, (ConnectionError, TimeoutError))
+    return isinstance(error, (ConnectionError, TimeoutError, openai.APIConnectionError))
+
+
+class TokenBucket:
+    """Up to `per_minute` units, refilled continuously; a budget of 0 never limits."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.available = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` can be taken; a call larger than the bucket waits for a full one."""
+        if not self.capacity:
+            return 0.0
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.available
+        return missing * 60 / self.capacity if missing > 0 else 0.0
+
+    def take(self, amount: float):
+        # May go negative: oversized calls and under-estimates are paid back by waiting longer.
+        if self.capacity:
+            self.available = min(self.capacity, self.available - amount)
+
+
+class RateLimitScheduler:
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0, max_retries: int = 5,
+                 backoff_seconds: float = 1.0, max_backoff_seconds: float = 60.0, seed: int | None = None):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        # Guards the buckets and the queue; waiting threads are woken through it when the
+        # head of the queue changes, waiting coroutines through their own events.
+        self._condition = threading.Condition()
+        self._async_waiters: set[tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+        self._waiting: list[tuple[int, int]] = []
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self._random = random.Random(seed)
+        self.stats = {"calls": 0, "throttled": 0, "retries": 0, "wait_seconds": 0.0}
+
+    def _wake(self):
+        """Let every waiter check the queue again; call with the condition held."""
+        self._condition.notify_all()
+        for loop, event in self._async_waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def _enqueue(self, priority: int) -> tuple[int, int]:
+        ticket = (priority, next(self._sequence))
+        with self._condition:
+            heapq.heappush(self._waiting, ticket)
+            if self._waiting[0] == ticket:
+                # A new head (e.g. an interactive call) goes first; the old head waits its turn.
+                self._wake()
+        return ticket
+
+    def _abandon(self, ticket: tuple[int, int]):
+        with self._condition:
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._wake()
+
+    def _try_acquire(self, ticket: tuple[int, int], tokens: int) -> float | None:
+        """0 once the call may be sent, how long to wait when it is first in line, or None
+        to wait until the head of the queue changes; call with the condition held."""
+        now = time.monotonic()
+        if self._waiting[0] != ticket:
+            # Only the first call in line takes from the buckets, so a large batch call
+            # cannot be overtaken forever and interactive calls go first.
+            return None
+        if self._paused_until > now:
+            return self._paused_until - now
+        wait = max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+        if wait:
+            return wait
+        heapq.heappop(self._waiting)
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        self.stats["calls"] += 1
+        # The next call in line may go right away.
+        self._wake()
+        return 0.0
+
+    def _waited(self, started: float):
+        with self._condition:
+            self.stats["wait_seconds"] += time.monotonic() - started
+
+    def acquire(self, tokens: int, priority: int = INTERACTIVE):
+        ticket, started = self._enqueue(priority), time.monotonic()
+        try:
+            with self._condition:
+                while (wait := self._try_acquire(ticket, tokens)) != 0:
+                    self._condition.wait(MAX_SLEEP_SECONDS if wait is None else min(wait, MAX_SLEEP_SECONDS))
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        self._waited(started)
+
+    async def aacquire(self, tokens: int, priority: int = INTERACTIVE):
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        ticket, started = self._enqueue(priority), time.monotonic()
+        try:
+            while True:
+                with self._condition:
+                    waiter[1].clear()
+                    wait = self._try_acquire(ticket, tokens)
+                    if wait == 0:
+                        break
+                    self._async_waiters.add(waiter)
+                try:
+                    await asyncio.wait_for(
+                        waiter[1].wait(), MAX_SLEEP_SECONDS if wait is None else min(wait, MAX_SLEEP_SECONDS))
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        finally:
+            with self._condition:
+                self._async_waiters.discard(waiter)
+        self._waited(started)
+
+    def settle(self, estimated: int, actual: int | None):
+        """Correct the token bucket once the actual usage of a call is known."""
+        if actual is not None:
+            with self._condition:
+                self.tokens.take(actual - estimated)
+                if actual < estimated:
+                    # Tokens were handed back; the head of the queue may fit now.
+                    self._wake()
+
+    def retry_delay(self, error: Exception, attempt: int, tokens: int) -> float | None:
+        """Seconds to wait before retrying a failed call, or None when it should not be retried."""
+        throttled = status_code(error) == 429
+        if attempt >= self.max_retries or not (throttled or is_transient(error)):
+            return None
+        backoff = self._random.uniform(0, min(self.max_backoff_seconds, self.backoff_seconds * 2 ** attempt))
+        retry_after = retry_after_seconds(error) if throttled else None
+        with self._condition:
+            self.stats["retries"] += 1
+            if throttled:
+                self.stats["throttled"] += 1
+                # A throttled request is not counted against the quota, and nothing else
+                # is sent to the deployment until it said it would accept requests again.
+                self.tokens.take(-tokens)
+                self._paused_until = max(self._paused_until, time.monotonic() + (retry_after or backoff))
+        # Jitter on top of retry-after, so throttled calls do not all come back at once.
+        delay = (retry_after or 0.0) + backoff
+        logger.warning(f"Model call failed ({error}), retry {attempt + 1}/{self.max_retries} in {delay:.2f}s")
+        return delay
+
+    def call(self, func, tokens: int, priority: int = INTERACTIVE):
+        for attempt in itertools.count():
+            self.acquire(tokens, priority)
+            try:
+                return func()
+            except Exception as e:
+                delay = self.retry_delay(e, attempt, tokens)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+
+    async def acall(self, func, tokens: int, priority: int = INTERACTIVE):
+        for attempt in itertools.count():
+            await self.aacquire(tokens, priority)
+            try:
+                return await func()
+            except Exception as e:
+                delay = self.retry_delay(e, attempt, tokens)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+
+
+_schedulers: dict[tuple, RateLimitScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(name: str, requests_per_minute: int = 0, tokens_per_minute: int = 0,
+                  max_retries: int = 5) -> RateLimitScheduler:
+    """Process-wide scheduler for a deployment and its budgets."""
+    key = (name, requests_per_minute, tokens_per_minute, max_retries)
+    with _schedulers_lock:
+        if key not in _schedulers:
+            _schedulers[key] = RateLimitScheduler(requests_per_minute, tokens_per_minute, max_retries)
+        return _schedulers[key]
+
+
+class ScheduledChatModel:
+    """Wraps a chat model so invoke() and ainvoke() are paced and retried by a RateLimitScheduler."""
+
+    def __init__(self, llm, scheduler: RateLimitScheduler, priority: int = INTERACTIVE,
+                 completion_tokens: int = 500):
+        self.llm = llm
+        self.scheduler = scheduler
+        self.priority = priority
+        self.completion_tokens = completion_tokens
+
+    def estimate(self, messages) -> int:
+        size = measure_prompt(messages)
+        return size.text_tokens + size.image_parts * IMAGE_TOKEN_ESTIMATE + self.completion_tokens
+
+    @staticmethod
+    def usage(result) -> int | None:
+        return (getattr(result, "usage_metadata", None) or {}).get("total_tokens")
+
+    def invoke(self, messages, **kwargs):
+        tokens = self.estimate(messages)
+        result = self.scheduler.call(lambda: self.llm.invoke(messages, **kwargs), tokens, self.priority)
+        self.scheduler.settle(tokens, self.usage(result))
+        return result
+
+    async def ainvoke(self, messages, **kwargs):
+        tokens = self.estimate(messages)
+        result = await self.scheduler.acall(lambda: self.llm.ainvoke(messages, **kwargs), tokens, self.priority)
+        self.scheduler.settle(tokens, self.usage(result))
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
@@ -0,0 +1,74 @@
+"""
+Indexed local store of the extracted WAF sections.
+
+Sections are identified by a hash of their heading and content, so the same text
+always gets the same id across pipeline runs. sync() upserts a fresh extraction:
+sections whose id is already stored are left untouched, new ones are inserted and
+sections that disappeared from the corpus are deleted. The ids of what changed are
+returned, so derived artifacts (the CSV export, the vector store) only need to be
+refreshed when something changed. The workflow reads the CSV export, not this store.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import NamedTuple
+
+DEFAULT_STORE_PATH = "data/azure-service-recommendations.sqlite"
+
+
+def section_id(heading: str, content: str) -> str:
+    """Stable content address of a section."""
+    digest = hashlib.sha256()
+    digest.update(heading.encode("utf-8"))
+    digest.update(b"\0" + content.encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+class SyncResult(NamedTuple):
+    added: list[str]
+    unchanged: list[str]
+    removed: list[str]
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added or self.removed)
+
+
+class SectionStore:
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS sections ("
+            "id TEXT PRIMARY KEY, heading TEXT NOT NULL, content TEXT NOT NULL, "
+            "position INTEGER NOT NULL, updated_at REAL NOT NULL)")
+        self._connection.commit()
+
+    def ids(self) -> set[str]:
+        with self._lock:
+            return {row[0] for row in self._connection.execute("SELECT id FROM sections")}
+
+    def sync(self, pages: list[dict]) -> SyncResult:
+        """Make the store hold exactly these sections, touching only what changed."""
+        stored = self.ids()
+        current = {}
+        for page in pages:
+            current.setdefault(page["id"], page)
+        added = [id_ for id_ in current if id_ not in stored]
+        removed = sorted(stored - current.keys())
+        now = time.time()
+        with self._lock:
+            with self._connection:
+                self._connection.executemany(
+                    "DELETE FROM sections WHERE id = ?", [(id_,) for id_ in removed])
+                self._connection.executemany(
+                    "INSERT INTO sections (id, heading, content, position, updated_at) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET position = excluded.position",
+                    [(id_, page["heading"], page["content"], position, now)
+                     for position, (id_, page) in enumerate(current.items())])
+        return SyncResult(added, [id_ for id_ in current if id_ in stored], removed)
@@ -0,0 +1,72 @@
+"""
+Prompt-side serialization of GraphState.
+
+Each node only gets the state fields it needs, rendered as compact JSON, instead of
+the repr of the whole state (which would include the base64 image and the message
+history). measure_prompt reports how large a prompt is before it is sent.
+"""
+
+import json
+from typing import NamedTuple
+
+from utils import estimate_tokens
+
+# Fields of a node worth sending to the model; ids are enough to resolve edges.
+NODE_FIELDS = ("id", "type", "label", "subnet")
+EDGE_FIELDS = ("source", "target", "label", "metadata")
+
+
+class PromptSize(NamedTuple):
+    text_chars: int
+    text_tokens: int
+    image_parts: int
+    payload_bytes: int
+
+
+def to_compact_json(value) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def _drop_empty(item: dict, fields: tuple[str, ...]) -> dict:
+    return {field: item[field] for field in fields if item.get(field) not in (None, "", {}, [])}
+
+
+def project_nodes(nodes) -> list[dict]:
+    return [_drop_empty(node, NODE_FIELDS) for node in nodes or []]
+
+
+def project_edges(edges) -> list[dict]:
+    return [_drop_empty(edge, EDGE_FIELDS) for edge in edges or []]
+
+
+def project_state(state, fields: tuple[str, ...]) -> dict:
+    """Subset of the state a node needs, with nodes and edges trimmed to their useful fields."""
+    projection = {}
+    for field in fields:
+        value = state.get(field)
+        if field == "nodes":
+            value = project_nodes(value)
+        elif field == "edges":
+            value = project_edges(value)
+        projection[field] = value
+    return projection
+
+
+def measure_prompt(messages) -> PromptSize:
+    """Text size, number of inline images and total payload bytes of a list of messages."""
+    text_chars, text_tokens, image_parts, payload_bytes = 0, 0, 0, 0
+    for message in messages:
+        content = message.content
+        for part in [content] if isinstance(content, str) else content:
+            if isinstance(part, str):
+                text = part
+            elif part.get("type") == "text":
+                text = part["text"]
+            else:
+                image_parts += 1
+                payload_bytes += len(part.get("image_url", {}).get("url", ""))
+                continue
+            text_chars += len(text)
+            text_tokens += estimate_tokens(text)
+            payload_bytes += len(text.encode("utf-8"))
+    return PromptSize(text_chars, text_tokens, image_parts, payload_bytes)
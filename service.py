@@ -0,0 +1,354 @@
+"""
+Headless HTTP job service around AzureArchitectureWorkflow.
+
+Uploaded diagrams become jobs on a bounded queue, drained by a fixed number of
+workers that run the async graph on the process-wide event loop, so many diagrams
+are analyzed at once by one process and one pooled client. Every job records its
+progress (status changes, progress messages, finished nodes and service reviews) as events, which are
+replayed and then streamed live over server-sent events.
+
+    POST /jobs                 multipart upload of one or more "file" fields -> 202 with the jobs
+    GET  /jobs                 all jobs and their status
+    GET  /jobs/{id}            status and progress of a job
+    GET  /jobs/{id}/result     nodes, edges, costs, recommendations and summary of a finished job
+    GET  /jobs/{id}/events     server-sent events of the job until it finishes
+    GET  /health               queue and worker status
+
+Finished jobs are kept in memory, the oldest evicted past a limit; results are
+also in the workflow's result cache.
+"""
+
+import asyncio
+import base64
+import io
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+import click
+
+from clients import submit_coroutine
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ("queued", "running", "completed", "failed")
+UPLOAD_FORMATS = ("PNG", "JPEG", "WEBP")
+
+
+class QueueFull(Exception):
+    """The job queue is at capacity."""
+
+
+def image_format(data: bytes) -> str | None:
+    """Format of an uploaded image, or None when Pillow cannot read it."""
+    from PIL import Image, UnidentifiedImageError
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            return image.format
+    except (UnidentifiedImageError, OSError):
+        return None
+
+
+async def read_upload(upload, max_bytes: int) -> bytes | None:
+    """Contents of an uploaded file, or None as soon as it turns out larger than max_bytes."""
+    if upload.size is not None and upload.size > max_bytes:
+        return None
+    chunks, size = [], 0
+    while chunk := await upload.read(1024 * 1024):
+        size += len(chunk)
+        if size > max_bytes:
+            return None
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+class Job:
+    def __init__(self, filename: str, encoded_image: str, use_cache: bool, priority: str):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.encoded_image = encoded_image
+        self.use_cache = use_cache
+        self.priority = priority
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.nodes_completed: list[str] = []
+        self.error = None
+        self.result = None
+        self.events: list[dict] = []
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def publish(self, event: str, data: dict):
+        """Record an event and wake up the event streams; call on the server loop."""
+        if event == "node":
+            self.nodes_completed.append(data["node"])
+        self.events.append({"event": event, "data": data})
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def set_status(self, status: str, **data):
+        self.status = status
+        self.publish("status", {"status": status, **data})
+
+    async def wait(self):
+        await self._changed.wait()
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "priority": self.priority,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "nodes_completed": list(self.nodes_completed),
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """Bounded queue of jobs and the workers that run them."""
+
+    def __init__(self, workflow_factory, workers: int = 4, queue_size: int = 100, max_jobs: int = 1000):
+        self.workflow_factory = workflow_factory
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.jobs: dict[str, Job] = {}
+        self._workflows = {}
+        self._workflows_lock = threading.Lock()
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._tasks: list[asyncio.Task] = []
+        self._loop = None
+
+    def workflow(self, priority: str):
+        """One workflow per priority, shared by every job; clients, graphs and indexes are process-wide."""
+        if priority not in self._workflows:
+            # Workers ask for it from their own threads; only the first builds and warms it up.
+            with self._workflows_lock:
+                if priority not in self._workflows:
+                    self._workflows[priority] = self.workflow_factory(priority).warm_up()
+        return self._workflows[priority]
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._tasks = [asyncio.create_task(self._worker(), name=f"azgentica-job-worker-{i}")
+                       for i in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def submit(self, job: Job) -> Job:
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFull(f"The job queue is full ({self._queue.maxsize} jobs), try again later.")
+        self.jobs[job.id] = job
+        job.set_status("queued")
+        self._evict()
+        return job
+
+    def _evict(self):
+        finished = [job for job in self.jobs.values() if job.finished]
+        for job in sorted(finished, key=lambda job: job.finished_at)[:max(0, len(self.jobs) - self.max_jobs)]:
+            del self.jobs[job.id]
+
+    def health(self) -> dict:
+        counts = {status: 0 for status in JOB_STATUSES}
+        for job in self.jobs.values():
+            counts[job.status] += 1
+        return {"workers": self.workers, "queued": self._queue.qsize(), "queue_size": self._queue.maxsize,
+                "jobs": counts}
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job):
+        job.started_at = time.time()
+        job.set_status("running")
+        # Callbacks fire on the workflow's event loop; events are recorded on the server loop.
+        publish = lambda event, data: self._loop.call_soon_threadsafe(job.publish, event, data)
+        try:
+            workflow = await asyncio.to_thread(self.workflow, job.priority)
+            values = await asyncio.wrap_future(submit_coroutine(workflow.arun(
+                job.encoded_image, use_cache=job.use_cache,
+                on_message=lambda text: publish("message", {"message": text}),
+                on_node=lambda node: publish("node", {"node": node}),
+                on_review=lambda service_name, recommendations: publish(
+                    "review", {"service_name": service_name, "recommendations": recommendations}))))
+            job.result = workflow.previous_state(values)
+            # Runs with failed reviews or no summary fail, like in batch mode, keeping what they produced.
+            if not workflow.is_complete(values):
+                job.error = f"Incomplete analysis ({workflow.incomplete_reason(values)})"
+        except Exception as e:
+            job.error = str(e)
+        finally:
+            # The image is not needed any more, and results are small.
+            job.encoded_image = None
+            # Let events published from the workflow's loop land before the final status.
+            await asyncio.sleep(0)
+        job.finished_at = time.time()
+        if job.error is None:
+            job.set_status("completed")
+        else:
+            logger.error(f"Job {job.id} ({job.filename}) failed: {job.error}")
+            job.set_status("failed", error=job.error)
+
+
+def sse_message(event: dict) -> str:
+    return f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+def create_app(workflow_factory=None, workers: int | None = None, queue_size: int | None = None,
+               max_jobs: int | None = None, max_upload_bytes: int | None = None):
+    """Starlette app of the job service; workflow_factory(priority) builds the workflows, e.g. with a fake model."""
+    from contextlib import asynccontextmanager
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse, StreamingResponse
+    from starlette.routing import Route
+
+    if workflow_factory is None:
+        from workflow import AzureArchitectureWorkflow
+        workflow_factory = lambda priority: AzureArchitectureWorkflow(priority=priority)
+    manager = JobManager(
+        workflow_factory,
+        workers=workers or int(os.getenv("AZGENTICA_SERVICE_WORKERS", "4")),
+        queue_size=queue_size or int(os.getenv("AZGENTICA_SERVICE_QUEUE_SIZE", "100")),
+        max_jobs=max_jobs or int(os.getenv("AZGENTICA_SERVICE_MAX_JOBS", "1000")))
+    max_upload_bytes = max_upload_bytes or int(os.getenv("AZGENTICA_SERVICE_MAX_UPLOAD_MB", "20")) * 1024 * 1024
+
+    def error(status_code: int, message: str) -> JSONResponse:
+        return JSONResponse({"error": message}, status_code=status_code)
+
+    def get_job(request):
+        return manager.jobs.get(request.path_params["job_id"])
+
+    async def submit_jobs(request):
+        form = await request.form()
+        files = form.getlist("file")
+        if not files or any(isinstance(upload, str) for upload in files):
+            return error(400, "Upload one or more diagrams as multipart 'file' fields.")
+        use_cache = str(form.get("use_cache", "true")).lower() not in ("0", "off", "false")
+        priority = str(form.get("priority", "batch"))
+        if priority not in ("interactive", "batch"):
+            return error(400, f"priority must be 'interactive' or 'batch', got '{priority}'")
+        uploads = []
+        for upload in files:
+            data = await read_upload(upload, max_upload_bytes)
+            if data is None:
+                return error(413, f"{upload.filename} is larger than {max_upload_bytes // (1024 * 1024)} MB.")
+            if image_format(data) not in UPLOAD_FORMATS:
+                return error(415, f"{upload.filename} is not a PNG, JPEG or WebP image.")
+            uploads.append((upload.filename, base64.b64encode(data).decode("utf-8")))
+        jobs = []
+        for filename, encoded_image in uploads:
+            try:
+                jobs.append(manager.submit(Job(filename, encoded_image, use_cache, priority)))
+            except QueueFull as e:
+                return JSONResponse({"error": str(e), "jobs": [job.to_dict() for job in jobs]}, status_code=503,
+                                    headers={"Retry-After": "30"})
+        return JSONResponse({"jobs": [job.to_dict() for job in jobs]}, status_code=202)
+
+    async def list_jobs(request):
+        return JSONResponse({"jobs": [job.to_dict() for job in manager.jobs.values()]})
+
+    async def job_status(request):
+        job = get_job(request)
+        if job is None:
+            return error(404, "Job not found.")
+        return JSONResponse(job.to_dict())
+
+    async def job_result(request):
+        job = get_job(request)
+        if job is None:
+            return error(404, "Job not found.")
+        # A failed job has a result too: the error, and whatever the run produced before failing.
+        if not job.finished:
+            return JSONResponse({**job.to_dict(), "result": None}, status_code=409)
+        return JSONResponse({**job.to_dict(), "result": job.result})
+
+    async def job_events(request):
+        job = get_job(request)
+        if job is None:
+            return error(404, "Job not found.")
+
+        async def stream():
+            sent = 0
+            while True:
+                while sent < len(job.events):
+                    yield sse_message(job.events[sent])
+                    sent += 1
+                if job.finished:
+                    return
+                try:
+                    await asyncio.wait_for(job.wait(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle stream.
+                    yield ": keep-alive\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    async def health(request):
+        return JSONResponse(manager.health())
+
+    @asynccontextmanager
+    async def lifespan(app):
+        manager.start()
+        yield
+        await manager.stop()
+
+    app = Starlette(routes=[
+        Route("/jobs", submit_jobs, methods=["POST"]),
+        Route("/jobs", list_jobs, methods=["GET"]),
+        Route("/jobs/{job_id}", job_status),
+        Route("/jobs/{job_id}/result", job_result),
+        Route("/jobs/{job_id}/events", job_events),
+        Route("/health", health),
+    ], lifespan=lifespan)
+    app.state.manager = manager
+    return app
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", show_default=True, help="Interface to listen on.")
+@click.option("--port", default=8000, show_default=True, type=int, help="Port to listen on.")
+@click.option("--workers", "-w", default=None, type=int,
+              help="Diagrams analyzed at once. Defaults to AZGENTICA_SERVICE_WORKERS or 4.")
+@click.option("--queue_size", default=None, type=int,
+              help="Jobs waiting beyond the workers before uploads are refused. Defaults to AZGENTICA_SERVICE_QUEUE_SIZE or 100.")
+@click.option("--fake_llm", is_flag=True,
+              help="Answer with the local fake model instead of Azure OpenAI, for integration testing.")
+@click.option("--fake_latency", default=0.5, show_default=True, type=float,
+              help="Latency per call of the fake model, in seconds.")
+def serve(host, port, workers, queue_size, fake_llm, fake_latency):
+    """
+    Run the HTTP job service.
+    """
+    import uvicorn
+    workflow_factory = None
+    if fake_llm:
+        from fake_llm import FakeChatModel
+        from workflow import AzureArchitectureWorkflow
+        model = FakeChatModel(latency=fake_latency)
+        workflow_factory = lambda priority: AzureArchitectureWorkflow(llm_client=model, priority=priority)
+    uvicorn.run(create_app(workflow_factory, workers=workers, queue_size=queue_size), host=host, port=port)
+
+
+if __name__ == "__main__":
+    serve()
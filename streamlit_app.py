@@ -1,12 +1,31 @@
 import base64
+import queue
+from concurrent.futures import Future, ThreadPoolExecutor
+
 import streamlit as st
-from workflow import AzureArchitectureWorkflow
-from langchain_community.callbacks.streamlit import StreamlitCallbackHandler
+
+
+@st.cache_resource(show_spinner=False)
+def workflow_loader() -> Future:
+    """
+    One workflow per server process, shared by every session: the LLM client, compiled
+    graphs and WAF, pricing and vector store indexes are built once. The heavy imports
+    and the build run in the background, so the page renders while they load.
+    """
+    def load():
+        from workflow import AzureArchitectureWorkflow
+        return AzureArchitectureWorkflow().warm_up()
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="azgentica-warm-up")
+    future = executor.submit(load)
+    executor.shutdown(wait=False)
+    return future
+
 
 st.set_page_config(
     page_icon=":parrot:",
     layout="wide",
     page_title="Azgentica - Azure Architecture Analyzer")
+workflow_loader()
 st.title("🦜🔗 Azgentica")
 st.markdown(
     "An AI-powered tool to analyze Azure architecture diagrams and extract key components and relationships."
@@ -36,6 +55,17 @@ with st.sidebar:
         uploaded_image = st.file_uploader(
             "Choose an image...", type=["jpg", "jpeg", "png"])
 
+        use_cache = st.checkbox(
+            "Use cached results", value=True,
+            help="Reuse the result of an earlier analysis of the same diagram.")
+        refresh_cache = st.checkbox(
+            "Refresh cache", value=False,
+            help="Run the analysis again and replace the cached result.")
+        compare_previous = st.checkbox(
+            "Compare with previous upload", value=False,
+            help="Treat this diagram as a revision of the last one analyzed: only added or changed "
+                 "services are re-analyzed, and the summary highlights what changed.")
+
         submitted = st.form_submit_button("Generate Summary")
 
 if uploaded_image:
@@ -48,20 +78,51 @@ if "chat_history" not in st.session_state:
 if submitted and uploaded_image:
     encoded_image = base64.b64encode(
         uploaded_image.getvalue()).decode("utf-8")
-    workflow = AzureArchitectureWorkflow()
-    graph = workflow.graph_builder()
-    with st.status("Processing..."):
-        for chunk in graph.stream(
-                {
-                    "uploaded_image": encoded_image,
-                }, stream_mode=["values"]):
-            values = chunk[1]
-            if "messages" in values.keys() and values["messages"]:
-                st.status(values["messages"][-1].content[0]
-                          ["text"], state="complete")
+    from clients import submit_coroutine
+    from render import render_service_review
+    try:
+        workflow = workflow_loader().result()
+    except Exception as e:
+        # Not cached, so the next submit tries again.
+        workflow_loader.clear()
+        st.error(f"Could not start the analysis workflow: {e}")
+        st.stop()
+    # Re-submitting a diagram whose analysis failed resumes it from the last completed node.
+    # The run is awaited on the shared event loop; its progress, finished reviews and summary
+    # tokens are handed back through a queue because Streamlit can only render from the script thread.
+    status = st.status("Processing...")
+    reviews_area = st.expander("Service reviews", expanded=False)
+    summary_area = st.empty()
+    summary_text = ""
+    with status:
+        progress = queue.Queue()
+        run = submit_coroutine(workflow.arun(
+            encoded_image, use_cache=use_cache, refresh_cache=refresh_cache,
+            on_message=lambda text: progress.put(("message", text)),
+            on_token=lambda text: progress.put(("token", text)),
+            on_review=lambda service_name, recommendations: progress.put(
+                ("review", (service_name, recommendations))),
+            previous=st.session_state.get("previous_state") if compare_previous else None))
+        while not run.done() or not progress.empty():
+            try:
+                kind, payload = progress.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if kind == "message":
+                st.status(payload, state="complete")
+            elif kind == "review":
+                reviews_area.markdown(render_service_review(*payload))
+            else:
+                summary_text += payload
+                summary_area.markdown(summary_text)
+        try:
+            last_chunk_values = run.result()
+        except Exception as e:
+            st.status(
+                f"Processing failed: {e}. Submit again to resume from the last completed step.", state="error")
+            st.stop()
         st.status(
             "Processing completed. Displaying results...", state="complete")
-        # Use the last chunk to display the summary
-    last_chunk_values = chunk[1]
+    st.session_state.previous_state = workflow.previous_state(last_chunk_values)
     if "summary" in last_chunk_values.keys() and last_chunk_values["summary"]:
-        st.markdown(last_chunk_values["summary"])
+        summary_area.markdown(last_chunk_values["summary"])
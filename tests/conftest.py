@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Data paths in the workflow and pipeline are relative to the repository root.
+os.chdir(ROOT)
+os.environ.setdefault("AZURE_OPENAI_API_KEY", "test")
+os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://test.openai.azure.com")
+
+RECOMMENDATIONS_CSV = """id,heading,content
+1,Architecture best practices for Azure App Service (Web Apps),"Use zone redundancy."
+2,Azure Well-Architected Framework perspective on Azure Key Vault,"Rotate secrets."
+"""
+
+
+@pytest.fixture
+def workflow_environment(tmp_path, monkeypatch):
+    """Every cache, checkpoint and data file of the workflows under tmp_path."""
+    recommendations = tmp_path / "recommendations.csv"
+    recommendations.write_text(RECOMMENDATIONS_CSV)
+    monkeypatch.setenv("AZGENTICA_RECOMMENDATIONS_CSV", str(recommendations))
+    monkeypatch.setenv("AZGENTICA_VECTOR_STORE", str(tmp_path / "chroma"))
+    monkeypatch.setenv("AZGENTICA_CHECKPOINT_PATH", str(tmp_path / "checkpoints.sqlite"))
+    monkeypatch.setenv("AZGENTICA_RESULT_CACHE_DIR", str(tmp_path / "results"))
+    monkeypatch.setenv("AZGENTICA_LLM_CACHE", "off")
+    monkeypatch.setenv("AZGENTICA_LLM_MAX_RETRIES", "0")
@@ -0,0 +1,71 @@
+import asyncio
+import base64
+import json
+import os
+
+from batch import arun_batch, discover_images, run_batch
+
+
+class StubWorkflow:
+    """Summarizes a diagram as its file contents, so each summary can be traced back to its image."""
+
+    is_complete = staticmethod(lambda state: bool(state.get("summary")))
+    incomplete_reason = staticmethod(lambda state: "No summary generated.")
+
+    @staticmethod
+    def encode_image(image_path):
+        with open(image_path, "rb") as f:
+            return base64.b64encode(f.read()).decode("utf-8")
+
+    def run(self, encoded_image, **kwargs):
+        return {"summary": base64.b64decode(encoded_image).decode("utf-8"), "errors": []}
+
+    async def arun(self, encoded_image, **kwargs):
+        await asyncio.sleep(0)
+        return self.run(encoded_image)
+
+
+def same_stem_images(root):
+    for relative in ("a/diagram.png", "b/diagram.png", "a/diagram.jpg"):
+        path = root / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(f"summary of {relative}")
+    return discover_images(str(root / "**" / "*"))
+
+
+def summaries(output_dir) -> dict[str, str]:
+    with open(os.path.join(output_dir, "manifest.jsonl"), encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f]
+    assert all(entry["status"] == "completed" for entry in entries)
+    contents = {}
+    for entry in entries:
+        with open(entry["summary_path"], encoding="utf-8") as f:
+            contents[entry["summary_path"]] = f.read()
+    return contents
+
+
+def test_same_stem_images_get_their_own_summaries(tmp_path):
+    images = same_stem_images(tmp_path / "diagrams")
+    output_dir = str(tmp_path / "summaries")
+
+    counts = run_batch(StubWorkflow(), images, os.path.join(output_dir, "manifest.jsonl"), output_dir, jobs=3)
+
+    assert counts == {"completed": 3, "skipped": 0, "failed": 0}
+    contents = summaries(output_dir)
+    assert sorted(os.path.basename(path) for path in contents) == \
+        ["a__diagram.jpg.md", "a__diagram.png.md", "b__diagram.png.md"]
+    assert sorted(contents.values()) == \
+        ["summary of a/diagram.jpg", "summary of a/diagram.png", "summary of b/diagram.png"]
+
+
+def test_arun_batch_names_summaries_like_run_batch(tmp_path):
+    images = same_stem_images(tmp_path / "diagrams")
+    output_dir = str(tmp_path / "summaries")
+
+    asyncio.run(arun_batch(StubWorkflow(), images, os.path.join(output_dir, "manifest.jsonl"), output_dir, jobs=3))
+
+    assert {os.path.basename(path): content for path, content in summaries(output_dir).items()} == {
+        "a__diagram.jpg.md": "summary of a/diagram.jpg",
+        "a__diagram.png.md": "summary of a/diagram.png",
+        "b__diagram.png.md": "summary of b/diagram.png",
+    }
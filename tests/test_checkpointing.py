@@ -0,0 +1,75 @@
+import base64
+import io
+import sqlite3
+import time
+
+from PIL import Image
+
+from checkpointing import stale_threads
+from fake_llm import FakeChatModel
+from workflow import AzureArchitectureWorkflow
+
+
+class FailingReviewsModel(FakeChatModel):
+    """Fake model that fails every service review while `failing` is set."""
+    failing: bool = True
+
+    def respond(self, prompt: str) -> str:
+        if self.failing and "review the Azure services" in prompt:
+            return "Sorry, I cannot review these services."
+        return super().respond(prompt)
+
+
+def encoded_png(color: str = "white") -> str:
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48), color).save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
+def checkpoint_rows(path) -> list[bytes]:
+    with sqlite3.connect(path) as connection:
+        return [row[0] for row in connection.execute("SELECT checkpoint FROM checkpoints")] + \
+            [row[0] for row in connection.execute("SELECT value FROM writes")]
+
+
+def test_images_are_stored_once_and_not_in_checkpoints(workflow_environment, tmp_path):
+    model = FailingReviewsModel(diagram_size=2)
+    workflow = AzureArchitectureWorkflow(llm_client=model)
+    image = encoded_png()
+
+    failed = workflow.run(image, use_cache=False)
+
+    assert failed["errors"]
+    assert failed["image_ref"] == workflow.thread_config(image)["configurable"]["thread_id"]
+    rows = checkpoint_rows(tmp_path / "checkpoints.sqlite")
+    assert rows and not any(image[:64].encode("utf-8") in bytes(row) for row in rows)
+    assert workflow.images.load(failed["image_ref"], "uploaded") == image
+
+    model.failing = False
+    messages = []
+    completed = workflow.run(image, use_cache=False, on_message=messages.append)
+
+    assert "↩️ Resuming from the last completed step." in messages
+    assert not completed["errors"]
+    # A completed thread is cleared, images included.
+    assert workflow.images.last_used() == {}
+    assert checkpoint_rows(tmp_path / "checkpoints.sqlite") == []
+
+
+def test_stale_threads():
+    now = time.time()
+    last_used = {"recent": now, "older": now - 60, "expired": now - 7200}
+
+    assert stale_threads(last_used, {"recent", "abandoned"}, 3600, 0) == ["expired", "abandoned"]
+    assert stale_threads(last_used, set(), 0, 2) == ["expired"]
+    assert stale_threads(last_used, {"abandoned"}, 0, 0) == []
+
+
+def test_failed_threads_past_the_limit_are_pruned(workflow_environment, monkeypatch):
+    monkeypatch.setenv("AZGENTICA_KEEP_CHECKPOINTS", "2")
+    workflow = AzureArchitectureWorkflow(llm_client=FailingReviewsModel(diagram_size=2))
+
+    threads = [workflow.run(encoded_png(color), use_cache=False)["image_ref"] for color in ("red", "green", "blue")]
+
+    assert workflow.checkpointer.thread_ids() == set(threads[1:])
+    assert set(workflow.images.last_used()) == set(threads[1:])
@@ -0,0 +1,91 @@
+import io
+import random
+import threading
+import time
+
+import pytest
+
+pypdf = pytest.importorskip("pypdf")
+
+from cache import AnalysisCache
+from datapipeline import analyze_document, page_ranges
+
+
+def write_pdf(path, document: int, page_count: int):
+    """Blank PDF whose page widths encode (document, page), so a fake service can tell them apart."""
+    writer = pypdf.PdfWriter()
+    for page in range(1, page_count + 1):
+        writer.add_blank_page(width=document * 1000 + page, height=100)
+    with open(path, "wb") as f:
+        writer.write(f)
+    return str(path)
+
+
+class FakePoller:
+    def __init__(self, paragraphs):
+        self.paragraphs = paragraphs
+
+    def result(self):
+        return self
+
+
+class FakeDocumentIntelligenceClient:
+    """Answers begin_analyze_document with one paragraph per page of the uploaded PDF, after a random delay."""
+
+    def __init__(self):
+        self.uploads = []
+        self._lock = threading.Lock()
+        self._random = random.Random(0)
+
+    def begin_analyze_document(self, model, body, **kwargs):
+        reader = pypdf.PdfReader(io.BytesIO(body.read()))
+        with self._lock:
+            self.uploads.append((len(reader.pages), kwargs))
+            delay = self._random.uniform(0, 0.02)
+        # Later ranges often finish first; the pipeline must not care.
+        time.sleep(delay)
+        paragraphs = []
+        for number, page in enumerate(reader.pages, start=1):
+            document, page_number = divmod(int(page.mediabox.width), 1000)
+            paragraphs.append({"content": f"document {document} page {page_number}",
+                               "boundingRegions": [{"pageNumber": number}]})
+        return FakePoller(paragraphs)
+
+
+def test_page_ranges():
+    assert page_ranges(250, 100) == ["1-100", "101-200", "201-250"]
+    assert page_ranges(100, 100) == [None]
+    assert page_ranges(40, 0) == [None]
+
+
+def test_analyze_document_splits_ranges_and_stitches_documents_in_order(tmp_path):
+    first = write_pdf(tmp_path / "first.pdf", 1, 25)
+    second = write_pdf(tmp_path / "second.pdf", 2, 7)
+    client = FakeDocumentIntelligenceClient()
+
+    analyzed = analyze_document(client, [first, second], pages_per_range=10, parallelism=4)
+
+    assert analyzed.page_count == 32
+    # Each range is uploaded as its own PDF holding only its pages.
+    assert sorted(page_count for page_count, _ in client.uploads) == [5, 7, 10, 10]
+    assert all(not kwargs for _, kwargs in client.uploads)
+    expected = [f"document 1 page {page}" for page in range(1, 26)] + \
+               [f"document 2 page {page}" for page in range(1, 8)]
+    assert [paragraph["content"] for paragraph in analyzed.paragraphs] == expected
+    # Page numbers are those of the original document, not of the uploaded range.
+    assert [paragraph["boundingRegions"][0]["pageNumber"] for paragraph in analyzed.paragraphs[:25]] == \
+        list(range(1, 26))
+
+
+def test_analyze_document_reads_cached_documents_without_a_client(tmp_path):
+    document = write_pdf(tmp_path / "guide.pdf", 1, 12)
+    cache = AnalysisCache(str(tmp_path / "analysis"))
+    first = analyze_document(FakeDocumentIntelligenceClient(), document, pages_per_range=5, cache=cache)
+
+    def no_client():
+        raise AssertionError("a cached document must not be analyzed again")
+
+    second = analyze_document(no_client, document, pages_per_range=5, cache=cache)
+
+    assert second.paragraphs == first.paragraphs
+    assert len(second.paragraphs) == 12
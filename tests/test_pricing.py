@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from pricing import DEFAULT_CATALOG_PATH, PricingCatalog
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    return PricingCatalog.from_json(DEFAULT_CATALOG_PATH)
+
+
+def test_every_service_name_and_alias_maps_to_its_service(catalog):
+    with open(DEFAULT_CATALOG_PATH, encoding="utf-8") as f:
+        services = json.load(f)["services"]
+
+    unmatched = [(alias, service["service"], catalog.match(alias)) for service in services
+                 for alias in [service["service"], *service.get("aliases", [])]
+                 if catalog.match(alias) != service["service"]]
+
+    assert unmatched == []
+
+
+@pytest.mark.parametrize("label, service", [
+    ("Web App", "Azure App Service"),
+    ("web apps", "Azure App Service"),
+    ("Azure App Service Plan", "Azure App Service"),
+    ("Function App", "Azure Functions"),
+    ("Azure Function", "Azure Functions"),
+    ("App Gateway", "Azure Application Gateway"),
+    ("Azure SQL", "Azure SQL Database"),
+    ("Key Vault", "Azure Key Vault"),
+])
+def test_diagram_labels_match_through_aliases(catalog, label, service):
+    assert catalog.match(label) == service
+
+
+@pytest.mark.parametrize("label", ["Internet", "On-premises users", "Foundry Agent Service"])
+def test_labels_outside_the_catalog_do_not_match(catalog, label):
+    assert catalog.match(label) is None
+
+
+def test_estimate_prices_matched_services_per_region(catalog):
+    items = catalog.estimate([("Azure App Service", None), ("Azure App Service", None),
+                              ("Azure Functions", "Consumption")], region="westeurope")
+
+    app_service, functions = items
+    default_sku = catalog.services["Azure App Service"]["default_sku"]
+    sku = catalog.services["Azure App Service"]["skus"][default_sku]
+    unit_price = sku["unit_price"] * catalog.regions["westeurope"]
+    assert (app_service["sku"], app_service["quantity"]) == (default_sku, 2 * sku.get("quantity", 1))
+    assert app_service["unit_price"] == round(unit_price, 4)
+    assert app_service["monthly_cost"] == round(unit_price * sku["monthly_units"] * app_service["quantity"], 2)
+    assert (functions["service"], functions["sku"]) == ("Azure Functions", "Consumption")
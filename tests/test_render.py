@@ -0,0 +1,29 @@
+from render import render_summary
+
+STATE = {
+    "nodes": [{"id": "n0", "type": "azure", "label": "Azure App Service"}],
+    "azure_services_cost": [],
+}
+
+
+def test_render_summary_accepts_non_string_narrative_fields():
+    summary = render_summary(STATE, {
+        "summary": ["Public web app", "Single region"],
+        "cost_summary": 120.5,
+        "compute_cost": {"Azure App Service": 120.5},
+        "storage_cost": "  Negligible.  ",
+        "networking_cost": None,
+    })
+
+    assert '- **Summary**: ["Public web app", "Single region"]' in summary
+    assert "- **Summary of Azure Services Cost**: 120.5" in summary
+    assert '- **Azure Compute Services Cost**: {"Azure App Service": 120.5}' in summary
+    assert "- **Azure Storage Services Cost**: Negligible." in summary
+    assert "- **Azure Networking Services Cost**: Not available." in summary
+
+
+def test_render_summary_accepts_a_narrative_that_is_not_an_object():
+    summary = render_summary(STATE, ["Public web app"])
+
+    assert '- **Summary**: ["Public web app"]' in summary
+    assert "- **Azure Compute Services Cost**: Not available." in summary
@@ -0,0 +1,65 @@
+import hashlib
+
+import pytest
+
+pytest.importorskip("chromadb")
+pytest.importorskip("langchain_chroma")
+
+from retrieval import build_vector_store, fit_to_budget, load_retriever
+
+KEY_VAULT = "Azure Well-Architected Framework perspective on Azure Key Vault"
+APP_SERVICE = "Architecture best practices for Azure App Service (Web Apps)"
+
+
+def section(heading: str, paragraphs: list[str]) -> dict:
+    content = "\n\n".join(paragraphs)
+    return {"id": hashlib.sha256(content.encode("utf-8")).hexdigest(), "heading": heading, "content": content}
+
+
+PAGES = [
+    section(KEY_VAULT, [
+        "Rotate secrets and certificates automatically before they expire.",
+        "Enable soft delete and purge protection so deleted vaults can be recovered.",
+        "Use private endpoints so the vault is not reachable from the internet.",
+    ]),
+    section(APP_SERVICE, [
+        "Enable zone redundancy on the App Service plan for reliability.",
+        "Use deployment slots to swap releases without downtime.",
+    ]),
+]
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setenv("AZGENTICA_EMBEDDINGS", "hashing")
+    directory = str(tmp_path / "chroma")
+    build_vector_store(PAGES, persist_directory=directory, chunk_size=80, chunk_overlap=0)
+    return directory
+
+
+def test_retrieves_relevant_chunks_of_the_matched_section_only(store):
+    chunks = load_retriever(store).retrieve(KEY_VAULT, "soft delete and purge protection of deleted vaults", k=1)
+
+    assert chunks == ["Enable soft delete and purge protection so deleted vaults can be recovered."]
+
+
+def test_retrieved_chunks_fit_the_budget_in_document_order(store):
+    chunks = load_retriever(store).retrieve(KEY_VAULT, "vault secrets internet", k=3, token_budget=10_000)
+
+    assert chunks == PAGES[0]["content"].split("\n\n")
+    assert fit_to_budget(["a" * 400, "b" * 400], token_budget=100) == ["a" * 400]
+
+
+def test_rebuilding_only_embeds_new_sections(store):
+    pages = PAGES[1:] + [section("Azure Well-Architected Framework perspective on Azure Cosmos DB",
+                                 ["Configure multi-region writes for high availability."])]
+
+    _, update = build_vector_store(pages, persist_directory=store, chunk_size=80, chunk_overlap=0)
+
+    assert (update.added_sections, update.removed_sections, update.rebuilt) == (1, 1, False)
+
+
+def test_no_retriever_without_a_built_store(tmp_path):
+    assert load_retriever(str(tmp_path / "missing")) is None
+    (tmp_path / "empty").mkdir()
+    assert load_retriever(str(tmp_path / "empty")) is None
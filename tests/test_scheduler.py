@@ -0,0 +1,101 @@
+import asyncio
+import threading
+import time
+
+from langchain_core.messages import HumanMessage
+
+from fake_llm import FakeChatModel, FakeRateLimitError
+from scheduler import BATCH, INTERACTIVE, RateLimitScheduler, ScheduledChatModel
+
+
+def drained(requests_per_minute: int, **kwargs) -> RateLimitScheduler:
+    """Scheduler whose request budget is used up, so every call has to queue."""
+    scheduler = RateLimitScheduler(requests_per_minute=requests_per_minute, **kwargs)
+    scheduler.requests.take(requests_per_minute)
+    return scheduler
+
+
+def wait_for_queue(scheduler: RateLimitScheduler, length: int):
+    deadline = time.monotonic() + 5
+    while len(scheduler._waiting) < length:
+        assert time.monotonic() < deadline, "calls were not queued"
+        time.sleep(0.001)
+
+
+def test_interactive_calls_are_served_before_batch_calls():
+    scheduler = drained(1200)
+    served = []
+
+    def call(name: str, priority: int):
+        scheduler.call(lambda: served.append(name), tokens=1, priority=priority)
+
+    threads = []
+    for names, priority in ((["batch-1", "batch-2", "batch-3"], BATCH),
+                            (["interactive-1", "interactive-2", "interactive-3"], INTERACTIVE)):
+        for name in names:
+            threads.append(threading.Thread(target=call, args=(name, priority)))
+            threads[-1].start()
+            wait_for_queue(scheduler, len(threads))
+    for thread in threads:
+        thread.join()
+
+    assert served == ["interactive-1", "interactive-2", "interactive-3", "batch-1", "batch-2", "batch-3"]
+
+
+def test_throttled_calls_are_retried_after_the_advertised_delay():
+    model = FakeChatModel(rpm_limit=1, rate_window=0.2)
+    scheduler = RateLimitScheduler(max_retries=3, backoff_seconds=0.01, seed=0)
+    llm = ScheduledChatModel(model, scheduler)
+    messages = [HumanMessage(content="Summarize the results.")]
+
+    started = time.monotonic()
+    llm.invoke(messages)
+    llm.invoke(messages)
+
+    # The second call is refused with a retry-after for the end of the window, then succeeds.
+    assert time.monotonic() - started >= 0.2
+    assert (model.calls, model.throttled) == (3, 1)
+    assert (scheduler.stats["throttled"], scheduler.stats["retries"]) == (1, 1)
+
+
+def test_retry_delay_adds_jitter_to_retry_after():
+    scheduler = RateLimitScheduler(max_retries=2, backoff_seconds=0.1, seed=0)
+
+    delays = [scheduler.retry_delay(FakeRateLimitError(0.5), attempt, tokens=10) for attempt in (0, 1)]
+
+    assert 0.5 <= delays[0] <= 0.6
+    assert 0.5 <= delays[1] <= 0.7
+    assert scheduler.retry_delay(FakeRateLimitError(0.5), 2, tokens=10) is None
+    assert scheduler.retry_delay(ValueError("not retried"), 0, tokens=10) is None
+
+
+def test_queued_calls_are_woken_when_the_head_is_served():
+    # 6000 requests per minute admit a call every 10 ms; 30 calls should take about 0.3s,
+    # not a polling interval each.
+    scheduler = drained(6000)
+    threads = [threading.Thread(target=scheduler.call, args=(lambda: None, 1)) for _ in range(30)]
+
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert time.monotonic() - started < 1.5
+    assert scheduler.stats["calls"] == 30
+
+
+def test_queued_coroutines_are_woken_when_the_head_is_served():
+    scheduler = drained(6000)
+
+    async def nothing():
+        return None
+
+    async def run():
+        await asyncio.gather(*(scheduler.acall(nothing, 1) for _ in range(30)))
+
+    started = time.monotonic()
+    asyncio.run(run())
+
+    assert time.monotonic() - started < 1.5
+    assert scheduler.stats["calls"] == 30
@@ -0,0 +1,180 @@
+import io
+import json
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("starlette")
+pytest.importorskip("httpx")
+
+from PIL import Image
+from starlette.testclient import TestClient
+
+from fake_llm import FakeChatModel
+from service import JobManager, create_app
+from workflow import AzureArchitectureWorkflow
+
+
+class UnreadableReviewsModel(FakeChatModel):
+    """Fake model whose service reviews never parse, so every review of a run fails."""
+
+    def respond(self, prompt: str) -> str:
+        if "review the Azure services" in prompt:
+            return "Sorry, I cannot review these services."
+        return super().respond(prompt)
+
+
+@pytest.fixture
+def workflow_factory(workflow_environment):
+    """Workflows answered by the fake model."""
+    model = FakeChatModel(diagram_size=2, latency=0.01)
+    return lambda priority: AzureArchitectureWorkflow(llm_client=model, priority=priority)
+
+
+def png() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48), "white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def upload(client, *names, content=None):
+    return client.post("/jobs", files=[("file", (name, content or png(), "image/png")) for name in names],
+                       data={"use_cache": "false"})
+
+
+def events(client, job_id) -> list[tuple[str, dict]]:
+    """Every event of a job, read from its stream until the job finishes."""
+    received, event = [], None
+    with client.stream("GET", f"/jobs/{job_id}/events") as response:
+        assert response.headers["content-type"].startswith("text/event-stream")
+        for line in response.iter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                received.append((event, json.loads(line[len("data: "):])))
+    return received
+
+
+def test_upload_queues_one_job_per_file(workflow_factory):
+    with TestClient(create_app(workflow_factory, workers=2, queue_size=10)) as client:
+        response = upload(client, "a.png", "b.png")
+
+        assert response.status_code == 202
+        jobs = response.json()["jobs"]
+        assert [job["filename"] for job in jobs] == ["a.png", "b.png"]
+        assert all(job["status"] == "queued" and job["priority"] == "batch" for job in jobs)
+        assert {job["id"] for job in client.get("/jobs").json()["jobs"]} == {job["id"] for job in jobs}
+
+
+def test_upload_rejects_files_that_are_not_images(workflow_factory):
+    with TestClient(create_app(workflow_factory, workers=1, queue_size=10)) as client:
+        response = upload(client, "notes.png", content=b"not an image")
+
+        assert response.status_code == 415
+        assert "notes.png" in response.json()["error"]
+        assert client.get("/jobs").json()["jobs"] == []
+
+
+def test_upload_is_refused_past_the_size_limit(workflow_factory):
+    with TestClient(create_app(workflow_factory, workers=1, queue_size=10, max_upload_bytes=1024)) as client:
+        response = upload(client, "large.png", content=b"\x89PNG" + b"\0" * 2048)
+
+        assert response.status_code == 413
+        assert "large.png" in response.json()["error"]
+        assert client.get("/jobs").json()["jobs"] == []
+
+
+def test_upload_is_refused_when_the_queue_is_full(workflow_factory):
+    with TestClient(create_app(workflow_factory, workers=1, queue_size=1)) as client:
+        response = upload(client, "a.png", "b.png")
+
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "30"
+        # Files before the full queue are still accepted.
+        assert [job["filename"] for job in response.json()["jobs"]] == ["a.png"]
+
+
+def test_job_status_and_result(workflow_factory):
+    with TestClient(create_app(workflow_factory, workers=1, queue_size=10)) as client:
+        job = upload(client, "a.png").json()["jobs"][0]
+
+        early = client.get(f"/jobs/{job['id']}/result")
+        assert early.status_code == 409
+        assert early.json()["result"] is None
+
+        events(client, job["id"])
+        status = client.get(f"/jobs/{job['id']}").json()
+        assert status["status"] == "completed"
+        assert status["error"] is None
+        assert status["nodes_completed"]
+
+        response = client.get(f"/jobs/{job['id']}/result")
+        assert response.status_code == 200
+        result = response.json()["result"]
+        assert {"nodes", "edges", "azure_services_cost", "service_recommendations", "summary"} <= set(result)
+        assert {node["label"] for node in result["nodes"]} >= {"Azure App Service", "Azure Key Vault"}
+
+        assert client.get("/jobs/missing").status_code == 404
+        assert client.get("/jobs/missing/result").status_code == 404
+
+
+def test_events_stream_the_progress_of_a_job(workflow_factory):
+    with TestClient(create_app(workflow_factory, workers=1, queue_size=10)) as client:
+        job = upload(client, "a.png").json()["jobs"][0]
+
+        received = events(client, job["id"])
+
+        names = [event for event, _ in received]
+        statuses = [data["status"] for event, data in received if event == "status"]
+        assert statuses == ["queued", "running", "completed"]
+        # Nodes, messages and reviews all arrive while the job is running.
+        assert names[:2] == ["status", "status"] and names[-1] == "status"
+        assert set(names[2:-1]) == {"node", "message", "review"}
+        reviewed = {data["service_name"] for event, data in received if event == "review"}
+        assert reviewed == {"Azure App Service (Web Apps)", "Azure Key Vault"}
+        nodes = [data["node"] for event, data in received if event == "node"]
+        assert nodes == client.get(f"/jobs/{job['id']}").json()["nodes_completed"]
+
+
+def test_incomplete_runs_fail_with_their_errors(workflow_environment):
+    model = UnreadableReviewsModel(diagram_size=2)
+    factory = lambda priority: AzureArchitectureWorkflow(llm_client=model, priority=priority)
+    with TestClient(create_app(factory, workers=1, queue_size=10)) as client:
+        job = upload(client, "a.png").json()["jobs"][0]
+
+        final = events(client, job["id"])[-1]
+        assert final[0] == "status" and final[1]["status"] == "failed"
+        assert final[1]["error"].startswith("Incomplete analysis (")
+
+        # The endpoint itself did not fail: the error comes back with what the run produced.
+        response = client.get(f"/jobs/{job['id']}/result")
+        assert response.status_code == 200
+        assert response.json()["status"] == "failed"
+        result = response.json()["result"]
+        assert {error["service_name"] for error in result["errors"]} == \
+            {"Azure App Service (Web Apps)", "Azure Key Vault"}
+        assert result["nodes"]
+
+
+def test_each_workflow_is_built_once():
+    built = []
+
+    class SlowWorkflow:
+        def __init__(self, priority):
+            built.append(priority)
+
+        def warm_up(self):
+            time.sleep(0.05)
+            return self
+
+    manager = JobManager(SlowWorkflow)
+    threads = [threading.Thread(target=manager.workflow, args=(priority,))
+               for priority in ("batch", "interactive") * 4]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(built) == ["batch", "interactive"]
+    assert manager.workflow("batch") is manager.workflow("batch")
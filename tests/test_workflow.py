@@ -0,0 +1,35 @@
+import base64
+import io
+
+from PIL import Image
+
+from fake_llm import FakeChatModel
+from workflow import AzureArchitectureWorkflow
+
+
+def encoded_png() -> str:
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48), "white").save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
+def test_result_cache_key_covers_image_settings(workflow_environment, monkeypatch):
+    image = encoded_png()
+    key = AzureArchitectureWorkflow(llm_client=FakeChatModel()).result_cache_key(image)
+    assert AzureArchitectureWorkflow(llm_client=FakeChatModel()).result_cache_key(image) == key
+
+    for name, value in (("AZGENTICA_TILE_SIZE", "1024"), ("AZGENTICA_TILE_OVERLAP", "0.3"),
+                        ("AZGENTICA_IMAGE_MAX_PIXELS", "1000000"), ("AZGENTICA_IMAGE_TILING", "on")):
+        with monkeypatch.context() as patch:
+            patch.setenv(name, value)
+            assert AzureArchitectureWorkflow(llm_client=FakeChatModel()).result_cache_key(image) != key, name
+
+
+def test_prompt_version_follows_every_prompt(monkeypatch):
+    import prompts
+    version = prompts.prompt_version()
+
+    for name in ("service_review_prompt", "service_review_context", "summary_prompt"):
+        with monkeypatch.context() as patch:
+            patch.setattr(prompts, name, getattr(prompts, name) + "\nBe brief.")
+            assert prompts.prompt_version() != version, name
@@ -0,0 +1,182 @@
+"""
+Tiled extraction for very large diagrams.
+
+A landing-zone diagram downscaled to the model's resolution loses most of its text,
+and extracting it in one call often truncates the JSON. Large images are instead
+cut into overlapping tiles at full resolution, each tile is extracted on its own,
+and the per-tile graphs are merged back into one: nodes seen in more than one tile
+(inside the overlaps) are deduplicated by label and position, and edges are mapped
+to the merged nodes, resolving references to components outside a tile by label.
+"""
+
+import base64
+import io
+import logging
+import math
+import re
+from typing import NamedTuple
+
+from images import model_resolution
+
+logger = logging.getLogger(__name__)
+
+TILING_MODES = ("auto", "on", "off")
+
+_LABEL_RE = re.compile(r"[^a-z0-9]+")
+_VENDOR_PREFIX_RE = re.compile(r"^(?:microsoft |azure )+")
+
+
+class ImageTile(NamedTuple):
+    data: str
+    mime_type: str
+    x: int
+    y: int
+    width: int
+    height: int
+
+
+def tile_boxes(width: int, height: int, tile_size: int, overlap: float) -> list[tuple[int, int, int, int]]:
+    """(x, y, width, height) of overlapping tiles covering the image, row by row."""
+    def spans(length):
+        size = min(tile_size, length)
+        step = max(1, int(size * (1 - overlap)))
+        count = max(1, math.ceil((length - size) / step) + 1)
+        # Spread the tiles evenly so the last one ends on the image border.
+        return [(round(i * (length - size) / (count - 1)) if count > 1 else 0, size) for i in range(count)]
+    return [(x, y, tile_width, tile_height)
+            for y, tile_height in spans(height) for x, tile_width in spans(width)]
+
+
+def should_tile(width: int, height: int, mode: str, threshold: int, tile_size: int) -> bool:
+    if mode == "off":
+        return False
+    if mode == "on":
+        return max(width, height) > tile_size
+    return max(width, height) > threshold
+
+
+def tile_image(encoded_image: str, mode: str = "auto", threshold: int = 4096, tile_size: int = 2048,
+               overlap: float = 0.15, image_format: str = "PNG") -> list[ImageTile]:
+    """Overlapping tiles of a base64 image, each downscaled to the model resolution, or [] when not tiled."""
+    try:
+        from PIL import Image
+    except ImportError:
+        logger.warning("Pillow is not installed, extracting the image without tiling.")
+        return []
+    try:
+        image = Image.open(io.BytesIO(base64.b64decode(encoded_image)))
+    except OSError as e:
+        raise ValueError(f"Uploaded file is not a readable image: {e}") from e
+    tiles = []
+    with image:
+        if not should_tile(*image.size, mode, threshold, tile_size):
+            return []
+        if image_format.upper() == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA", "L", "LA"):
+            image = image.convert("RGBA")
+        for x, y, width, height in tile_boxes(*image.size, tile_size, overlap):
+            crop = image.crop((x, y, x + width, y + height))
+            target = model_resolution(width, height)
+            if target != (width, height):
+                crop = crop.resize(target, Image.LANCZOS)
+            buffer = io.BytesIO()
+            crop.save(buffer, format=image_format, optimize=True)
+            tiles.append(ImageTile(base64.b64encode(buffer.getvalue()).decode("utf-8"),
+                                   f"image/{image_format.lower()}", x, y, width, height))
+        logger.info(f"Split {image.size[0]}x{image.size[1]} image into {len(tiles)} tiles of up to "
+                    f"{tile_size}px with {overlap:.0%} overlap")
+    return tiles
+
+
+def normalize_label(label) -> str:
+    """Comparable form of a label: "Azure App-Service" and "app service" are the same."""
+    return _VENDOR_PREFIX_RE.sub("", _LABEL_RE.sub(" ", str(label or "").lower()).strip())
+
+
+def _center(node: dict, tile: ImageTile) -> tuple[float, float] | None:
+    """Center of a node in image pixels, from its position relative to the tile."""
+    position = node.get("position")
+    if not isinstance(position, (list, tuple)) or len(position) != 2:
+        return None
+    try:
+        return tile.x + float(position[0]) * tile.width, tile.y + float(position[1]) * tile.height
+    except (TypeError, ValueError):
+        return None
+
+
+def merge_tile_graphs(results: list[tuple[ImageTile, dict]], distance: float | None = None) -> tuple[list[dict], list[dict]]:
+    """
+    Merge per-tile extractions into one graph. A node from one tile is the same as a
+    node from another tile when their labels normalize to the same text and, when both
+    report a position, their centers are within `distance` pixels (by default a tenth
+    of the smallest tile side), or else their subnets agree. Nodes of the same tile are
+    never merged with each other.
+    """
+    if distance is None:
+        distance = max((min(tile.width, tile.height) * 0.1 for tile, _ in results), default=0)
+    merged: list[dict] = []
+    merged_meta: list[dict] = []  # label key, center and tiles of each merged node
+    local_ids: dict[tuple[int, str], str] = {}
+    used_ids: set[str] = set()
+
+    def same_node(meta, key, center, subnet, tile_index):
+        if meta["key"] != key or tile_index in meta["tiles"]:
+            return False
+        if center and meta["center"]:
+            return math.dist(center, meta["center"]) <= distance
+        return not subnet or not meta["subnet"] or normalize_label(subnet) == meta["subnet"]
+
+    for tile_index, (tile, extraction) in enumerate(results):
+        for node in extraction.get("nodes") or []:
+            if not isinstance(node, dict) or not node.get("label"):
+                continue
+            key, center = normalize_label(node["label"]), _center(node, tile)
+            match = next((i for i, meta in enumerate(merged_meta)
+                          if same_node(meta, key, center, node.get("subnet"), tile_index)), None)
+            if match is None:
+                node_id = str(node.get("id") or node["label"])
+                base, suffix = node_id, 2
+                while node_id in used_ids:
+                    node_id, suffix = f"{base}-{suffix}", suffix + 1
+                used_ids.add(node_id)
+                merged.append({**{field: value for field, value in node.items() if field != "position"},
+                               "id": node_id})
+                merged_meta.append({"key": key, "center": center, "tiles": {tile_index},
+                                    "subnet": normalize_label(node.get("subnet")) or None})
+                match = len(merged) - 1
+            else:
+                meta, target = merged_meta[match], merged[match]
+                meta["tiles"].add(tile_index)
+                meta["center"] = meta["center"] or center
+                for field, value in node.items():
+                    if field not in ("id", "position") and value and not target.get(field):
+                        target[field] = value
+            local_ids[(tile_index, str(node.get("id")))] = merged[match]["id"]
+
+    by_label: dict[str, list[str]] = {}
+    for node, meta in zip(merged, merged_meta):
+        by_label.setdefault(meta["key"], []).append(node["id"])
+
+    def resolve(tile_index, reference):
+        if (tile_index, str(reference)) in local_ids:
+            return local_ids[(tile_index, str(reference))]
+        # Edges leaving a tile name the component at the other end by its label.
+        candidates = by_label.get(normalize_label(reference), [])
+        return candidates[0] if len(candidates) == 1 else None
+
+    edges, seen = [], set()
+    for tile_index, (_, extraction) in enumerate(results):
+        for edge in extraction.get("edges") or []:
+            if not isinstance(edge, dict):
+                continue
+            source, target = resolve(tile_index, edge.get("source")), resolve(tile_index, edge.get("target"))
+            if source is None or target is None or source == target:
+                logger.debug(f"Dropping unresolved edge {edge.get('source')} -> {edge.get('target')}")
+                continue
+            key = (source, target, normalize_label(edge.get("label")))
+            if key in seen:
+                continue
+            seen.add(key)
+            edges.append({**edge, "source": source, "target": target})
+    return merged, edges
@@ -0,0 +1,29 @@
+"""Small helpers shared by the workflow and the data pipeline."""
+
+# Rough average for English text with GPT tokenizers; good enough for budgeting
+# prompts without loading a tokenizer.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of a piece of text."""
+    if not text:
+        return 0
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def pack_batches(items: list, sizes: list[int], token_budget: int, max_items: int | None = None) -> list[list]:
+    """Greedily group items, in order, so each group stays within the token budget.
+
+    An item larger than the budget on its own still gets a group of its own.
+    """
+    batches, current, used = [], [], 0
+    for item, size in zip(items, sizes):
+        if current and (used + size > token_budget or (max_items and len(current) >= max_items)):
+            batches.append(current)
+            current, used = [], 0
+        current.append(item)
+        used += size
+    if current:
+        batches.append(current)
+    return batches
@@ -1,22 +1,48 @@
+import asyncio
 import base64
+import hashlib
 import os
 import json
 import time
 import logging
-import pandas as pd
+import operator
+import threading
+import uuid
 import click
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-from typing import Literal
+from typing import TYPE_CHECKING, Annotated, Literal
 from typing_extensions import TypedDict
 
 from langchain_core.messages import SystemMessage, HumanMessage, BaseMessage
-from langchain_openai import AzureChatOpenAI
+from langchain_core.runnables import RunnableConfig
 
-from prompts import data_extraction_prompt, cost_calculation_prompt, json_output_format
+from recommendations import RecommendationIndex, load_recommendation_index, service_name_from_heading, tokenize
+from retrieval import DEFAULT_PERSIST_DIRECTORY, chunk_section, fit_to_budget, load_retriever
+from utils import estimate_tokens, pack_batches
+from images import IMAGE_DETAILS, image_data_url, prepare_image
+from tiling import TILING_MODES, ImageTile, merge_tile_graphs, tile_image
+from serialization import measure_prompt, project_state, project_edges, to_compact_json
+from render import NarrativeStream, render_service_review, render_summary, summarize_changes, total_cost
+from checkpointing import (ThreadImageStore, get_checkpointer, get_review_progress_store,
+                           get_thread_image_store, stale_threads)
+from clients import event_loop, get_llm_client, run_coroutine
+from scheduler import PRIORITIES, ScheduledChatModel, get_scheduler
+from cache import CACHED_STATE_FIELDS, CachedChatModel, LLMResponseCache, ResultCache, image_cache_key
+from instrumentation import CallRecord, Profiler, process_profiler, profile_node, write_metrics_file
+from diffing import changed_node_ids, diff_graphs
+from pricing import PricingCatalog, load_pricing_catalog, unpriced_item
+from prompts import data_extraction_prompt, diagram_overview_prompt, sku_inference_prompt, \
+    service_recommendations_output_format, service_review_context, service_review_prompt, summary_prompt, \
+    tile_extraction_prompt, prompt_version
 
+from langgraph.config import get_stream_writer
 from langgraph.graph import StateGraph, START, END
 from langgraph.types import Command
 
+if TYPE_CHECKING:
+    from langchain_core.language_models import BaseChatModel
+
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
@@ -30,6 +56,7 @@ class ServiceRecommendations(TypedDict):
     review: str
     recommedation: str
     pillar_in_review: str | None
+    nodes: list[str] | None
 
 
 class Nodes(TypedDict):
@@ -46,39 +73,176 @@ class Edges(TypedDict):
     metadata: dict[str, str] | None
 
 
+class ServiceGroup(TypedDict):
+    service_name: str
+    section: dict
+    nodes: list[Nodes]
+    context: str
+
+
+class ServiceReviewError(TypedDict):
+    service_name: str
+    error: str
+
+
 class GraphState(TypedDict):
-    uploaded_image: str | None
+    # Thread the images are stored under; state only references them, so they are not
+    # written into every checkpoint.
+    image_ref: str | None
+    image_mime_type: str | None
+    # Full-resolution tiles of a large diagram, extracted separately and merged; "data"
+    # is the name the tile image is stored under.
+    image_tiles: list[dict] | None
     nodes: list[Nodes] | None
     edges: list[Edges] | None
     image_description: str | None
-    azure_services_cost: dict[str, float] | None
+    azure_services_cost: list[dict] | None
     service_recommendations: list[ServiceRecommendations]
+    # Catalog service and SKU each Azure label was priced as, reused by later revisions.
+    service_skus: dict[str, dict | None] | None
+    # Final state of an earlier revision of the diagram, and the node/edge diff against it.
+    previous: dict | None
+    changes: dict | None
+    errors: Annotated[list[ServiceReviewError], operator.add]
     summary: str | None
     total_iterations: int
     pillar_in_review: str | None
-    messages: list[BaseMessage] | None
+    # cost_analysis and service_recommendations_supervisor_node run in the same
+    # superstep, so fields both of them write need a reducer to merge updates.
+    messages: Annotated[list[BaseMessage], operator.add]
 
 
 class Router(TypedDict):
-    next: Literal["data_extraction", "cost_analysis",
+    next: Literal["image_preparation", "data_extraction", "cost_analysis",
                   "service_recommendations_supervisor_node", "summarize_results", END]
 
 
+_llm_response_cache = None
+_llm_response_cache_lock = threading.Lock()
+
+# Checkpoint threads a run in this process is currently writing to.
+_active_threads: set[str] = set()
+_active_threads_lock = threading.Lock()
+
+
+def get_llm_response_cache() -> LLMResponseCache:
+    '''LLM response cache shared by every workflow in the process'''
+    global _llm_response_cache
+    with _llm_response_cache_lock:
+        if _llm_response_cache is None:
+            _llm_response_cache = LLMResponseCache(
+                path=os.getenv("AZGENTICA_LLM_CACHE_PATH",
+                               "data/cache/llm.sqlite"),
+                ttl_seconds=float(
+                    os.getenv("AZGENTICA_LLM_CACHE_TTL_HOURS", "168")) * 3600,
+                max_entries=int(os.getenv("AZGENTICA_LLM_CACHE_MAX_ENTRIES", "10000")))
+        return _llm_response_cache
+
+
 class AzureArchitectureWorkflow:
-    def __init__(self):
+    def __init__(self, max_concurrency: int | None = None, llm_client: "BaseChatModel | None" = None,
+                 priority: str = "interactive"):
         self.AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
         self.AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
         self.AZURE_OPENAI_DEPLOYMENT_NAME = os.getenv(
             "AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-4o")
-        self.llm_client = AzureChatOpenAI(
-            azure_deployment=self.AZURE_OPENAI_DEPLOYMENT_NAME,
-            api_version="2024-08-01-preview",
-            temperature=0.3,
-            model_name=self.AZURE_OPENAI_DEPLOYMENT_NAME,
-            azure_endpoint=self.AZURE_OPENAI_ENDPOINT,
+        # Any chat model can be injected, e.g. the local fake used by benchmark.py. By
+        # default every workflow in the process shares one pooled client per deployment.
+        self.llm_client = llm_client or get_llm_client(
+            self.AZURE_OPENAI_DEPLOYMENT_NAME,
+            endpoint=self.AZURE_OPENAI_ENDPOINT,
             api_key=self.AZURE_OPENAI_API_KEY,
         )
+        # Calls are paced to the deployment's quota and retried when throttled; the budgets are
+        # shared by every workflow in the process, and interactive runs are served before batch ones.
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority must be one of {tuple(PRIORITIES)}, got '{priority}'")
+        self.priority = priority
+        self.scheduler = get_scheduler(
+            self.AZURE_OPENAI_DEPLOYMENT_NAME,
+            requests_per_minute=int(os.getenv("AZGENTICA_RPM", "0")),
+            tokens_per_minute=int(os.getenv("AZGENTICA_TPM", "0")),
+            max_retries=int(os.getenv("AZGENTICA_LLM_MAX_RETRIES", "5")))
+        self.llm_client = ScheduledChatModel(
+            self.llm_client, self.scheduler, PRIORITIES[priority],
+            completion_tokens=int(os.getenv("AZGENTICA_COMPLETION_TOKEN_ESTIMATE", "500")))
+        if os.getenv("AZGENTICA_LLM_CACHE", "on").lower() not in ("0", "off", "false"):
+            self.llm_client = CachedChatModel(
+                self.llm_client,
+                get_llm_response_cache(),
+                namespace=f"{self.AZURE_OPENAI_DEPLOYMENT_NAME}:{getattr(self.llm_client, 'temperature', None)}",
+                # Every node parses the reply as JSON; a reply that does not parse is not cached.
+                validate=lambda content: json.loads(self.clean_json_string(content)))
+        self.recommendations_path = os.getenv(
+            "AZGENTICA_RECOMMENDATIONS_CSV", "data/azure-service-recommendations.csv")
+        self.vector_store_directory = os.getenv(
+            "AZGENTICA_VECTOR_STORE", DEFAULT_PERSIST_DIRECTORY)
+        # Upper bound on simultaneous per-service review calls.
+        self.max_concurrency = max_concurrency or int(
+            os.getenv("AZGENTICA_MAX_CONCURRENCY", "8"))
+        # Only the most relevant WAF chunks per service are sent, up to this budget.
+        self.retrieval_top_k = int(os.getenv("AZGENTICA_RETRIEVAL_TOP_K", "6"))
+        self.context_token_budget = int(
+            os.getenv("AZGENTICA_CONTEXT_TOKEN_BUDGET", "1500"))
+        # Services are packed into one review call up to this much WAF context.
+        self.review_batch_tokens = int(
+            os.getenv("AZGENTICA_REVIEW_BATCH_TOKENS", "3000"))
+        self.review_batch_max_services = int(
+            os.getenv("AZGENTICA_REVIEW_BATCH_MAX_SERVICES", "4"))
+        # Images are downscaled once to what the model actually sees, or to these budgets.
+        self.image_detail = os.getenv("AZGENTICA_IMAGE_DETAIL", "high")
+        if self.image_detail not in IMAGE_DETAILS:
+            raise ValueError(
+                f"AZGENTICA_IMAGE_DETAIL must be one of {IMAGE_DETAILS}, got '{self.image_detail}'")
+        self.image_max_pixels = int(os.getenv("AZGENTICA_IMAGE_MAX_PIXELS", "0")) or None
+        self.image_max_tokens = int(os.getenv("AZGENTICA_IMAGE_MAX_TOKENS", "0")) or None
+        self.image_format = os.getenv("AZGENTICA_IMAGE_FORMAT", "PNG")
+        # Very large diagrams are extracted from overlapping full-resolution tiles.
+        self.image_tiling = os.getenv("AZGENTICA_IMAGE_TILING", "auto").lower()
+        if self.image_tiling not in TILING_MODES:
+            raise ValueError(
+                f"AZGENTICA_IMAGE_TILING must be one of {TILING_MODES}, got '{self.image_tiling}'")
+        self.tile_threshold = int(os.getenv("AZGENTICA_TILE_THRESHOLD", "4096"))
+        self.tile_size = int(os.getenv("AZGENTICA_TILE_SIZE", "2048"))
+        self.tile_overlap = float(os.getenv("AZGENTICA_TILE_OVERLAP", "0.15"))
+        # Per-service reviews work from the extracted description and graph unless enabled.
+        self.review_with_image = os.getenv(
+            "AZGENTICA_REVIEW_WITH_IMAGE", "off").lower() in ("1", "on", "true")
+        # Costs come from the local pricing catalog; the model only maps services it cannot.
+        self.pricing_catalog_path = os.getenv(
+            "AZGENTICA_PRICING_CATALOG", "data/azure-pricing-catalog.json")
+        self.pricing_region = os.getenv("AZGENTICA_PRICING_REGION") or None
+        self.pricing_llm_fallback = os.getenv(
+            "AZGENTICA_PRICING_LLM_FALLBACK", "on").lower() not in ("0", "off", "false")
+        self.result_cache = ResultCache(
+            directory=os.getenv("AZGENTICA_RESULT_CACHE_DIR",
+                                "data/cache/results"),
+            max_bytes=int(os.getenv("AZGENTICA_RESULT_CACHE_MAX_MB", "256")) * 1024 * 1024)
+        # State is checkpointed after every node so failed runs resume where they stopped.
+        self.checkpointer = None
+        self.review_progress = None
+        # Images of a run are stored once per thread; in memory for the run when not checkpointing.
+        self.images = None
+        if os.getenv("AZGENTICA_CHECKPOINTS", "on").lower() not in ("0", "off", "false"):
+            checkpoint_path = os.getenv(
+                "AZGENTICA_CHECKPOINT_PATH", "data/checkpoints.sqlite")
+            self.checkpointer = get_checkpointer(checkpoint_path)
+            self.review_progress = get_review_progress_store(checkpoint_path)
+            self.images = get_thread_image_store(checkpoint_path)
+        else:
+            self.images = ThreadImageStore(":memory:")
+        # Threads not run for this long, and all but the most recent ones, are pruned after each run.
+        self.checkpoint_max_age_hours = float(os.getenv("AZGENTICA_CHECKPOINT_MAX_AGE_HOURS", "168"))
+        self.keep_checkpoints = int(os.getenv("AZGENTICA_KEEP_CHECKPOINTS", "100"))
+        # Per-node and per-call timings for this workflow; everything is also recorded
+        # process-wide and, if configured, dumped as Prometheus metrics after each run.
+        self.profiler = Profiler()
+        self.metrics_file = os.getenv("AZGENTICA_METRICS_FILE") or None
+        self.graph = None
+        # Same graph with async nodes, used by arun().
+        self.async_graph = None
         self.members = [
+            "image_preparation",
             "data_extraction",
             "cost_analysis",
             "service_recommendations_supervisor_node",
@@ -86,6 +250,23 @@ class AzureArchitectureWorkflow:
         ]
         self.options = self.members + ["FINISH"]
 
+    def warm_up(self):
+        '''Build what the first run would otherwise pay for: both compiled graphs, the event loop
+        and the WAF recommendation, pricing and vector store indexes'''
+        if self.graph is None:
+            self.graph = self.graph_builder(self.checkpointer)
+        if self.async_graph is None:
+            self.async_graph = self.graph_builder(self.checkpointer, use_async=True)
+        event_loop()
+        for load, path in ((load_recommendation_index, self.recommendations_path),
+                           (load_pricing_catalog, self.pricing_catalog_path)):
+            try:
+                load(path)
+            except FileNotFoundError as e:
+                logger.warning(f"Not preloaded: {e}")
+        load_retriever(self.vector_store_directory)
+        return self
+
     @staticmethod
     def encode_image(image_path):
         '''Getting the base64 string'''
@@ -102,262 +283,956 @@ class AzureArchitectureWorkflow:
 
     @staticmethod
     def read_csv_file(file_path: str) -> list[dict]:
+        import pandas as pd
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"CSV file not found at {file_path}")
         df = pd.read_csv(file_path)
         return df
 
     @staticmethod
-    def get_service_recommendation_content(df, service_label: str, min_common_words=2):
-        target_words = set(service_label.lower().split())
-        results = None
-        for _, row in df.iterrows():
-            source_words = set(str(row['heading']).lower().split())
-            common = target_words & source_words
-            if len(common) >= min_common_words:
-                results = row["content"]
-                break
-        return results
+    def get_service_recommendation_content(index, service_label: str):
+        '''Best matching WAF section for a service, from a RecommendationIndex or a DataFrame'''
+        if not isinstance(index, RecommendationIndex):
+            index = RecommendationIndex(index.to_dict("records"))
+        return index.lookup(service_label)
 
-    def extract_data_from_image(self, state: GraphState):
-        image = state['uploaded_image']
-        if not image:
+    def pricing_version(self) -> str:
+        '''Region and catalog contents the costs are computed from'''
+        try:
+            fingerprint = load_pricing_catalog(self.pricing_catalog_path).fingerprint
+        except FileNotFoundError:
+            fingerprint = "no-catalog"
+        return f"{self.pricing_region or 'default'}:{fingerprint}"
+
+    def image_settings_version(self) -> str:
+        '''Image preparation and tiling settings, which change what the model is shown'''
+        settings = [self.image_detail, self.image_max_pixels, self.image_max_tokens, self.image_format,
+                    self.image_tiling, self.tile_threshold, self.tile_size, self.tile_overlap, self.review_with_image]
+        return hashlib.sha256(to_compact_json(settings).encode("utf-8")).hexdigest()[:16]
+
+    def result_cache_key(self, encoded_image: str) -> str:
+        return image_cache_key(encoded_image, prompt_version(), self.AZURE_OPENAI_DEPLOYMENT_NAME,
+                               self.pricing_version(), self.image_settings_version())
+
+    def get_cached_result(self, encoded_image: str) -> dict | None:
+        '''Final state of an earlier run on the same image, prompts and deployment'''
+        return self.result_cache.get(self.result_cache_key(encoded_image))
+
+    @staticmethod
+    def is_complete(state: dict) -> bool:
+        summary = state.get("summary") or ""
+        return not state.get("errors") and bool(summary) and not summary.startswith("Error during summarization")
+
+    @staticmethod
+    def incomplete_reason(state: dict) -> str:
+        '''Why a run is not complete: its failed reviews, or else the summary it ended with'''
+        failures = [f"{error['service_name']}: {error['error']}" for error in state.get("errors") or []]
+        return "; ".join(failures) or (state.get("summary") or "No summary generated.").strip()
+
+    def cache_result(self, encoded_image: str, state: dict):
+        # Partial runs are not cached so the next upload gets a chance to complete them.
+        if not self.is_complete(state):
+            logger.warning("Run incomplete, result not cached.")
+            return
+        self.result_cache.set(self.result_cache_key(encoded_image), state)
+
+    def thread_config(self, encoded_image: str, thread_id: str | None = None, previous: dict | None = None) -> dict:
+        # By default a thread is the content address of the run, so retrying the same
+        # diagram (against the same previous revision) picks up its checkpoints.
+        if thread_id is None:
+            thread_id = self.result_cache_key(encoded_image)
+            if previous:
+                thread_id += "-" + hashlib.sha256(to_compact_json(previous).encode("utf-8")).hexdigest()[:16]
+        return {"configurable": {"thread_id": thread_id}}
+
+    @staticmethod
+    def previous_state(values: dict) -> dict:
+        '''Fields of a final state needed to re-analyze a later revision of the diagram'''
+        return {field: values.get(field) for field in CACHED_STATE_FIELDS}
+
+    @staticmethod
+    def replay_from(snapshot) -> str | None:
+        '''Node to replay a finished thread from, or None when it needs no retry'''
+        if snapshot.values.get("errors"):
+            # Finished with failed reviews: replay from after extraction; services that
+            # were already reviewed are served from the progress store.
+            return "service_recommendations_supervisor_node"
+        if (snapshot.values.get("summary") or "").startswith("Error during summarization"):
+            return "summarize_results"
+        return None
+
+    def resume_config(self, config: dict) -> dict | None:
+        '''Checkpoint to resume a thread from, or None when it should start from scratch'''
+        snapshot = self.graph.get_state(config)
+        if not snapshot.values.get("image_ref"):
+            # Nothing to resume, or a thread from before images were stored outside the state.
+            return None
+        if snapshot.next:
+            return config
+        replay_from = self.replay_from(snapshot)
+        if replay_from is None:
+            return None
+        for previous in self.graph.get_state_history(config):
+            if replay_from in previous.next:
+                return previous.config
+        return None
+
+    async def aresume_config(self, config: dict) -> dict | None:
+        snapshot = await self.async_graph.aget_state(config)
+        if not snapshot.values.get("image_ref"):
+            return None
+        if snapshot.next:
+            return config
+        replay_from = self.replay_from(snapshot)
+        if replay_from is None:
+            return None
+        async for previous in self.async_graph.aget_state_history(config):
+            if replay_from in previous.next:
+                return previous.config
+        return None
+
+    def clear_thread(self, thread_id: str):
+        if self.checkpointer is not None:
+            self.checkpointer.delete_thread(thread_id)
+            self.review_progress.clear(thread_id)
+        self.images.clear(thread_id)
+
+    def prune_checkpoints(self) -> list[str]:
+        '''Clear threads not run for checkpoint_max_age_hours, then all but the keep_checkpoints most recently
+        run, failed and abandoned ones included; threads this process is running are kept'''
+        if self.checkpointer is None:
+            return []
+        with _active_threads_lock:
+            active = set(_active_threads)
+        pruned = [thread_id for thread_id in stale_threads(
+            self.images.last_used(), self.checkpointer.thread_ids(),
+            self.checkpoint_max_age_hours * 3600, self.keep_checkpoints) if thread_id not in active]
+        for thread_id in pruned:
+            self.clear_thread(thread_id)
+        if pruned:
+            logger.info(f"Pruned {len(pruned)} old checkpoint threads.")
+        return pruned
+
+    @staticmethod
+    def claim_thread(config: dict) -> tuple[dict, bool]:
+        '''Config to run with, and whether it is the diagram's own thread: a thread that another run in the
+        process is still writing to is never resumed or cleared, so a concurrent run of the same diagram
+        gets a one-off thread of its own'''
+        thread_id = config["configurable"]["thread_id"]
+        with _active_threads_lock:
+            if thread_id not in _active_threads:
+                _active_threads.add(thread_id)
+                return config, True
+            thread_id = f"{thread_id}-{uuid.uuid4().hex[:8]}"
+            _active_threads.add(thread_id)
+        logger.info("Another run of this diagram is in progress, running on a separate thread.")
+        return {"configurable": {"thread_id": thread_id}}, False
+
+    def release_thread(self, config: dict, owned: bool):
+        thread_id = config["configurable"]["thread_id"]
+        if not owned or self.checkpointer is None:
+            # Nothing resumes a one-off thread, or a run without checkpoints.
+            self.clear_thread(thread_id)
+        with _active_threads_lock:
+            _active_threads.discard(thread_id)
+
+    def start_run(self, encoded_image: str, use_cache: bool, refresh_cache: bool, on_message,
+                  previous: dict | None) -> tuple[dict | None, dict | None, bool]:
+        '''Cached final state if there is one, else the previous state and cache setting to run with'''
+        if previous:
+            # The summary describes the delta, so it is not a result for the image alone.
+            previous = self.previous_state(previous)
+            use_cache = False
+        if use_cache and not refresh_cache:
+            values = self.get_cached_result(encoded_image)
+            if values is not None:
+                if on_message:
+                    on_message("⚡ Found cached result for this diagram.")
+                return values, previous, use_cache
+        return None, previous, use_cache
+
+    @staticmethod
+    def stream_modes(on_token, on_review, on_node) -> list[str]:
+        # Tokens, finished reviews and finished nodes are only streamed when someone is listening.
+        return (["values"] + (["messages"] if on_token else []) + (["custom"] if on_review else [])
+                + (["updates"] if on_node else []))
+
+    @staticmethod
+    def stream_message(mode: str, payload, on_message, on_token, on_review, on_node, narrative: NarrativeStream):
+        '''Pass one streamed event to the callback it is for'''
+        if mode == "updates":
+            for node_name in payload:
+                on_node(node_name)
+        elif mode == "values":
+            if on_message and "messages" in payload.keys() and payload["messages"]:
+                on_message(payload["messages"][-1].content[0]["text"])
+        elif mode == "messages":
+            chunk, metadata = payload
+            # Only the summary narrative is shown token by token; it is decoded from JSON as it arrives.
+            if metadata.get("langgraph_node") == "summarize_results" and isinstance(chunk.content, str):
+                text = narrative.feed(chunk.content)
+                if text:
+                    on_token(text)
+        elif mode == "custom" and isinstance(payload, dict) and "service_review" in payload:
+            on_review(payload["service_review"]["service_name"], payload["service_review"]["recommendations"])
+
+    def finish_run(self, encoded_image: str, values: dict, use_cache: bool, config: dict):
+        if use_cache:
+            self.cache_result(encoded_image, values)
+        if self.checkpointer is not None and self.is_complete(values):
+            self.clear_thread(config["configurable"]["thread_id"])
+        self.prune_checkpoints()
+
+    def run(self, encoded_image: str, use_cache: bool = True, refresh_cache: bool = False,
+            on_message=None, thread_id: str | None = None, restart: bool = False,
+            previous: dict | None = None, on_token=None, on_review=None, on_node=None) -> dict:
+        '''Run the graph on an image and return its final state, serving repeats from the result cache
+        and resuming the thread from its last completed node when checkpointing is enabled. With the
+        final state of a previous revision, only added or changed services are re-reviewed and re-priced.
+        on_token receives the summary narrative as markdown while it is generated, and on_review the
+        recommendations of each service as soon as its review finishes, and on_node the name of each
+        graph node as it completes'''
+        values, previous, use_cache = self.start_run(encoded_image, use_cache, refresh_cache, on_message, previous)
+        if values is not None:
+            return values
+        if self.graph is None:
+            self.graph = self.graph_builder(self.checkpointer)
+        config, owned = self.claim_thread(self.thread_config(encoded_image, thread_id, previous))
+        thread = config
+        inputs = {
+            "image_ref": config["configurable"]["thread_id"],
+            "previous": previous,
+        }
+        try:
+            if self.checkpointer is not None and owned:
+                if restart:
+                    self.clear_thread(config["configurable"]["thread_id"])
+                elif resume := self.resume_config(config):
+                    inputs, config = None, resume
+                    if on_message:
+                        on_message("↩️ Resuming from the last completed step.")
+            # Stored again on resume, which also marks the thread as recently run.
+            self.images.save(thread["configurable"]["thread_id"], "uploaded", encoded_image)
+            narrative = NarrativeStream()
+            try:
+                for mode, payload in self.graph.stream(
+                        inputs, config, stream_mode=self.stream_modes(on_token, on_review, on_node)):
+                    if mode == "values":
+                        values = payload
+                    self.stream_message(mode, payload, on_message, on_token, on_review, on_node, narrative)
+            finally:
+                if self.metrics_file:
+                    write_metrics_file(self.metrics_file)
+            self.finish_run(encoded_image, values, use_cache, config)
+        finally:
+            self.release_thread(thread, owned)
+        return values
+
+    async def arun(self, encoded_image: str, use_cache: bool = True, refresh_cache: bool = False,
+                   on_message=None, thread_id: str | None = None, restart: bool = False,
+                   previous: dict | None = None, on_token=None, on_review=None, on_node=None) -> dict:
+        '''Async run(): model calls are awaited and fanned out on the event loop instead of threads'''
+        values, previous, use_cache = self.start_run(encoded_image, use_cache, refresh_cache, on_message, previous)
+        if values is not None:
+            return values
+        if self.async_graph is None:
+            self.async_graph = self.graph_builder(self.checkpointer, use_async=True)
+        config, owned = self.claim_thread(self.thread_config(encoded_image, thread_id, previous))
+        thread = config
+        inputs = {
+            "image_ref": config["configurable"]["thread_id"],
+            "previous": previous,
+        }
+        try:
+            if self.checkpointer is not None and owned:
+                if restart:
+                    self.clear_thread(config["configurable"]["thread_id"])
+                elif resume := await self.aresume_config(config):
+                    inputs, config = None, resume
+                    if on_message:
+                        on_message("↩️ Resuming from the last completed step.")
+            # Stored again on resume, which also marks the thread as recently run.
+            self.images.save(thread["configurable"]["thread_id"], "uploaded", encoded_image)
+            narrative = NarrativeStream()
+            try:
+                async for mode, payload in self.async_graph.astream(
+                        inputs, config, stream_mode=self.stream_modes(on_token, on_review, on_node)):
+                    if mode == "values":
+                        values = payload
+                    self.stream_message(mode, payload, on_message, on_token, on_review, on_node, narrative)
+            finally:
+                if self.metrics_file:
+                    write_metrics_file(self.metrics_file)
+            self.finish_run(encoded_image, values, use_cache, config)
+        finally:
+            self.release_thread(thread, owned)
+        return values
+
+    def measure_call(self, node_name: str, messages: list[BaseMessage]):
+        size = measure_prompt(messages)
+        logger.info(
+            f"{node_name}: prompt ~{size.text_tokens} text tokens, {size.image_parts} image(s), "
+            f"{size.payload_bytes} bytes")
+        return size
+
+    def record_call(self, node_name: str, size, started: float, result, error: str | None):
+        usage = getattr(result, "usage_metadata", None) or {}
+        metadata = getattr(result, "response_metadata", None) or {}
+        record = CallRecord(
+            node=node_name,
+            seconds=time.perf_counter() - started,
+            estimated_prompt_tokens=size.text_tokens,
+            prompt_tokens=usage.get("input_tokens"),
+            completion_tokens=usage.get("output_tokens"),
+            payload_bytes=size.payload_bytes,
+            image_parts=size.image_parts,
+            cache_hit=bool(metadata.get("cache_hit")),
+            error=error,
+        )
+        self.profiler.record_call(record)
+        process_profiler.record_call(record)
+
+    def invoke_llm(self, node_name: str, messages: list[BaseMessage]):
+        '''Single entry point for model calls, logging how large each prompt is'''
+        size = self.measure_call(node_name, messages)
+        started = time.perf_counter()
+        result, error = None, None
+        try:
+            result = self.llm_client.invoke(messages)
+            return result
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            self.record_call(node_name, size, started, result, error)
+
+    async def ainvoke_llm(self, node_name: str, messages: list[BaseMessage]):
+        size = self.measure_call(node_name, messages)
+        started = time.perf_counter()
+        result, error = None, None
+        try:
+            result = await self.llm_client.ainvoke(messages)
+            return result
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            self.record_call(node_name, size, started, result, error)
+
+    def image_content(self, state: GraphState) -> dict:
+        return {
+            "type": "image_url",
+            "image_url": {
+                "url": image_data_url(self.images.load(state['image_ref'], "prepared"), state.get('image_mime_type')),
+                "detail": self.image_detail,
+            },
+        }
+
+    def prepare_uploaded_image(self, state: GraphState):
+        if not state.get('image_ref'):
             raise ValueError("No image provided for data extraction.")
-        messages = [
+        image = self.images.load(state['image_ref'], "uploaded")
+        tiles = tile_image(image, mode=self.image_tiling, threshold=self.tile_threshold,
+                           tile_size=self.tile_size, overlap=self.tile_overlap, image_format=self.image_format)
+        prepared = prepare_image(image, detail=self.image_detail, max_pixels=self.image_max_pixels,
+                                 max_tokens=self.image_max_tokens, image_format=self.image_format)
+        self.images.save(state['image_ref'], "prepared", prepared.data)
+        for index, tile in enumerate(tiles):
+            self.images.save(state['image_ref'], f"tile-{index}", tile.data)
+        return Command(
+            update={
+                "image_mime_type": prepared.mime_type,
+                "image_tiles": [{**tile._asdict(), "data": f"tile-{index}"} for index, tile in enumerate(tiles)] or None,
+                "messages": [
+                    SystemMessage(
+                        content=[
+                            {"type": "text",
+                             "text": f"Prepared image for analysis."},
+                        ]
+                    )]
+            },
+        )
+
+    async def aprepare_uploaded_image(self, state: GraphState):
+        # Decoding and resizing are CPU bound, keep them off the event loop.
+        return await asyncio.to_thread(self.prepare_uploaded_image, state)
+
+    def tile_messages(self, tile: ImageTile, index: int, count: int) -> list[BaseMessage]:
+        instructions = tile_extraction_prompt.format(
+            tile=index + 1, tiles=count, x0=tile.x, x1=tile.x + tile.width, y0=tile.y, y1=tile.y + tile.height)
+        return [
+            HumanMessage(
+                content=[
+                    {"type": "text", "text": data_extraction_prompt + instructions},
+                    {"type": "image_url",
+                     "image_url": {"url": image_data_url(tile.data, tile.mime_type), "detail": self.image_detail}},
+                ]
+            )
+        ]
+
+    def overview_messages(self, state: GraphState) -> list[BaseMessage]:
+        return [
+            HumanMessage(
+                content=[
+                    {"type": "text", "text": diagram_overview_prompt},
+                    self.image_content(state),
+                ]
+            )
+        ]
+
+    def extraction_messages(self, state: GraphState) -> list[BaseMessage]:
+        return [
             HumanMessage(
                 content=[
                     {"type": "text", "text": data_extraction_prompt},
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{image}"
-                        },
-                    },
+                    self.image_content(state),
                 ]
             )
         ]
-        result = self.llm_client.invoke(messages)
-        result_content_json = json.loads(
-            self.clean_json_string(result.content))
+
+    def extract_tile(self, tile: ImageTile, index: int, count: int) -> dict:
+        result = self.invoke_llm("data_extraction", self.tile_messages(tile, index, count))
+        return json.loads(self.clean_json_string(result.content))
+
+    async def aextract_tile(self, tile: ImageTile, index: int, count: int) -> dict:
+        result = await self.ainvoke_llm("data_extraction", self.tile_messages(tile, index, count))
+        return json.loads(self.clean_json_string(result.content))
+
+    def merge_tiles(self, tiles: list[ImageTile], extractions: list[dict], description) -> dict:
+        nodes, edges = merge_tile_graphs(list(zip(tiles, extractions)))
+        logger.info(
+            f"Merged {sum(len(extraction.get('nodes') or []) for extraction in extractions)} nodes from "
+            f"{len(tiles)} tiles into {len(nodes)} nodes and {len(edges)} edges")
+        result = json.loads(self.clean_json_string(description.content))
+        return {"description": result["description"], "nodes": nodes, "edges": edges}
+
+    def load_tiles(self, state: GraphState) -> list[ImageTile]:
+        return [ImageTile(**{**tile, "data": self.images.load(state['image_ref'], tile["data"])})
+                for tile in state['image_tiles']]
+
+    def extract_tiled(self, state: GraphState) -> dict:
+        '''Extract every tile and the overview description concurrently, then merge the tile graphs'''
+        tiles = self.load_tiles(state)
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            description = executor.submit(self.invoke_llm, "data_extraction", self.overview_messages(state))
+            extractions = list(executor.map(
+                lambda item: self.extract_tile(item[1], item[0], len(tiles)), enumerate(tiles)))
+        return self.merge_tiles(tiles, extractions, description.result())
+
+    async def aextract_tiled(self, state: GraphState) -> dict:
+        tiles = self.load_tiles(state)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def bounded(call):
+            async with semaphore:
+                return await call
+
+        description, *extractions = await asyncio.gather(
+            bounded(self.ainvoke_llm("data_extraction", self.overview_messages(state))),
+            *(bounded(self.aextract_tile(tile, index, len(tiles))) for index, tile in enumerate(tiles)))
+        return self.merge_tiles(tiles, extractions, description)
+
+    def extraction_update(self, state: GraphState, result_content_json: dict) -> Command:
         return Command(
             update={
-                "uploaded_image": image,
                 "image_description": result_content_json["description"],
                 "nodes": result_content_json["nodes"],
                 "edges": result_content_json["edges"],
                 "summary": result_content_json["description"],
+                "image_tiles": None,
+                "changes": self.diff_previous(state, result_content_json),
                 "messages": [
                     SystemMessage(
                         content=[
                             {"type": "text",
-                             "text": f"Extracted data from image, transferring to cost analysis node."},
+                             "text": f"Extracted data from image, starting cost analysis and service recommendations."},
                         ]
                     )]
             },
-            goto="cost_analysis",
         )
 
-    def get_cost_analysis_prompt(self, state: GraphState):
-        message = [
+    def extract_data_from_image(self, state: GraphState):
+        if not state.get('image_ref'):
+            raise ValueError("No image provided for data extraction.")
+        if state.get('image_tiles'):
+            result_content_json = self.extract_tiled(state)
+        else:
+            result = self.invoke_llm("data_extraction", self.extraction_messages(state))
+            result_content_json = json.loads(
+                self.clean_json_string(result.content))
+        return self.extraction_update(state, result_content_json)
+
+    async def aextract_data_from_image(self, state: GraphState):
+        if not state.get('image_ref'):
+            raise ValueError("No image provided for data extraction.")
+        if state.get('image_tiles'):
+            result_content_json = await self.aextract_tiled(state)
+        else:
+            result = await self.ainvoke_llm("data_extraction", self.extraction_messages(state))
+            result_content_json = json.loads(
+                self.clean_json_string(result.content))
+        return self.extraction_update(state, result_content_json)
+
+    @staticmethod
+    def diff_previous(state: GraphState, extraction: dict) -> dict | None:
+        previous = state.get('previous')
+        if not previous:
+            return None
+        changes = diff_graphs(previous.get('nodes'), previous.get('edges'),
+                              extraction['nodes'], extraction['edges'])
+        logger.info(
+            f"Changes since the previous revision: {len(changes['added'])} added, {len(changes['changed'])} changed, "
+            f"{len(changes['removed'])} removed, {len(changes['unchanged'])} unchanged nodes")
+        return changes
+
+    @staticmethod
+    def sku_inference_messages(catalog: PricingCatalog, labels: list[str], state: GraphState) -> list[BaseMessage]:
+        return [
             SystemMessage(
                 content=[
                     {"type": "text",
-                     "text": cost_calculation_prompt.format(state=state, json_output_format=json_output_format)},
+                     "text": sku_inference_prompt.format(
+                         services=to_compact_json(labels),
+                         description=state['image_description'],
+                         catalog=to_compact_json(catalog.sku_names()))},
                 ]
             )
         ]
-        result = self.llm_client.invoke(message)
+
+    def infer_skus(self, catalog: PricingCatalog, labels: list[str], state: GraphState) -> dict:
+        result = self.invoke_llm("cost_analysis", self.sku_inference_messages(catalog, labels, state))
+        return json.loads(self.clean_json_string(result.content))
+
+    async def ainfer_skus(self, catalog: PricingCatalog, labels: list[str], state: GraphState) -> dict:
+        result = await self.ainvoke_llm("cost_analysis", self.sku_inference_messages(catalog, labels, state))
+        return json.loads(self.clean_json_string(result.content))
+
+    def map_services(self, state: GraphState) -> tuple[PricingCatalog, list[str], dict, dict, list[str]]:
+        '''Catalog service and SKU of every Azure label, and the labels left for the model to map'''
+        catalog = load_pricing_catalog(self.pricing_catalog_path)
+        labels = [node['label'] for node in state['nodes'] or []
+                  if node['type'] == 'azure']
+        services = {label: catalog.match(label) for label in labels}
+        skus = {}
+        unmapped = [label for label, service in services.items()
+                    if service is None]
+        previous_skus = (state.get('previous') or {}).get('service_skus') or {}
+        if state.get('changes') and previous_skus:
+            # Services the model mapped for the previous revision keep their mapping
+            # unless one of their nodes was added or changed.
+            changed = changed_node_ids(state['changes'])
+            changed_labels = {node['label'] for node in state['nodes'] if node['id'] in changed}
+            for label in [label for label in unmapped if label in previous_skus and label not in changed_labels]:
+                choice = previous_skus[label]
+                if choice and choice.get("service") in catalog.services:
+                    services[label] = choice["service"]
+                    skus[label] = choice.get("sku")
+                unmapped.remove(label)
+        if not self.pricing_llm_fallback:
+            unmapped = []
+        return catalog, labels, services, skus, unmapped
+
+    def cost_update(self, catalog: PricingCatalog, labels: list[str], services: dict, skus: dict,
+                    inferred: dict) -> Command:
+        for label, choice in inferred.items():
+            if label in services and services[label] is None and isinstance(choice, dict) \
+                    and choice.get("service") in catalog.services:
+                services[label] = choice["service"]
+                skus[label] = choice.get("sku")
+        costs = catalog.estimate([(services[label], skus.get(label)) for label in labels if services[label]],
+                                 region=self.pricing_region)
+        costs.extend(unpriced_item(label, catalog.currency)
+                     for label in services if services[label] is None)
         return Command(
             update={
-                "azure_services_cost": json.loads(self.clean_json_string(result.content)),
+                "azure_services_cost": costs,
+                "service_skus": {label: {"service": services[label], "sku": skus.get(label)}
+                                 if services[label] else None for label in services},
                 "messages": [
                     SystemMessage(
                         content=[
                             {"type": "text",
-                             "text": f"Cost analysis completed, generating service recommendations."},
+                             "text": f"Cost analysis completed."},
                         ]
                     )]
             },
-            goto="service_recommendations_supervisor_node",
         )
 
-    def service_recommendations_supervisor_node(self, state: GraphState) -> Command:
-        nodes = state['nodes']
-        generated_service_recommendations = []
-        csv_path = "data/azure-service-recommendations.csv"
-        if not os.path.exists(csv_path):
-            raise FileNotFoundError(
-                f"CSV file not found at {csv_path}, Run the datapipeline.py to generate the CSV file.")
-        service_recommendations_data = self.read_csv_file(csv_path)
-        service_recommendations_output_format = """
-        [
-            {
-                "service_name": "Service Name",
-                "review": "Review of the service",
-                "recommedation": "Recommendation for the service",
-                "pillar_in_review": "Pillar in review (Cost, Operational Excellence, Performance Efficiency, Reliability, Security)"
-            },
-            ...
-        ]
-        """
-        for node in nodes:
-            if node['type'] == 'azure':
-                service_recommendation = self.get_service_recommendation_content(service_recommendations_data,
-                                                                                 node['label'])
-                if not service_recommendation:
-                    logger.warning(
-                        f"No recommendations found for service: {node['label']}")
-                    continue
-                new_message = [
-                    SystemMessage(
-                        content=[
-                            {
-                                "type": "text",
-                                "text": f"""You are an Azure Architect, given the architecture diagram and it summary, your task is to review the Azure service: {node['label']} \
-                             and provide recommendations based on service recommendations shared by Microsoft as context. The recommendations should be in all 5 pillars of the Azure Well-Architected Framework (WAF): Cost, Operational \
-                             Excellence, Performance Efficiency, Reliability, and Security. The recommendations should help improve the Well Architected Score of the architecture. \
-                             ### Context: {service_recommendation},
-                             ### Architecture Summary: {state['image_description']}
-                             ### Output Format: {service_recommendations_output_format}
-                            """,
-                            }]
-                    ),
-                    HumanMessage(
-                        content=[
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{state['uploaded_image']}"
-                                },
-                            },
-                        ])
-                ]
-                result = self.llm_client.invoke(new_message)
-                result_content_json = json.loads(
-                    self.clean_json_string(result.content))
-                generated_service_recommendations.extend(result_content_json)
-            else:
+    def get_cost_analysis_prompt(self, state: GraphState):
+        catalog, labels, services, skus, unmapped = self.map_services(state)
+        inferred = {}
+        if unmapped:
+            # The model is only asked to place services the catalog cannot map by name.
+            try:
+                inferred = self.infer_skus(catalog, unmapped, state)
+            except Exception as e:
+                logger.warning(f"Could not infer SKUs for {unmapped}: {e}")
+        return self.cost_update(catalog, labels, services, skus, inferred)
+
+    async def aget_cost_analysis_prompt(self, state: GraphState):
+        catalog, labels, services, skus, unmapped = await asyncio.to_thread(self.map_services, state)
+        inferred = {}
+        if unmapped:
+            try:
+                inferred = await self.ainfer_skus(catalog, unmapped, state)
+            except Exception as e:
+                logger.warning(f"Could not infer SKUs for {unmapped}: {e}")
+        return self.cost_update(catalog, labels, services, skus, inferred)
+
+    def get_service_context(self, section: dict, label: str, state: GraphState) -> str:
+        retriever = load_retriever(self.vector_store_directory)
+        chunks = []
+        if retriever is not None:
+            query = f"{label}\n{state['image_description']}"
+            chunks = retriever.retrieve(section["heading"], query,
+                                        k=self.retrieval_top_k, token_budget=self.context_token_budget)
+        if not chunks:
+            # No vector store yet, fall back to the leading chunks of the section.
+            chunks = fit_to_budget(chunk_section(
+                section["content"]), self.context_token_budget)
+        return "\n...\n".join(chunks)
+
+    def group_services(self, nodes: list[Nodes], index: RecommendationIndex) -> list[ServiceGroup]:
+        '''Azure nodes grouped by the WAF section they map to, in first-seen order'''
+        groups: dict[str, ServiceGroup] = {}
+        for node in nodes or []:
+            if node['type'] != 'azure':
                 logger.warning(
                     f"Node {node['label']} is not an Azure service, skipping service recommendations generation.")
+                continue
+            section = index.best_match(node['label'])
+            if not section:
+                logger.warning(
+                    f"No recommendations found for service: {node['label']}")
+                continue
+            group = groups.setdefault(section["heading"], {
+                "service_name": service_name_from_heading(section["heading"]),
+                "section": section,
+                "nodes": [],
+                "context": "",
+            })
+            group["nodes"].append(node)
+        return list(groups.values())
+
+    def review_messages(self, groups: list[ServiceGroup], state: GraphState) -> list[BaseMessage]:
+        edges = project_edges(state['edges'])
+        services = []
+        for group in groups:
+            node_ids = {node['id'] for node in group['nodes']}
+            labels = ", ".join(dict.fromkeys(node['label'] for node in group['nodes']))
+            connections = [edge for edge in edges
+                           if node_ids & {edge['source'], edge['target']}]
+            services.append(service_review_context.format(
+                service_name=group['service_name'], labels=labels, context=group['context'],
+                connections=to_compact_json(connections)))
+        names = to_compact_json([group['service_name'] for group in groups])
+        new_message = [
+            SystemMessage(
+                content=[
+                    {
+                        "type": "text",
+                        "text": service_review_prompt.format(
+                            names=names, description=state['image_description'], services="".join(services),
+                            output_format=service_recommendations_output_format),
+                    }]
+            ),
+        ]
+        if self.review_with_image:
+            new_message.append(HumanMessage(
+                content=[self.image_content(state)]))
+        return new_message
+
+    def review_services(self, groups: list[ServiceGroup], state: GraphState) -> dict[str, list[ServiceRecommendations]]:
+        '''Review one or more services in a single call and map the results back to their nodes'''
+        result = self.invoke_llm(
+            "service_recommendations_supervisor_node", self.review_messages(groups, state))
+        return self.parse_reviews(groups, result)
+
+    async def areview_services(self, groups: list[ServiceGroup], state: GraphState) -> dict[str, list[ServiceRecommendations]]:
+        result = await self.ainvoke_llm(
+            "service_recommendations_supervisor_node", self.review_messages(groups, state))
+        return self.parse_reviews(groups, result)
+
+    @staticmethod
+    def match_review_group(service_name: str, groups: list[ServiceGroup]) -> ServiceGroup | None:
+        '''Group a review belongs to: by service name, then by diagram label, then by a unique token overlap,
+        since models often shorten names like "Azure App Service (Web Apps)"'''
+        name = str(service_name or "").strip().lower()
+        for group in groups:
+            if group['service_name'].lower() == name:
+                return group
+        for group in groups:
+            if any(node['label'].lower() == name for node in group['nodes']):
+                return group
+        tokens = set(tokenize(name))
+        if not tokens:
+            return None
+        candidates = []
+        for group in groups:
+            group_tokens = set(tokenize(group['service_name']))
+            for node in group['nodes']:
+                group_tokens.update(tokenize(node['label']))
+            if tokens <= group_tokens:
+                candidates.append(group)
+        return candidates[0] if len(candidates) == 1 else None
+
+    def parse_reviews(self, groups: list[ServiceGroup], result) -> dict[str, list[ServiceRecommendations]]:
+        '''Map the recommendations of a (batched) review call back to the nodes of each service'''
+        recommendations = json.loads(self.clean_json_string(result.content))
+        reviews = {group['service_name']: [] for group in groups}
+        for recommendation in recommendations:
+            group = self.match_review_group(recommendation.get("service_name"), groups)
+            if group is None and len(groups) == 1:
+                group = groups[0]
+            if group is None:
+                logger.warning(
+                    f"Dropping recommendation for unknown service {recommendation.get('service_name')} in batched review.")
+                continue
+            # Reviews are stored under the service name they were requested for.
+            recommendation["service_name"] = group['service_name']
+            recommendation["nodes"] = [node['id'] for node in group['nodes']]
+            reviews[group['service_name']].append(recommendation)
+        return reviews
+
+    @staticmethod
+    def carry_over_reviews(groups: list[ServiceGroup], state: GraphState) -> dict[str, list[ServiceRecommendations]]:
+        '''Previous reviews of services whose nodes are all unchanged, mapped to the current node ids'''
+        changed = changed_node_ids(state['changes'])
+        previous = {}
+        for recommendation in state['previous'].get('service_recommendations') or []:
+            if isinstance(recommendation, dict):
+                previous.setdefault(recommendation.get('service_name'), []).append(recommendation)
+        reviews = {}
+        for group in groups:
+            node_ids = [node['id'] for node in group['nodes']]
+            if group['service_name'] in previous and not changed.intersection(node_ids):
+                reviews[group['service_name']] = [{**recommendation, "nodes": node_ids}
+                                                  for recommendation in previous[group['service_name']]]
+        if reviews:
+            logger.info(
+                f"Carrying over reviews of {len(reviews)} unchanged services from the previous revision.")
+        return reviews
+
+    def pending_reviews(self, state: GraphState, config: RunnableConfig) -> tuple[list[ServiceGroup], dict, str | None]:
+        '''Service groups of the diagram, and the reviews already available from earlier attempts or revisions'''
+        service_recommendations_data = load_recommendation_index(
+            self.recommendations_path)
+        # Nodes of the same service (e.g. three Storage Accounts) share one review.
+        groups = self.group_services(
+            state['nodes'], service_recommendations_data)
+        thread_id = config.get("configurable", {}).get("thread_id")
+        reviews = {}
+        if self.review_progress is not None and thread_id:
+            reviews = self.review_progress.completed(thread_id)
+            if reviews:
+                logger.info(
+                    f"Reusing {len(reviews)} service reviews from an earlier attempt.")
+        if state.get('changes'):
+            carried = self.carry_over_reviews(groups, state)
+            reviews = {**carried, **reviews}
+        return groups, reviews, thread_id
+
+    def review_batches(self, pending: list[ServiceGroup]) -> list[list[ServiceGroup]]:
+        # Small services are packed into shared calls up to the batch token budget.
+        return pack_batches(pending, [estimate_tokens(group['context']) for group in pending],
+                            self.review_batch_tokens, self.review_batch_max_services)
+
+    def collect_reviews(self, batch: list[ServiceGroup], batch_reviews, reviews: dict, errors: list,
+                        thread_id: str | None):
+        '''Record the outcome of one review batch: its reviews, also streamed to listeners, or an error per service'''
+        if isinstance(batch_reviews, Exception):
+            for group in batch:
+                logger.error(
+                    f"Error generating recommendations for service {group['service_name']}: {batch_reviews}")
+                errors.append(
+                    {"service_name": group['service_name'], "error": str(batch_reviews)})
+            return
+        for service_name in [service_name for service_name, recommendations in batch_reviews.items()
+                             if not recommendations]:
+            # Not saved as done, so the next attempt reviews the service again.
+            logger.error(f"No recommendations returned for service {service_name}")
+            errors.append({"service_name": service_name, "error": "No recommendations returned for this service."})
+            del batch_reviews[service_name]
+        reviews.update(batch_reviews)
+        writer = get_stream_writer()
+        for service_name, recommendations in batch_reviews.items():
+            writer({"service_review": {"service_name": service_name, "recommendations": recommendations}})
+        if self.review_progress is not None and thread_id:
+            for service_name, recommendations in batch_reviews.items():
+                self.review_progress.save(
+                    thread_id, service_name, recommendations)
+
+    @staticmethod
+    def recommendations_update(groups: list[ServiceGroup], reviews: dict, errors: list) -> Command:
+        generated_service_recommendations = [
+            recommendation for group in groups for recommendation in reviews.get(group['service_name'], [])]
         return Command(
             update={
                 "service_recommendations": generated_service_recommendations,
+                "errors": errors,
                 "messages": [
                     SystemMessage(
                         content=[
                             {"type": "text",
-                             "text": f"Service recommendations generated, transferring to summarization node."},
+                             "text": f"Service recommendations generated."},
                         ]
                     )]
             },
-            goto="summarize_results"
         )
 
-    def summarize_results(self, state: GraphState):
-        messages = [
+    def service_recommendations_supervisor_node(self, state: GraphState, config: RunnableConfig) -> Command:
+        errors = []
+        groups, reviews, thread_id = self.pending_reviews(state, config)
+        pending = [group for group in groups if group['service_name'] not in reviews]
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            contexts = executor.map(lambda group: self.get_service_context(
+                group['section'], group['service_name'], state), pending)
+            for group, context in zip(pending, contexts):
+                group['context'] = context
+            batches = self.review_batches(pending)
+            # Reviews are independent of each other, so fan them out and collect them as they
+            # finish; the final list is put back in node order.
+            futures = {executor.submit(self.review_services, batch, state): batch
+                       for batch in batches}
+            for future in as_completed(futures):
+                batch = futures[future]
+                try:
+                    batch_reviews = future.result()
+                except Exception as e:
+                    batch_reviews = e
+                self.collect_reviews(batch, batch_reviews, reviews, errors, thread_id)
+        return self.recommendations_update(groups, reviews, errors)
+
+    async def aservice_recommendations_supervisor_node(self, state: GraphState, config: RunnableConfig) -> Command:
+        errors = []
+        groups, reviews, thread_id = await asyncio.to_thread(self.pending_reviews, state, config)
+        pending = [group for group in groups if group['service_name'] not in reviews]
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def context(group):
+            # Retrieval is a blocking vector store query.
+            async with semaphore:
+                group['context'] = await asyncio.to_thread(
+                    self.get_service_context, group['section'], group['service_name'], state)
+
+        async def review(batch):
+            async with semaphore:
+                try:
+                    batch_reviews = await self.areview_services(batch, state)
+                except Exception as e:
+                    batch_reviews = e
+            # Saved as soon as each batch finishes, so a crash keeps the reviews done so far.
+            self.collect_reviews(batch, batch_reviews, reviews, errors, thread_id)
+
+        await asyncio.gather(*(context(group) for group in pending))
+        await asyncio.gather(*(review(batch) for batch in self.review_batches(pending)))
+        return self.recommendations_update(groups, reviews, errors)
+
+    @staticmethod
+    def summary_messages(state: GraphState) -> list[BaseMessage]:
+        data = project_state(state, ("nodes", "edges", "azure_services_cost",
+                                     "service_recommendations"))
+        total, currency = total_cost(state.get('azure_services_cost'))
+        # Tables and lists are rendered locally by render.py, the model only writes the narrative.
+        return [
             SystemMessage(
                 content=[
                     {
                         "type": "text",
-                        "text": f"""
-
-                        Summarize the results of the data extraction and cost analysis.  \
-                        Present the results in a clear and detailed manner as an Architect. \
-                        Use the following data to summarize: \
-
-                        ## State Description and Data:
-                        - **Image Description**: Description of the architecture diagram. **Data** - {state['image_description']}
-                        - **Nodes**: Azure services and their details. **Data** - {state['nodes']}
-                        - **Edges**: Connections between the services. **Data** - {state['edges']}
-                        - **Azure Services Cost**: Cost of each Azure service used in the architecture. **Data** - {state['azure_services_cost']}
-                        - **Service Recommendations**: Recommendations for each service based on the Azure Well-Architected Framework. Each recommendation should include:
-                            - **Service Name**: Name of the Azure service.
-                            - **Review**: Review of the service.
-                            - **Recommendation**: Recommendation for the service.
-                            - **Pillar in Review**: Pillar in review (Cost, Operational Excellence, Performance Efficiency, Reliability, Security).
-                            - **Data** - {state['service_recommendations']}
-                        - **Summary**: Summary of the architecture diagram including the image description, architecture description, services used, cost analysis, and service recommendations.
-                           
-
-                        ## Instructions:
-                        - Provide a comprehensive summary of the architecture diagram, including the image description, architecture description, services used, cost analysis, and service recommendations.
-                        - Remember the data could be empty in few areas in the state, so handle it gracefully.
-                        - Only use the data provided in the state to summarize. Do not make assumptions or add any additional information from your knowledge.
-
-                        ## Formatting instructions:
-                        - Use markdown format for the summary.
-                        - Use headings to separate different sections of the summary.
-                        - Use bullet points for lists.
-                        - Convert Service Recommendations to a structured table format.
-                        - Convert Azure Services Cost to a structured table format.
-                        - Convert Nodes as list of dictionaries.
-
-                        ## Format of the summary should be in **markdown** format as follows:
-
-                        ## **Architecture Summary**
-                        - **Summary**:  As an Azure Architect, summarize the architecture diagram based on the data provided in the state. List its objectives, purpose, limitations and key risks. \
-                        - **Services Used**: <<List of services used in the architecture diagram and its purpose, should be in table format>>
-                        ### **Cost Analysis**
-                        - **Summary of Azure Services Cost**: Create a summary of Azure services cost, total cost per month, and cost breakdown by service. \
-                        - **Total Cost**: <<Total cost of the architecture diagram>>
-                        - **Azure Compute Services Cost**: <<Data should be in text format>>
-                        - **Azure Storage Services Cost**: <<Data should be in text format>>
-                        - **Azure Networking Services Cost**: <<Data should be in text format>>
-                        
-                        ## **Azure Services Cost**:  
-                        <<Data should be in table format>>
-                        
-                        ### **Service Recommendations**
-                        - **Recommendations**: <<Data should be in table format>>
-                        ### **Nodes**
-                        - **Nodes**: <<Data should be in list of dictionaries format>>
-                        ### **Edges**
-                        - **Edges**: <<Data should be in list of dictionaries format>>
-                        """,
+                        "text": summary_prompt.format(
+                            description=state['image_description'],
+                            nodes=to_compact_json(data['nodes']),
+                            edges=to_compact_json(data['edges']),
+                            costs=to_compact_json(data['azure_services_cost']),
+                            total_cost=f"{total:,.2f} {currency}",
+                            recommendations=to_compact_json(data['service_recommendations']),
+                            changes=to_compact_json(summarize_changes(state))),
                     }
                 ]
             )
         ]
+
+    def summary_update(self, state: GraphState, result) -> Command:
         try:
-            result = self.llm_client.invoke(messages)
-            return Command(
-                update={
-                    "summary": result.content,
-                    "messages": [
-                        SystemMessage(
-                            content=[
-                                {"type": "text",
-                                 "text": f"Summarization completed, transferring to {END}."},
-                            ]
-                        )]
-                },
-                goto=END
-            )
+            narrative = json.loads(self.clean_json_string(result.content))
+        except json.JSONDecodeError:
+            logger.warning(
+                "Summary narrative is not valid JSON, using it as the architecture summary.")
+            narrative = {"summary": result.content}
+        return Command(
+            update={
+                "summary": render_summary(state, narrative),
+                "messages": [
+                    SystemMessage(
+                        content=[
+                            {"type": "text",
+                             "text": f"Summarization completed."},
+                        ]
+                    )]
+            },
+        )
+
+    @staticmethod
+    def summary_error(e: Exception) -> Command:
+        logging.error(f"Error during summarization: {e}")
+        return Command(
+            update={
+                "summary": "Error during summarization: " + str(e),
+                "messages": [
+                    SystemMessage(
+                        content=[
+                            {"type": "text",
+                             "text": f"Error during summarization: {e}."},
+                        ]
+                    )]
+            },
+        )
+
+    def summarize_results(self, state: GraphState):
+        try:
+            result = self.invoke_llm("summarize_results", self.summary_messages(state))
+            return self.summary_update(state, result)
         except Exception as e:
-            logging.error(f"Error during summarization: {e}")
-            return Command(
-                update={
-                    "summary": "Error during summarization: " + str(e),
-                    "messages": [
-                        SystemMessage(
-                            content=[
-                                {"type": "text",
-                                 "text": f"Error during summarization: {e}, go to {END}."},
-                            ]
-                        )]
-                },
-                goto=END
-            )
+            return self.summary_error(e)
 
-    def graph_builder(self):
+    async def asummarize_results(self, state: GraphState):
+        try:
+            result = await self.ainvoke_llm("summarize_results", self.summary_messages(state))
+            return self.summary_update(state, result)
+        except Exception as e:
+            return self.summary_error(e)
+
+    def graph_builder(self, checkpointer=None, use_async: bool = False):
         graph_builder = StateGraph(GraphState)
-        graph_builder.add_node("data_extraction", self.extract_data_from_image)
-        graph_builder.add_node("cost_analysis", self.get_cost_analysis_prompt)
-        graph_builder.add_node("service_recommendations_supervisor_node",
-                               self.service_recommendations_supervisor_node)
-        graph_builder.add_node("summarize_results", self.summarize_results)
-        graph_builder.add_edge(START, "data_extraction")
-        graph = graph_builder.compile()
+        if use_async:
+            nodes = {
+                "image_preparation": self.aprepare_uploaded_image,
+                "data_extraction": self.aextract_data_from_image,
+                "cost_analysis": self.aget_cost_analysis_prompt,
+                "service_recommendations_supervisor_node": self.aservice_recommendations_supervisor_node,
+                "summarize_results": self.asummarize_results,
+            }
+        else:
+            nodes = {
+                "image_preparation": self.prepare_uploaded_image,
+                "data_extraction": self.extract_data_from_image,
+                "cost_analysis": self.get_cost_analysis_prompt,
+                "service_recommendations_supervisor_node": self.service_recommendations_supervisor_node,
+                "summarize_results": self.summarize_results,
+            }
+        for name, node in nodes.items():
+            graph_builder.add_node(name, profile_node(name, node, [self.profiler, process_profiler]))
+        graph_builder.add_edge(START, "image_preparation")
+        graph_builder.add_edge("image_preparation", "data_extraction")
+        # Cost analysis and service reviews only depend on the extracted nodes, so
+        # both branches start together and join before summarization.
+        graph_builder.add_edge("data_extraction", "cost_analysis")
+        graph_builder.add_edge("data_extraction",
+                               "service_recommendations_supervisor_node")
+        graph_builder.add_edge(
+            ["cost_analysis", "service_recommendations_supervisor_node"], "summarize_results")
+        graph_builder.add_edge("summarize_results", END)
+        graph = graph_builder.compile(checkpointer=checkpointer)
         return graph
 
 
@@ -369,25 +1244,127 @@ class AzureArchitectureWorkflow:
     help="Path to the input image file."
 )
 @click.option('--output', '-o', default=None, help="Output file for the summary. Defaults to 'summary<timestamp>.md'.")
-def analyze(image_path, output):
+@click.option('--max_concurrency', '-c', default=None, type=int,
+              help="Maximum concurrent per-service review calls. Defaults to AZGENTICA_MAX_CONCURRENCY or 8.")
+@click.option('--no-cache', is_flag=True, help="Do not read or write the result cache.")
+@click.option('--refresh-cache', is_flag=True, help="Ignore any cached result and overwrite it with a fresh run.")
+@click.option('--batch', '-b', default=None,
+              help="Directory or glob of diagrams to analyze in batch mode instead of --image_path.")
+@click.option('--jobs', '-j', default=4, show_default=True, type=int,
+              help="Number of diagrams analyzed concurrently in batch mode.")
+@click.option('--output_dir', default="summaries", show_default=True,
+              help="Directory for per-diagram summaries in batch mode.")
+@click.option('--manifest', '-m', default=None,
+              help="JSONL manifest of batch results, used to resume. Defaults to OUTPUT_DIR/manifest.jsonl.")
+@click.option('--thread_id', '-t', default=None,
+              help="Checkpoint thread to run or resume. Defaults to one derived from the image and prompts.")
+@click.option('--restart', is_flag=True, help="Discard checkpoints of the thread and start from the first node.")
+@click.option('--keep_checkpoints', default=None, type=int,
+              help="Checkpoint threads kept after each run, most recently run first; 0 keeps all. Defaults to AZGENTICA_KEEP_CHECKPOINTS or 100.")
+@click.option('--previous', '-p', 'previous_path', default=None,
+              help="State JSON of an earlier revision of the diagram; only added or changed services are re-analyzed.")
+@click.option('--state_output', default=None,
+              help="Write the final state as JSON, to pass as --previous when analyzing the next revision.")
+@click.option('--stream/--no-stream', default=True, show_default=True,
+              help="Show each service review as it finishes and the summary narrative as it is generated.")
+@click.option('--async', 'use_async', is_flag=True,
+              help="Run the graph with async nodes on one event loop instead of worker threads.")
+@click.option('--profile', 'profile_format', default=None, type=click.Choice(["json", "markdown"]),
+              help="Report per-node and per-call latency, tokens, payload bytes and cache hits.")
+@click.option('--profile_output', default=None,
+              help="File for the --profile report. Defaults to printing it.")
+@click.option('--metrics_file', default=None,
+              help="Write Prometheus text metrics to this file after each run. Defaults to AZGENTICA_METRICS_FILE.")
+def analyze(image_path, output, max_concurrency, no_cache, refresh_cache, batch, jobs, output_dir, manifest,
+            thread_id, restart, keep_checkpoints, previous_path, state_output, stream, use_async, profile_format,
+            profile_output, metrics_file):
     """
     Analyze an Azure architecture diagram IMAGE_PATH and generate a markdown summary.
     """
     click.secho("🚀 Starting Azure Architecture Workflow...",
                 fg="cyan", bold=True)
-    workflow = AzureArchitectureWorkflow()
+    workflow = AzureArchitectureWorkflow(max_concurrency=max_concurrency,
+                                         priority="batch" if batch else "interactive")
+    if metrics_file:
+        workflow.metrics_file = metrics_file
+    if keep_checkpoints is not None:
+        workflow.keep_checkpoints = keep_checkpoints
+    try:
+        _analyze(workflow, image_path, output, no_cache, refresh_cache, batch, jobs, output_dir, manifest,
+                 thread_id, restart, previous_path, state_output, stream, use_async)
+    finally:
+        if profile_format:
+            report = workflow.profiler.to_json() if profile_format == "json" else workflow.profiler.to_markdown()
+            if profile_output:
+                with open(profile_output, "w") as f:
+                    f.write(report)
+                click.secho(f"📊 Profile written to {profile_output}", fg="yellow")
+            else:
+                click.echo(report)
+
+
+def _analyze(workflow, image_path, output, no_cache, refresh_cache, batch, jobs, output_dir, manifest,
+             thread_id, restart, previous_path, state_output, stream, use_async):
+    if batch:
+        from batch import arun_batch, discover_images, run_batch
+        images = discover_images(batch)
+        if not images:
+            click.secho(f"❌ No images found for {batch}.", fg="red", bold=True)
+            return
+        manifest = manifest or os.path.join(output_dir, "manifest.jsonl")
+        if use_async:
+            counts = run_coroutine(arun_batch(workflow, images, manifest, output_dir, jobs,
+                                              use_cache=not no_cache, refresh_cache=refresh_cache))
+        else:
+            counts = run_batch(workflow, images, manifest, output_dir, jobs,
+                               use_cache=not no_cache, refresh_cache=refresh_cache)
+        click.secho(
+            f"\n✅ Batch finished: {counts['completed']} completed, {counts['skipped']} skipped, "
+            f"{counts['failed']} failed. Manifest: {manifest}", fg="yellow", bold=True)
+        return
     encoded_image = workflow.encode_image(image_path)
-    graph = workflow.graph_builder()
-    summary = None
-    for message in graph.stream(
-            {
-                "uploaded_image": encoded_image,
-            }, stream_mode=["values"]):
-        values = message[1]
-        if "messages" in values.keys() and values["messages"]:
-            click.secho(values["messages"][-1].content[0]["text"], fg="green")
-    message = message[1]
-    if "summary" in message.keys() and values["summary"]:
+    previous = None
+    if previous_path:
+        with open(previous_path) as f:
+            previous = json.load(f)
+    # Streamed summary text is written without newlines, so the next message has to end its line.
+    line_open = [False]
+
+    def on_message(text):
+        if line_open[0]:
+            click.echo()
+            line_open[0] = False
+        click.secho(text, fg="green")
+
+    options = dict(use_cache=not no_cache, refresh_cache=refresh_cache, on_message=on_message,
+                   thread_id=thread_id, restart=restart, previous=previous)
+    if stream:
+        writing = []
+
+        def on_token(text):
+            if not writing:
+                writing.append(True)
+                click.secho("\n✍️ Writing summary...\n", fg="cyan")
+            click.echo(text, nl=False)
+            line_open[0] = not text.endswith("\n")
+
+        def on_review(service_name, recommendations):
+            click.secho(f"📝 Reviewed {service_name}", fg="green")
+            click.echo(render_service_review(service_name, recommendations))
+
+        options.update(on_token=on_token, on_review=on_review)
+    try:
+        if use_async:
+            values = run_coroutine(workflow.arun(encoded_image, **options))
+        else:
+            values = workflow.run(encoded_image, **options)
+    except Exception as e:
+        click.secho(f"❌ Workflow failed: {e}", fg="red", bold=True)
+        if workflow.checkpointer is not None:
+            click.secho("Run the same command again to resume from the last completed step.",
+                        fg="yellow")
+        raise SystemExit(1)
+    if "summary" in values.keys() and values["summary"]:
         summary = values["summary"]
         summary = summary.strip('```markdown').strip('```')
         click.secho("\n🎉 Workflow completed. Here's your summary:\n",
@@ -399,6 +1376,10 @@ def analyze(image_path, output):
             f.write(summary)
         click.secho(
             f"\n✅ Summary written to {filename}", fg="yellow", bold=True)
+        if state_output:
+            with open(state_output, "w") as f:
+                json.dump(workflow.previous_state(values), f, indent=2)
+            click.secho(f"✅ State written to {state_output}", fg="yellow")
     else:
         click.secho("❌ No summary generated.", fg="red", bold=True)
 